@@ -0,0 +1,97 @@
+"""去重基准：旧版 set + 列表 vs webapp.dedupe（numpy / 外部排序），耗时与峰值内存
+
+用法：python bench/bench_dedupe.py [--n 10000000] [--dup-rate 0.1] [--rules lower,gmail_dots,plus_tags] [--json]
+
+每种方法在独立子进程中运行，峰值 RSS 互不影响（Linux 上 ru_maxrss 单位为 KB）。
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+METHODS = ("legacy", "numpy", "external_sort")
+
+
+def gen_emails(n: int, dup_rate: float):
+    rnd = random.Random(1)
+    unique = max(1, int(n * (1 - dup_rate)))
+    for _ in range(n):
+        i = rnd.randrange(unique)
+        if i % 7:
+            yield f"user{i}@example{i % 500}.com"
+        elif rnd.random() < 0.5:
+            yield f"user{i}@gmail.com"
+        else:
+            # Gmail 的大小写 / 点号 / +标签 变体，只有开启对应规则时才会被识别为重复
+            yield f"User.{i}+news@GMail.com"
+
+
+def run_single(args):
+    from webapp.dedupe import dedupe_list
+
+    emails = list(gen_emails(args.n, args.dup_rate))
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    if args.method == "legacy":
+        seen = set()
+        out = []
+        for e in emails:
+            k = e.strip().lower()
+            if k not in seen:
+                seen.add(k)
+                out.append(e)
+        stats = {"input": len(emails), "unique": len(out), "duplicates": len(emails) - len(out)}
+    else:
+        out, st = dedupe_list(emails, tuple(args.rules.split(",")), use_numpy=args.method == "numpy")
+        stats = st.to_dict()
+        if stats["method"] != args.method:
+            stats["skipped"] = f"{args.method} 不可用"
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({
+        "method": args.method,
+        "n": len(emails),
+        **stats,
+        "elapsed_s": round(elapsed, 2),
+        "extra_peak_rss_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024, 1),
+    }, ensure_ascii=False))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=10_000_000)
+    ap.add_argument("--dup-rate", type=float, default=0.1)
+    ap.add_argument("--rules", default="lower")
+    ap.add_argument("--methods", default=",".join(METHODS))
+    ap.add_argument("--json", action="store_true", help="输出 JSON")
+    ap.add_argument("--method", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.method:
+        run_single(args)
+        return
+
+    results = []
+    for method in [m.strip() for m in args.methods.split(",") if m.strip()]:
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--method", method, "--n", str(args.n),
+            "--dup-rate", str(args.dup_rate), "--rules", args.rules,
+        ]
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+        return
+    for r in results:
+        note = f"  ({r['skipped']})" if r.get("skipped") else ""
+        print(f"{r['method']:<14} {r['elapsed_s']:>7.2f} s  +{r['extra_peak_rss_mb']:>7.1f} MB  唯一 {r['unique']}  重复 {r['duplicates']}{note}")
+
+
+if __name__ == "__main__":
+    main()
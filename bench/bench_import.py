@@ -0,0 +1,78 @@
+"""启动开销基准：各入口模块的导入耗时与导入后的常驻内存
+
+用法：python bench/bench_import.py [--repeat 5] [--json]
+
+每个模块在全新的子进程中导入（取 repeat 次的中位数），同时报告导入后是否带入了 pandas / tqdm / openpyxl。
+Web 发送路径（webapp.app、webapp.postal）不应出现这些重依赖；只有 Excel 模式才导入 send_email_postal_excel。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ("webapp.postal", "webapp.engine", "webapp.app", "send_email_postal_excel")
+HEAVY = ("pandas", "tqdm", "openpyxl", "numpy")
+
+PROBE = r"""
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t0 = time.perf_counter()
+ok, error = True, ""
+try:
+    __import__({module!r})
+except Exception as e:
+    ok, error = False, f"{{type(e).__name__}}: {{e}}"
+elapsed = time.perf_counter() - t0
+print(json.dumps({{
+    "ok": ok,
+    "error": error,
+    "import_ms": elapsed * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "rss_delta_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def probe(module: str) -> dict:
+    code = PROBE.format(root=ROOT, module=module, heavy=HEAVY)
+    out = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, cwd=ROOT, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--modules", default=",".join(MODULES))
+    ap.add_argument("--json", action="store_true", help="输出 JSON")
+    args = ap.parse_args()
+
+    results = []
+    for module in [m.strip() for m in args.modules.split(",") if m.strip()]:
+        runs = [probe(module) for _ in range(max(1, args.repeat))]
+        last = runs[-1]
+        results.append({
+            "module": module,
+            "ok": last["ok"],
+            "error": last["error"],
+            "import_ms": round(statistics.median(r["import_ms"] for r in runs), 1),
+            "rss_mb": round(statistics.median(r["rss_mb"] for r in runs), 1),
+            "rss_delta_mb": round(statistics.median(r["rss_delta_mb"] for r in runs), 1),
+            "heavy_modules": last["heavy"],
+        })
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False))
+        return
+    for r in results:
+        status = "" if r["ok"] else f"  导入失败：{r['error']}"
+        heavy = ",".join(r["heavy_modules"]) or "-"
+        print(f"{r['module']:<28} {r['import_ms']:>8.1f} ms  RSS {r['rss_mb']:>6.1f} MB (+{r['rss_delta_mb']:.1f})  重依赖: {heavy}{status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""发送链路端到端基准：对本地假 Postal 服务器驱动真实的发送路径
+
+用法：python bench/bench_send.py [--path list|all|excel] [--sizes 1000,100000,1000000]
+                                 [--concurrency 16] [--batch-size 0] [--latency-ms 20] [--rate-429 0] [--rate-5xx 0]
+                                 [--output bench_send.json]
+
+- list / all：走 webapp.app 的任务路径（jobstore 快照 → 调度 → 线程池发送 → 状态批量提交），
+  分别对应 /api/send_list 与 /api/send_all 的收件人来源
+- excel：走 send_from_config 的 Excel 发送路径（逐行读表，大列表建议只跑小规模）
+- 每个规模在独立子进程中运行（独立的临时数据库与工作目录），峰值 RSS 互不影响
+- 统计：每秒封数、单次 API 调用延迟 p50 / p99（客户端测得，含连接池排队）、每封重试次数、峰值 RSS
+- 结果为 JSON（每个规模一条），便于在 CI 中与基线比较
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HTML_BODY = "<p>您好 {{email}}，这是第 {{index}} 封测试邮件。</p>" + "<div>正文内容 lorem ipsum</div>" * 50
+
+
+def start_fake_postal(args):
+    cmd = [
+        sys.executable, os.path.join(ROOT, "bench", "fake_postal.py"),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+        "--rate-429", str(args.rate_429), "--retry-after", str(args.retry_after),
+        "--max-rps", str(args.max_rps), "--rate-5xx", str(args.rate_5xx), "--seed", "1",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    port = json.loads(proc.stdout.readline())["port"]
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class CallRecorder:
+    """包装 webapp.postal.post_once，记录每次 API 调用的耗时与结果（Web 任务与 Excel 路径都经过它）"""
+
+    def __init__(self):
+        from webapp import postal
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.calls = 0
+        self.retryable_failures = 0
+        original = postal.post_once
+
+        def post_once(*a, **kw):
+            t0 = time.perf_counter()
+            res = original(*a, **kw)
+            dt = time.perf_counter() - t0
+            with self._lock:
+                self.calls += 1
+                self.latencies.append(dt)
+                if not res.ok and res.retryable:
+                    self.retryable_failures += 1
+            return res
+
+        postal.post_once = post_once
+
+
+def write_config(path, server, args, excel_file=""):
+    import toml
+    cfg = {
+        "postal": {"server": server, "key": "bench", "from_name": "Bench", "from_email": "bench@example.com"},
+        "setting": {
+            "subject": "bench",
+            "subjects": ["bench"],
+            "excel_file": excel_file,
+            "limit": 0,
+            "per_hour_limit": 0,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "proxy": "",
+        },
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(cfg, f)
+
+
+def gen_emails(n):
+    for i in range(n):
+        yield f"user{i}@example{i % 500}.com"
+
+
+def run_job_path(args, server, workdir):
+    """list / all：与 Web 接口相同的任务路径"""
+    from webapp import app as webapp_app
+    from webapp import jobstore, recipients
+    from webapp.jobs import FINISHED
+    from webapp.progress import ProgressState
+
+    # 配置、进度与结果文件全部放在临时目录，不影响项目根目录下的真实文件
+    webapp_app.CONFIG_PATH = os.path.join(workdir, "config.toml")
+    webapp_app.PROJECT_ROOT = workdir
+    webapp_app._PROGRESS = ProgressState(os.path.join(workdir, "send_progress.json"))
+    write_config(webapp_app.CONFIG_PATH, server, args)
+    core = webapp_app._load_core_settings()
+
+    t_prepare = time.perf_counter()
+    if args.path == "all":
+        recipients.add_many(gen_emails(args.n))
+        cid = jobstore.create_campaign("all", recipients.iter_emails(), list(core.subjects), HTML_BODY)
+    else:
+        cid = jobstore.create_campaign("list", gen_emails(args.n), list(core.subjects), HTML_BODY)
+    prepare_s = time.perf_counter() - t_prepare
+
+    t0 = time.perf_counter()
+    job = webapp_app._start_send_job(cid, args.path, core)
+    while job.status not in FINISHED:
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    result = job.result or {}
+    return {"prepare_s": round(prepare_s, 3), "elapsed_s": elapsed, "success": result.get("success", 0), "status": result.get("status")}
+
+
+def run_excel_path(args, server, workdir):
+    """excel：send_from_config 逐行读表发送"""
+    import pandas as pd
+    import send_email_postal_excel as sep
+
+    excel = os.path.join(workdir, "bench.xlsx")
+    pd.DataFrame({"email": list(gen_emails(args.n)), "content": [HTML_BODY] * args.n}).to_excel(excel, index=False)
+    config = os.path.join(workdir, "config.toml")
+    write_config(config, server, args, excel)
+    t0 = time.perf_counter()
+    result = sep.send_from_config(config, confirm=False)
+    elapsed = time.perf_counter() - t0
+    return {"prepare_s": 0.0, "elapsed_s": elapsed, "success": result.get("success", 0), "status": result.get("status")}
+
+
+def run_single(args):
+    """子进程中跑一个规模，输出一行 JSON"""
+    workdir = tempfile.mkdtemp(prefix="mailer-bench-")
+    os.environ["MAILER_DB"] = os.path.join(workdir, "mailer.db")
+    recorder = CallRecorder()
+    run = run_excel_path if args.path == "excel" else run_job_path
+    out = run(args, args.server, workdir)
+    lat = sorted(recorder.latencies)
+    elapsed = out.pop("elapsed_s")
+    result = {
+        "path": args.path,
+        "recipients": args.n,
+        "concurrency": args.concurrency,
+        "batch_size": args.batch_size,
+        **out,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_sec": round(out["success"] / elapsed, 1) if elapsed > 0 else None,
+        "api_calls": recorder.calls,
+        "latency_p50_ms": round(percentile(lat, 50) * 1000, 2) if lat else None,
+        "latency_p99_ms": round(percentile(lat, 99) * 1000, 2) if lat else None,
+        "retries_per_message": round(recorder.retryable_failures / args.n, 4) if args.n else 0,
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--path", choices=("list", "all", "excel"), default="list")
+    ap.add_argument("--sizes", default="1000,100000,1000000", help="逗号分隔的收件人数量")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--batch-size", type=int, default=0)
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--jitter-ms", type=float, default=5.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--retry-after", type=int, default=1)
+    ap.add_argument("--max-rps", type=float, default=0.0)
+    ap.add_argument("--rate-5xx", type=float, default=0.0)
+    ap.add_argument("--output", default="", help="把结果写入 JSON 文件（默认只打印）")
+    # 内部使用：子进程模式
+    ap.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    ap.add_argument("--n", type=int, default=0, help=argparse.SUPPRESS)
+    ap.add_argument("--server", default="", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.single:
+        run_single(args)
+        return
+
+    proc, server = start_fake_postal(args)
+    results = []
+    try:
+        for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            cmd = [
+                sys.executable, os.path.abspath(__file__), "--single", "--n", str(n), "--server", server,
+                "--path", args.path, "--concurrency", str(args.concurrency), "--batch-size", str(args.batch_size),
+            ]
+            line = subprocess.run(cmd, stdout=subprocess.PIPE, text=True, check=True).stdout.strip().splitlines()[-1]
+            results.append(json.loads(line))
+            print(line, flush=True)
+    finally:
+        proc.terminate()
+        proc.wait()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"fake_postal": vars(args) | {"server": server}, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""本地假 Postal 服务器：模拟 /api/v1/send/message 的延迟、429（含 Retry-After）与 5xx
+
+用法：python bench/fake_postal.py [--port 8025] [--latency-ms 50] [--jitter-ms 10]
+                                  [--rate-429 0.01] [--retry-after 1] [--max-rps 0] [--rate-5xx 0.005]
+启动后第一行输出 JSON {"port": 实际端口}；GET /stats 返回请求统计，POST /reset 清零。
+不校验 API Key，不真正发信；成功响应与 Postal 一致，包含每个收件人的 message id / token。
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePostal:
+    def __init__(self, latency_ms=50.0, jitter_ms=10.0, rate_429=0.0, retry_after=1, max_rps=0.0, rate_5xx=0.0,
+                 seed=None):
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.max_rps = max_rps
+        self.rate_5xx = rate_5xx
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._window = (0, 0)  # (秒, 本秒已接受数)，用于 max_rps 限流
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {"requests": 0, "accepted": 0, "recipients": 0, "throttled": 0, "server_errors": 0, "bad_requests": 0}
+
+    def _roll(self):
+        with self._lock:
+            return self._rng.random(), self._rng.random(), self._rng.uniform(-self.jitter, self.jitter)
+
+    def _over_rps(self) -> bool:
+        if self.max_rps <= 0:
+            return False
+        sec = int(time.monotonic())
+        with self._lock:
+            start, n = self._window
+            if start != sec:
+                start, n = sec, 0
+            if n >= self.max_rps:
+                self._window = (start, n)
+                return True
+            self._window = (start, n + 1)
+            return False
+
+    def handle(self, body: bytes):
+        """返回 (状态码, 头部 dict, 响应体 dict)"""
+        with self._lock:
+            self.stats["requests"] += 1
+        r429, r5xx, jitter = self._roll()
+        time.sleep(max(0.0, self.latency + jitter))
+        if self._over_rps() or r429 < self.rate_429:
+            with self._lock:
+                self.stats["throttled"] += 1
+            return 429, {"Retry-After": str(self.retry_after)}, {"status": "error", "data": {"message": "Too many requests"}}
+        if r5xx < self.rate_5xx:
+            with self._lock:
+                self.stats["server_errors"] += 1
+            return 503, {}, {"status": "error", "data": {"message": "Service unavailable"}}
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            data = None
+        rcpts = list((data or {}).get("to") or []) + list((data or {}).get("bcc") or [])
+        if not rcpts:
+            with self._lock:
+                self.stats["bad_requests"] += 1
+            return 200, {}, {"status": "parameter-error", "data": {"message": "No recipients"}}
+        messages = {}
+        with self._lock:
+            for addr in rcpts:
+                mid = next(self._ids)
+                messages[addr] = {"id": mid, "token": f"tok{mid}"}
+            self.stats["accepted"] += 1
+            self.stats["recipients"] += len(rcpts)
+        return 200, {}, {"status": "success", "time": self.latency, "data": {"message_id": f"msg-{mid}@fake", "messages": messages}}
+
+
+def make_server(fake: FakePostal, host="127.0.0.1", port=0) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code, headers, payload):
+            raw = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path == "/api/v1/send/message":
+                self._reply(*fake.handle(body))
+            elif self.path == "/reset":
+                fake.reset()
+                self._reply(200, {}, {"ok": True})
+            else:
+                self._reply(404, {}, {"status": "error"})
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with fake._lock:
+                    self._reply(200, {}, dict(fake.stats))
+            else:
+                self._reply(404, {}, {"status": "error"})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=0, help="0 表示随机端口")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rate-429", type=float, default=0.0, help="随机返回 429 的比例")
+    ap.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After 秒数")
+    ap.add_argument("--max-rps", type=float, default=0.0, help="每秒最多接受的请求数，超出返回 429（0 不限）")
+    ap.add_argument("--rate-5xx", type=float, default=0.0, help="随机返回 503 的比例")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    fake = FakePostal(args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after, args.max_rps, args.rate_5xx, args.seed)
+    server = make_server(fake, args.host, args.port)
+    print(json.dumps({"port": server.server_address[1]}), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
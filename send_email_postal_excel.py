@@ -1,155 +1,154 @@
-import json
-import time
-import secrets
-import pandas as pd
-import requests
-import toml
-from tqdm import tqdm
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-
-def init_session(proxy):
-    """初始化带自动重试和代理的 HTTP 会话
-    - 对 429/5xx 做重试
-    - 允许对 POST 进行重试（allowed_methods=False）
-    - 遵循 Retry-After 头
+import os
+import threading
+
+# HTTP 客户端已拆到 webapp.postal（不依赖 pandas / tqdm），这里保留原有名称以兼容旧的导入方式
+from webapp.postal import (  # noqa: F401
+    SendResult,
+    init_session,
+    post_once,
+    send_batch_once,
+    send_mail_once,
+)
+
+
+def send_from_config(config_path="config.toml", confirm=True, should_stop=None, on_progress=None, limiter=None):
+    """根据给定的 TOML 配置文件发送邮件。返回一个 dict，包含统计信息和可能的错误消息。
+    - should_stop()：派发每封邮件前调用，返回 True 则提前结束（可在其中阻塞实现暂停）
+    - on_progress(sent, success, total, to_addr)：每封邮件完成后回调
+    - limiter：Web 任务传入 job.limiter（全局 per_hour_limit 中分给该任务的份额），每封取一个令牌
+    与命令行、Web 任务共用发送引擎：并发（core.concurrency）、多服务器池与故障转移、429 / 5xx 退避重试
     """
-    s = requests.Session()
-    retries = Retry(
-        total=5,
-        backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=False,  # 对所有方法生效，包含 POST
-        respect_retry_after_header=True,
-        raise_on_status=False,
-    )
-    adapter = HTTPAdapter(max_retries=retries)
-    s.mount('http://', adapter)
-    s.mount('https://', adapter)
-    if proxy:
-        s.proxies = {"http": proxy, "https": proxy}
-    return s
-
-
-def send_mail(session, server, key, from_name, from_email, to_addr, subject, html_body):
-    """调用 Postal API 发送邮件（含轻量重试与限流处理）"""
-    data = {
-        "from": f"{from_name} <{from_email}>",
-        "sender": from_email,
-        "to": [to_addr],
-        "subject": subject,
-        "html_body": html_body,
-    }
-
-    url = f"{server}/api/v1/send/message"
-    headers = {"X-Server-API-Key": key, "Content-Type": "application/json"}
-
-    max_attempts = 4
-    for attempt in range(1, max_attempts + 1):
-        try:
-            r = session.post(url, data=json.dumps(data), headers=headers, timeout=(10, 20))
-            # 速率限制
-            if r.status_code == 429:
-                retry_after = r.headers.get("Retry-After")
-                try:
-                    wait = int(retry_after)
-                except Exception:
-                    wait = 30 * attempt  # 递增等待
-                wait = max(10, min(wait, 180))
-                print(f"⏳ {to_addr} 触发限速 429，等待 {wait}s 后重试（第{attempt}/{max_attempts}次）")
-                time.sleep(wait)
-                continue
-            # 临时性错误
-            if r.status_code >= 500:
-                backoff = min(60, 2 ** attempt)
-                print(f"⏳ {to_addr} 服务器错误 {r.status_code}，{backoff}s 后重试（第{attempt}/{max_attempts}次）")
-                time.sleep(backoff)
-                continue
-
-            if r.status_code == 200:
-                try:
-                    result = r.json()
-                except Exception:
-                    result = {}
-                if result.get("status") == "success":
-                    return True
-                else:
-                    print(f"❌ {to_addr} 发件失败：{result.get('data', {}).get('message', '未知错误')}")
-                    return False
-            else:
-                print(f"❌ {to_addr} HTTP错误 {r.status_code}：{r.text}")
-                return False
-        except Exception as e:
-            if attempt < max_attempts:
-                backoff = min(45, 3 * attempt)
-                print(f"⏳ {to_addr} 网络错误：{e}，{backoff}s 后重试（第{attempt}/{max_attempts}次）")
-                time.sleep(backoff)
-                continue
-            print(f"❌ {to_addr} 网络错误：{e}")
-            return False
-    return False
-
-
-def send_from_config(config_path="config.toml", confirm=True):
-    """根据给定的 TOML 配置文件发送邮件。返回一个 dict，包含统计信息和可能的错误消息。"""
-    try:
-        config = toml.load(config_path)
-    except FileNotFoundError:
+    # 与 Web 任务读同一份已校验的配置
+    from webapp.settings import SettingsError, store_for
+    store = store_for(os.path.abspath(config_path))
+    if not os.path.exists(store.path):
         return {"ok": False, "error": f"未找到配置文件: {config_path}"}
+    try:
+        core = store.current()
+    except SettingsError as e:
+        return {"ok": False, "error": f"配置有误：{'；'.join(e.errors)}"}
+    config = store.raw()
 
-    server = config["postal"]["server"]
-    key = config["postal"]["key"]
-    from_name = config["postal"]["from_name"]
-    from_email = config["postal"]["from_email"]
     excel_path = config["setting"]["excel_file"]
-    subject = config["setting"]["subject"]
-    limit = config["setting"].get("limit", 0)
-    proxy = config["setting"].get("proxy", "")
+    subject = core.subject or (core.subjects[0] if core.subjects else "")
 
-    delay = (60 / limit) if limit > 0 else 0
-
-    # 读取 Excel 文件
+    # 流式读取 Excel / CSV：逐行交给发送引擎，不把整张表载入内存
+    # 列映射：email_column / body_column 可填表头名或序号（默认第一列邮箱、第二列内容），其余列作为个性化字段
+    from webapp.rowsource import RowFormatError, open_rows
     try:
-        df = pd.read_excel(excel_path)
+        rows = open_rows(
+            excel_path,
+            email_column=config["setting"].get("email_column"),
+            body_column=config["setting"].get("body_column"),
+            sheet=config["setting"].get("sheet") or None,
+        )
     except FileNotFoundError:
         return {"ok": False, "error": f"Excel 文件 {excel_path} 未找到"}
-
-    # 确保至少有两列
-    if len(df.columns) < 2:
-        return {"ok": False, "error": "Excel 文件格式错误：至少需要两列（第一列邮箱，第二列内容）"}
+    except RowFormatError as e:
+        return {"ok": False, "error": str(e)}
 
     # 如果需要确认但被禁用则返回信息
     if confirm is True:
         # 当作为模块通过 Web 调用时，不做交互确认；confirm=True 表示需要交互的调用者处理确认
         pass
 
-    # 初始化会话
-    session = init_session(proxy)
-
-    success = 0
-    total = len(df)
-    for i, row in enumerate(df.itertuples(index=False), start=1):
-        to_addr = str(row[0]).strip()
-        html_body = str(row[1]).strip()
-        # 附加不可见追踪行：64位随机码 + 时间戳（HTML 注释）
-        trace = f"{secrets.token_hex(8)}-{int(time.time())}"
-        html_body = f"{html_body}\n<!-- trace:{trace} -->"
+    from collections import deque
+
+    from webapp.engine import TokenBucket, run_campaign
+    from webapp.pipeline import new_trace, render_body, skip_suppressed
+    from webapp.pool import pool_for
+
+    # setting.limit 为每分钟上限（core.excel_per_hour）；与 limiter 同时存在时两者都要满足（在 gate 中取令牌）
+    per_minute = TokenBucket(core.excel_per_hour) if core.excel_per_hour > 0 else None
+    if limiter is None:
+        limiter, per_minute = per_minute, None
+
+    pool = pool_for(core.servers)
+    controller = pool.primary.controller
+    local = threading.local()
+    # 派发线程在 gate 中选好服务器并占用名额，发送线程按先进先出取用
+    routed = deque()
+
+    def get_session(server):
+        sessions = getattr(local, "sessions", None)
+        if sessions is None:
+            sessions = local.sessions = {}
+        s = sessions.get(server.name)
+        if s is None:
+            s = sessions[server.name] = init_session(core.proxy)
+        return s
+
+    def gate(is_cancelled, n):
+        if per_minute is not None and not per_minute.acquire(is_cancelled, n):
+            return False
+        server = pool.acquire(is_cancelled, n)
+        if server is None:
+            return False
+        routed.append(server)
+        return True
 
-        ok = send_mail(session, server, key, from_name, from_email, to_addr, subject, html_body)
-        if ok:
-            success += 1
-        if delay > 0 and i < total:
-            time.sleep(delay)
+    def send_one(row):
+        server = routed.popleft()
+        res = None
+        try:
+            # 占位符（{{email}}、{{name}} 等）与 trace 注释，与 Web 任务相同
+            html_body = render_body(row.body, row.email, row.index, row.fields, trace=new_trace())
+            res = send_mail_once(get_session(server), server.url, server.key, core.from_name, core.from_email, row.email, subject, html_body)
+            return res
+        finally:
+            pool.release(server, res)
+
+    def retry(item, res, attempt):
+        if getattr(res, "retryable", False):
+            return controller.retry_delay(attempt, res.retry_after)
+        return None
+
+    # 总行数为预估值（CSV 无法预知时为 0）
+    counts = {"sent": 0, "success": 0, "skipped": 0, "total": rows.total or 0}
+    # 跳过（派发线程）与完成（发送线程）的记账共用一把锁
+    counts_lock = threading.Lock()
+
+    def count(row, ok=False, skipped=False):
+        with counts_lock:
+            counts["sent"] += 1
+            counts["success"] += int(ok)
+            counts["skipped"] += int(skipped)
+            counts["total"] = max(counts["total"], counts["sent"])
+            if on_progress is not None:
+                on_progress(counts["sent"], counts["success"], counts["total"], row.email)
+
+    def on_done(item, res):
+        count(item[0], ok=bool(getattr(res, "ok", False)))
 
-    return {"ok": True, "success": success, "total": total}
+    try:
+        # 与 Web 任务相同的抑制列表检查：硬退信 / 退订 / 手动添加的地址记为 skipped，不发送
+        items = skip_suppressed(((row,) for row in rows), lambda item: count(item[0], skipped=True), email=lambda item: item[0].email)
+        outcome = run_campaign(
+            items,
+            send_one,
+            concurrency=core.concurrency,
+            limiter=limiter,
+            is_cancelled=should_stop,
+            on_done=on_done,
+            gate=gate,
+            retry=retry,
+        )
+    finally:
+        rows.close()
+
+    return {
+        "ok": True,
+        "success": counts["success"],
+        "total": counts["total"],
+        "sent": counts["sent"],
+        "skipped": counts["skipped"],
+        "status": "stopped" if outcome["stopped"] else "completed",
+    }
 
 
 if __name__ == "__main__":
-    # 保持原有命令行交互行为
-    result = send_from_config("config.toml", confirm=True)
-    if not result.get("ok"):
-        print(f"❌ {result.get('error')}")
-        exit(1)
-    else:
-        print(f"\n✅ 全部完成：成功发送 {result.get('success')}/{result.get('total')} 封邮件")
\ No newline at end of file
+    # 命令行发送（并发、限速、续发、进度与逐个收件人的结果文件），参数见 --help 与 webapp.cli
+    import sys
+
+    from webapp.cli import main
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """每个测试独立的 mailer.db"""
+    from webapp import db as webapp_db
+    from webapp import suppression
+    path = str(tmp_path / "mailer.db")
+    monkeypatch.setattr(webapp_db, "DB_PATH", path)
+    # 快照缓存按版本号复用，换库后要清掉
+    monkeypatch.setattr(suppression, "_cache", None)
+    return path
+
+
+@pytest.fixture
+def fake_postal():
+    """本地假 Postal（bench/fake_postal.py），返回 FakePostal，url 属性为服务地址"""
+    from fake_postal import FakePostal, make_server
+    fake = FakePostal(latency_ms=1, jitter_ms=0, seed=1)
+    server = make_server(fake)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    fake.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+def write_config(path, server="http://127.0.0.1:1", **setting):
+    import toml
+    cfg = {
+        "postal": {"server": server, "key": "test", "from_name": "Test", "from_email": "test@example.com"},
+        "setting": {"subject": "hello", **setting},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(cfg, f)
+    return str(path)
+
+
+def write_csv(path, emails, body="<p>{{email}}</p>"):
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["email", "body"])
+        for e in emails:
+            w.writerow([e, body])
+    return str(path)
+
+
+@pytest.fixture
+def web(tmp_path, monkeypatch, db, fake_postal):
+    """webapp.app 指向临时目录（配置、进度、结果文件）与假 Postal，任务管理器与服务器池都是新的"""
+    from webapp import app as webapp_app
+    from webapp import pool
+    from webapp.jobs import JobManager
+    from webapp.progress import ProgressState
+    config = write_config(tmp_path / "config.toml", fake_postal.url, concurrency=4)
+    monkeypatch.setattr(webapp_app, "CONFIG_PATH", config)
+    monkeypatch.setattr(webapp_app, "PROJECT_ROOT", str(tmp_path))
+    monkeypatch.setattr(webapp_app, "BODY_PATH", str(tmp_path / "body_template.html"))
+    monkeypatch.setattr(webapp_app, "BODY_TXT_PATH", str(tmp_path / "body_template.txt"))
+    monkeypatch.setattr(webapp_app, "_PROGRESS", ProgressState(str(tmp_path / "send_progress.json")))
+    monkeypatch.setattr(webapp_app, "JOBS", JobManager())
+    monkeypatch.setattr(pool, "_pool", None)
+    return webapp_app
+
+
+@pytest.fixture
+def client(web):
+    """带 Basic 认证的测试客户端"""
+    import base64
+    c = web.app.test_client()
+    token = base64.b64encode(f"{web.AUTH_USER}:{web.AUTH_PASS}".encode()).decode()
+    c.environ_base["HTTP_AUTHORIZATION"] = f"Basic {token}"
+    return c
+
+
+def wait_for(predicate, timeout=10.0):
+    import time
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
@@ -0,0 +1,78 @@
+from webapp.backoff import CLOSED, HALF_OPEN, OPEN, AdaptiveController
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+def _warm(c, clock, n=100, dt=0.01):
+    for _ in range(n):
+        clock.t += dt
+        c.on_success()
+
+
+def test_isolated_server_errors_do_not_reduce_rate():
+    clock = Clock()
+    c = AdaptiveController(clock=clock)
+    for _ in range(10):
+        _warm(c, clock)
+        c.on_server_error()
+        c.on_network_error()
+    assert c.rate is None
+    assert c.state == CLOSED
+
+
+def test_windowed_error_ratio_reduces_rate():
+    clock = Clock()
+    c = AdaptiveController(clock=clock)
+    _warm(c, clock, n=30)
+    for _ in range(10):
+        clock.t += 0.01
+        c.on_server_error()
+    assert c.rate is not None
+
+
+def test_throttle_decreases_and_recovers_proportionally():
+    clock = Clock()
+    c = AdaptiveController(clock=clock, max_rate=500)
+    _warm(c, clock)
+    c.on_throttled(1)
+    low = c.rate
+    assert low is not None and low < 100
+    # 偶发的 429 不让所有发送暂停
+    assert c.pause_remaining() == 0
+    _warm(c, clock, n=100, dt=0.05)
+    # 5 秒内按比例回升，远超线性 0.5/s 的回升量
+    assert c.rate is None or c.rate > low * 2
+
+
+def test_sustained_throttling_pauses_everyone():
+    clock = Clock()
+    c = AdaptiveController(clock=clock)
+    _warm(c, clock, n=20)
+    for _ in range(5):
+        clock.t += 0.01
+        c.on_throttled(3)
+    assert c.pause_remaining() > 2
+
+
+def test_breaker_opens_and_half_opens():
+    clock = Clock()
+    c = AdaptiveController(clock=clock, breaker_threshold=5, breaker_cooldown=30)
+    for _ in range(5):
+        c.on_network_error()
+    assert c.state == OPEN and c.pause_remaining() > 29
+    clock.t += 31
+    assert c.pause_remaining() == 0 and c.state == HALF_OPEN
+    c.on_success()
+    assert c.state == CLOSED
+
+
+def test_retry_delay_honours_retry_after_and_max_attempts():
+    c = AdaptiveController(max_attempts=3)
+    assert c.retry_delay(1, "7") == 7
+    assert c.retry_delay(3) is None
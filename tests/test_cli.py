@@ -0,0 +1,30 @@
+import csv
+
+from conftest import write_config
+from webapp import cli, pipeline, pool
+
+
+def test_render_error_releases_the_server_slot(tmp_path, db, fake_postal, monkeypatch):
+    monkeypatch.setattr(pool, "_pool", None)
+    config = write_config(tmp_path / "config.toml", fake_postal.url, concurrency=2)
+    emails = tmp_path / "list.txt"
+    emails.write_text("\n".join(f"user{i}@example.com" for i in range(6)))
+    body = tmp_path / "body.html"
+    body.write_text("<p>{{email}}</p>")
+    render = pipeline.render_body
+
+    def flaky_render(tpl, email, *a, **kw):
+        if email in ("user1@example.com", "user4@example.com"):
+            raise KeyError("missing column")
+        return render(tpl, email, *a, **kw)
+
+    monkeypatch.setattr(pipeline, "render_body", flaky_render)
+    out = tmp_path / "result.csv"
+    cli.main(["--config", config, "--file", str(emails), "--body", str(body), "--no-validate", "--quiet", "--output", str(out)])
+
+    with open(out, newline="", encoding="utf-8") as f:
+        states = {r["email"]: r["status"] for r in csv.DictReader(f)}
+    assert [e for e, s in sorted(states.items()) if s == "failed"] == ["user1@example.com", "user4@example.com"]
+    assert fake_postal.stats["recipients"] == 4
+    # 渲染失败的两封也归还了在途名额
+    assert [s["inflight"] for s in pool.snapshots()] == [0]
@@ -0,0 +1,71 @@
+import time
+
+from webapp import cluster, jobstore
+
+
+def _campaign(n):
+    return jobstore.create_campaign("list", [f"user{i}@example.com" for i in range(n)], ["s"], "<p>x</p>")
+
+
+def _die(queue):
+    # 模拟 worker 崩溃：心跳停止，但不释放租约
+    queue._stop.set()
+    queue._heartbeat.join(timeout=5)
+    queue._conn.close()
+
+
+def test_expired_lease_is_taken_over_by_another_worker(db, monkeypatch):
+    monkeypatch.setattr(cluster, "CHUNK_SIZE", 2)
+    cid = _campaign(4)
+    cluster.ensure_chunks(cid)
+
+    a = cluster.LeaseQueue(cid, lease_seconds=0.3, worker_id="a")
+    it = iter(a)
+    assert next(it) == (1, "user0@example.com")
+    _die(a)
+
+    b = cluster.LeaseQueue(cid, lease_seconds=60, worker_id="b")
+    assert [idx for idx, _ in b] == [3, 4]  # 分片 0 仍在 a 的租约内
+    time.sleep(0.4)
+    assert [idx for idx, _ in b] == [1, 2]
+    b.close()
+
+
+def test_stopping_campaign_is_finalized_once_leases_lapse(db, monkeypatch):
+    monkeypatch.setattr(cluster, "CHUNK_SIZE", 2)
+    cid = _campaign(4)
+    cluster.ensure_chunks(cid)
+    jobstore.set_status(cid, "running")
+
+    a = cluster.LeaseQueue(cid, lease_seconds=0.3, worker_id="a")
+    next(iter(a))
+    assert cluster.stop_campaigns(cid) == 1
+    _die(a)
+
+    assert cluster.finalize_stopping() == 0
+    assert jobstore.get_campaign(cid)["status"] == "stopping"
+    time.sleep(0.4)
+    assert cluster.finalize_stopping() == 1
+    assert jobstore.get_campaign(cid)["status"] == "stopped"
+    assert jobstore.latest_unfinished() == cid
+
+
+def test_restart_finalizes_stopping_campaign(db):
+    cid = _campaign(1)
+    jobstore.set_status(cid, "stopping")
+    jobstore.mark_interrupted()
+    assert jobstore.get_campaign(cid)["status"] == "stopped"
+
+
+def test_shared_bucket_rate_is_global_across_workers(db):
+    a = cluster.SharedTokenBucket("t")
+    b = cluster.SharedTokenBucket("t")
+    a.set_rate(36000)  # 10/s
+    b.rate = b._read_rate()
+
+    waits = []
+    for _ in range(10):
+        waits.append(a.reserve())
+        waits.append(b.reserve())
+    # 20 个令牌合计按 10/s 放行（含 1 个突发），而不是每个 worker 各 10/s
+    assert 1.5 <= max(waits) <= 2.5
@@ -0,0 +1,35 @@
+from webapp.deliveries import BOUNCED, FAILED, is_hard_bounce, parse_event
+
+
+def _bounce(**bounce):
+    return {
+        "event": "MessageBounced",
+        "payload": {"original_message": {"id": 7, "token": "t", "to": "A@x.com"}, "bounce": bounce},
+    }
+
+
+def test_bounce_classification_by_status_code():
+    assert is_hard_bounce("550 5.1.1 <a@x.com>: Recipient address rejected")
+    assert is_hard_bounce("Delivery failed: 550 mailbox unavailable")
+    assert not is_hard_bounce("452 4.2.2 Mailbox full")
+    assert not is_hard_bounce("Mail delivery delayed: 421 try again later")
+
+
+def test_bounce_classification_without_code():
+    assert is_hard_bounce("Permanent failure: user unknown")
+    assert not is_hard_bounce("Mail delivery failed: returning message to sender")
+    assert not is_hard_bounce(None, "")
+    # message id 之类的数字不算状态码
+    assert not is_hard_bounce("Undelivered Mail (id 1550.23)")
+
+
+def test_parse_event_only_marks_hard_bounces():
+    hard = parse_event(_bounce(subject="Undeliverable: 5.1.1 user unknown"))
+    soft = parse_event(_bounce(subject="Undeliverable: 4.2.2 mailbox full"))
+    assert hard[:4] == (7, "t", "a@x.com", BOUNCED) and hard[5] is True
+    assert soft[3] == BOUNCED and soft[5] is False
+
+
+def test_parse_event_hardfail_status():
+    body = {"event": "MessageDeliveryFailed", "payload": {"message": {"id": 8, "to": "b@x.com"}, "status": "HardFail"}}
+    assert parse_event(body)[3:] == (FAILED, "", True)
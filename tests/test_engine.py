@@ -0,0 +1,64 @@
+import threading
+import time
+
+from webapp.engine import TokenBucket, run_campaign
+
+
+def test_token_bucket_rate_conformance():
+    bucket = TokenBucket(36000)  # 10/s，burst=1
+    waits = [bucket.reserve() for _ in range(21)]
+    assert waits[0] == 0.0
+    assert abs(waits[-1] - 2.0) < 0.05
+
+
+def test_retries_wait_in_heap_without_holding_send_threads():
+    attempts = {}
+    busy = []
+    lock = threading.Lock()
+    active = [0]
+
+    def send(i):
+        with lock:
+            active[0] += 1
+            busy.append(active[0])
+            attempts[i] = attempts.get(i, 0) + 1
+        time.sleep(0.005)
+        with lock:
+            active[0] -= 1
+        return i % 2 == 0 or attempts[i] >= 3  # 奇数第三次才成功
+
+    done = {}
+    res = run_campaign(
+        ((i,) for i in range(10)), send, concurrency=2,
+        retry=lambda item, ok, attempt: None if ok else 0.05,
+        on_done=lambda item, ok: done.__setitem__(item[0], ok),
+    )
+    assert res == {"dispatched": 20, "retried": 10, "stopped": False}
+    assert all(done.values()) and len(done) == 10
+    assert max(busy) <= 2
+
+
+def test_gate_receives_cost_and_can_stop():
+    seen = []
+
+    def gate(is_cancelled, n):
+        seen.append(n)
+        return len(seen) < 3
+
+    res = run_campaign(((i,) for i in range(10)), lambda i: True, gate=gate, cost=lambda item: item[0] + 1)
+    assert res["stopped"] and res["dispatched"] == 2
+    assert seen == [1, 2, 3]
+
+
+def test_cancel_stops_dispatch():
+    stop = threading.Event()
+    sent = []
+
+    def send(i):
+        sent.append(i)
+        if i == 4:
+            stop.set()
+        return True
+
+    res = run_campaign(((i,) for i in range(100)), send, is_cancelled=stop.is_set)
+    assert res["stopped"] and len(sent) < 100
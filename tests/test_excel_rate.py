@@ -0,0 +1,49 @@
+import shutil
+
+import toml
+
+from conftest import ROOT, write_csv
+
+
+def _shipped_config(tmp_path):
+    # 项目自带的 config.toml（limit = 5，未配置 per_hour_limit），只把 excel_file 换成测试数据
+    path = tmp_path / "config.toml"
+    shutil.copy(f"{ROOT}/config.toml", path)
+    cfg = toml.load(path)
+    cfg["setting"]["excel_file"] = write_csv(tmp_path / "rows.csv", ["a@example.com", "b@example.com"])
+    with open(path, "w", encoding="utf-8") as f:
+        toml.dump(cfg, f)
+    return str(path), cfg["setting"]["limit"]
+
+
+def _capture_run_campaign(monkeypatch):
+    from webapp import engine
+    seen = []
+
+    def run_campaign(items, send_one, concurrency=1, limiter=None, **kw):
+        seen.append(limiter.rate * 3600 if limiter is not None else 0)
+        return {"dispatched": 0, "retried": 0, "stopped": False}
+
+    monkeypatch.setattr(engine, "run_campaign", run_campaign)
+    return seen
+
+
+def test_shipped_config_same_excel_rate_in_cli_and_send_from_config(tmp_path, monkeypatch, db):
+    import send_email_postal_excel
+    from webapp import cli
+
+    config, limit = _shipped_config(tmp_path)
+    seen = _capture_run_campaign(monkeypatch)
+    send_email_postal_excel.send_from_config(config, confirm=False)
+    assert cli.main(["--config", config, "--excel", "--quiet", "--output", str(tmp_path / "out.csv")]) == 0
+
+    # setting.limit 为每分钟上限
+    assert seen == [limit * 60, limit * 60]
+
+
+def test_explicit_per_hour_limit_wins(tmp_path):
+    from conftest import write_config
+    from webapp.settings import store_for
+
+    core = store_for(write_config(tmp_path / "config.toml", limit=5, per_hour_limit=1000)).current()
+    assert core.per_hour_limit == core.excel_per_hour == 1000
@@ -0,0 +1,61 @@
+import csv
+
+import pytest
+
+import send_email_postal_excel
+from conftest import write_config, write_csv
+from webapp import cli, pool, suppression
+
+EMAILS = ["a@example.com", "b@example.com", "c@blocked.example", "d@example.com"]
+
+
+@pytest.fixture
+def excel_config(tmp_path, db, fake_postal, monkeypatch):
+    monkeypatch.setattr(pool, "_pool", None)
+    rows = write_csv(tmp_path / "rows.csv", EMAILS, body="<p>{{email}}</p>")
+    return write_config(tmp_path / "config.toml", fake_postal.url, excel_file=rows, concurrency=4)
+
+
+def test_send_from_config_skips_suppressed_rows(excel_config, fake_postal):
+    suppression.add_many(["b@example.com", "@blocked.example"], reason="hard_bounce")
+    progress = []
+    res = send_email_postal_excel.send_from_config(excel_config, confirm=False, on_progress=lambda *a: progress.append(a))
+    assert res["status"] == "completed"
+    assert (res["success"], res["skipped"], res["sent"]) == (2, 2, 4)
+    assert fake_postal.stats["recipients"] == 2
+    assert progress[-1][:3] == (4, 2, 4)
+
+
+def test_cli_excel_skips_suppressed_rows(excel_config, fake_postal, tmp_path):
+    suppression.add_many(["a@example.com"], reason="unsubscribe")
+    out = tmp_path / "result.csv"
+    assert cli.main(["--config", excel_config, "--excel", "--quiet", "--output", str(out)]) == 0
+    with open(out, newline="", encoding="utf-8") as f:
+        states = {r["email"]: r["status"] for r in csv.DictReader(f)}
+    assert states == {"a@example.com": "skipped", "b@example.com": "sent", "c@blocked.example": "sent", "d@example.com": "sent"}
+    assert fake_postal.stats["recipients"] == 3
+
+
+def test_send_from_config_retries_throttled_rows(excel_config, fake_postal):
+    fake_postal.rate_429 = 0.3
+    fake_postal.retry_after = 0
+    res = send_email_postal_excel.send_from_config(excel_config, confirm=False)
+    assert res["status"] == "completed" and res["success"] == 4
+    assert fake_postal.stats["throttled"] > 0
+    assert fake_postal.stats["recipients"] == 4
+
+
+def test_send_from_config_takes_a_token_per_row_and_stops(excel_config, fake_postal):
+    class Limiter:
+        taken = 0
+
+        def acquire(self, is_cancelled=None, n=1):
+            # 两封之后在等待令牌时被取消
+            if Limiter.taken >= 2:
+                return False
+            Limiter.taken += n
+            return True
+
+    res = send_email_postal_excel.send_from_config(excel_config, confirm=False, limiter=Limiter())
+    assert res["status"] == "stopped"
+    assert Limiter.taken == res["sent"] == fake_postal.stats["recipients"] == 2
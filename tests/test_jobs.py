@@ -0,0 +1,95 @@
+import dataclasses
+import time
+
+from conftest import wait_for
+from webapp import jobstore
+from webapp.jobs import FINISHED, JobManager
+
+
+def _campaign(n):
+    return jobstore.create_campaign("list", [f"user{i}@example.com" for i in range(n)], ["hello"], "<p>{{email}}</p>")
+
+
+def test_global_rate_is_shared_by_running_jobs():
+    jobs = JobManager()
+    hold = []
+
+    def target(job):
+        while not job.checkpoint():
+            pass
+        hold.append(job.id)
+
+    a = jobs.start(1, "list", target, per_hour=3600)
+    assert a.limiter.rate * 3600 == 3600
+    b = jobs.start(2, "list", target, per_hour=3600)
+    assert a.limiter.rate * 3600 == b.limiter.rate * 3600 == 1800
+    # 暂停的任务不占份额
+    assert jobs.pause(2)
+    assert a.limiter.rate * 3600 == 3600
+    assert jobs.resume(2)
+    assert a.limiter.rate * 3600 == 1800
+    jobs.cancel_all()
+    assert wait_for(lambda: sorted(hold) == [1, 2])
+
+
+def test_pause_resume_cancel_transitions(web, client, fake_postal):
+    cid = _campaign(40)
+    core = dataclasses.replace(web._load_core_settings(), per_hour_limit=36000)  # 10/s
+    job = web._start_send_job(cid, "list", core)
+
+    assert client.post(f"/api/jobs/{cid}/pause").get_json()["status"] == "paused"
+    assert not client.post(f"/api/jobs/{cid}/pause").get_json()["ok"]
+    time.sleep(0.2)  # 暂停前已派发的请求结束
+    paused_at = fake_postal.stats["recipients"]
+    time.sleep(0.4)
+    assert fake_postal.stats["recipients"] == paused_at
+
+    assert client.post(f"/api/jobs/{cid}/resume").get_json()["status"] == "running"
+    assert wait_for(lambda: fake_postal.stats["recipients"] > paused_at)
+    assert client.post(f"/api/jobs/{cid}/cancel").get_json()["status"] == "stopping"
+    assert wait_for(lambda: job.status in FINISHED)
+    assert job.status == "stopped"
+    assert jobstore.get_campaign(cid)["status"] == "stopped"
+    c = jobstore.counts(cid)
+    assert c[jobstore.PENDING] > 0 and c[jobstore.SENT] == fake_postal.stats["recipients"]
+
+    # 已停止的任务按 pending 续发，已发送的不会重发
+    res = client.post(f"/api/jobs/{cid}/resume").get_json()
+    assert res["ok"] and res["pending"] == c[jobstore.PENDING]
+    job = web.JOBS.get(cid)
+    assert wait_for(lambda: job.status in FINISHED)
+    assert job.status == "completed"
+    assert fake_postal.stats["recipients"] == 40
+    assert jobstore.counts(cid)[jobstore.SENT] == 40
+
+
+def test_resume_interrupted_campaign(web, client, fake_postal):
+    cid = _campaign(5)
+    jobstore.set_status(cid, "running")
+    w = jobstore.StateWriter(cid)
+    w.record(1, True)
+    w.record(2, True)
+    w.close()
+    # 进程重启：遗留的 running 任务标记为中断
+    jobstore.mark_interrupted()
+    assert jobstore.get_campaign(cid)["status"] == "interrupted"
+
+    res = client.post("/api/resume", json={}).get_json()
+    assert res["ok"] and res["campaign_id"] == cid and res["pending"] == 3
+    job = web.JOBS.get(cid)
+    assert wait_for(lambda: job.status in FINISHED)
+    assert job.status == "completed"
+    assert fake_postal.stats["recipients"] == 3
+    assert jobstore.get_campaign(cid)["status"] == "completed"
+
+
+def test_send_job_honours_rate_limit(web, fake_postal):
+    cid = _campaign(11)
+    core = dataclasses.replace(web._load_core_settings(), per_hour_limit=36000)  # 10/s
+    t0 = time.monotonic()
+    job = web._start_send_job(cid, "list", core)
+    assert wait_for(lambda: job.status in FINISHED)
+    elapsed = time.monotonic() - t0
+    assert job.status == "completed" and fake_postal.stats["recipients"] == 11
+    # 11 封：首封立即发出，其余按 0.1 秒间隔
+    assert 0.95 <= elapsed < 2.0
@@ -0,0 +1,26 @@
+import sqlite3
+
+from webapp import jobstore
+from webapp.db import connect
+
+
+def test_create_campaign_reads_source_before_the_write_transaction(db):
+    other = connect()
+    blocked = []
+
+    def slow_source():
+        # 模拟边读边校验（含 MX 查询）：此时其它连接仍可写库
+        for i in range(3):
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                other.execute("CREATE TABLE IF NOT EXISTS probe (x)")
+                other.execute("COMMIT")
+            except sqlite3.OperationalError:
+                blocked.append(i)
+            yield f"user{i}@example.com"
+
+    other.execute("PRAGMA busy_timeout=100")
+    cid = jobstore.create_campaign("list", slow_source(), ["s"], "<p>x</p>")
+    assert not blocked
+    assert [e for _, e in jobstore.iter_pending(cid)] == ["user0@example.com", "user1@example.com", "user2@example.com"]
+    assert jobstore.counts(cid)["total"] == 3
@@ -0,0 +1,59 @@
+import pytest
+
+from webapp import pool
+from webapp.postal import SendResult
+from webapp.settings import ServerConfig
+
+OK = SendResult(True, "ok", 200, False, None, "", None)
+DOWN = SendResult(False, "network", 0, True, None, "refused", None)
+
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(pool, "_pool", None)
+
+
+def _cfg(name, weight=1):
+    return ServerConfig(f"http://{name}", f"key-{name}", name, weight)
+
+
+def test_weighted_round_robin():
+    p = pool.pool_for([_cfg("a", 3), _cfg("b", 1)])
+    picked = []
+    for _ in range(8):
+        s = p.acquire()
+        picked.append(s.name)
+        p.release(s, OK)
+    assert picked.count("a") == 6 and picked.count("b") == 2
+
+
+def test_failing_server_is_ejected():
+    p = pool.pool_for([_cfg("a"), _cfg("b")])
+    a = p.servers[0]
+    for _ in range(pool.FAIL_THRESHOLD):
+        a.inflight += 1
+        p.release(a, DOWN)
+    assert a.state == pool.DOWN
+    assert {p.acquire().name for _ in range(4)} == {"b"}
+
+
+def test_config_edit_keeps_server_state_and_drops_removed_servers():
+    p = pool.pool_for([_cfg("a"), _cfg("b")])
+    a = p.acquire()
+    assert pool.pool_for([_cfg("a", 5), _cfg("c")]) is p
+    # 身份相同的服务器保留在途数，新权重就地生效
+    assert p.servers[0] is a and a.inflight == 1 and a.weight == 5
+    names = [s["name"] for s in pool.snapshots()]
+    assert names == ["a", "c"]
+    # 已删除服务器上的请求结束时照常释放
+    p.release(a, OK)
+    assert a.inflight == 0
+
+
+def test_empty_config_raises():
+    with pytest.raises(ValueError):
+        pool.pool_for([])
+    pool.pool_for([_cfg("a")])
+    with pytest.raises(ValueError):
+        pool.pool_for([])
+    assert [s["name"] for s in pool.snapshots()] == ["a"]
@@ -0,0 +1,58 @@
+import threading
+
+from webapp.scheduler import QuotaScheduler, quota_settings
+
+NOW = 1_700_000_000.0
+
+
+def _items(*emails):
+    return list(enumerate(emails, 1))
+
+
+def _run(scheduler, items):
+    # 全部受限时立即停止，而不是等到下一个时间窗
+    return list(scheduler.schedule(items, is_cancelled=lambda: True))
+
+
+def test_domains_are_interleaved_and_limited(db):
+    quotas = quota_settings({"domain_per_hour": 2})
+    s = QuotaScheduler(["a@x.com"], quotas, clock=lambda: NOW)
+    out = _run(s, _items("1@a.com", "2@a.com", "3@a.com", "1@b.com"))
+    assert [addr for _, addr, _ in out] == ["1@a.com", "1@b.com", "2@a.com"]
+    assert {sender for _, _, sender in out} == {"a@x.com"}
+
+
+def test_sender_quota_rolls_over_to_next_sender(db):
+    quotas = quota_settings({"sender_per_hour": 1})
+    s = QuotaScheduler(["a@x.com", "b@x.com"], quotas, clock=lambda: NOW)
+    out = _run(s, _items("1@a.com", "2@a.com", "3@a.com"))
+    assert [sender for _, _, sender in out] == ["a@x.com", "b@x.com"]
+
+
+def test_quota_is_shared_by_resumed_and_concurrent_campaigns(db):
+    quotas = quota_settings({"domain_limits": {"a.com": {"per_day": 3}}})
+    first = _run(QuotaScheduler([], quotas, clock=lambda: NOW), _items("1@a.com", "2@a.com"))
+    assert len(first) == 2
+    # 续发 / 另一个任务重新构造调度器，仍沿用已消耗的额度
+    resumed = _run(QuotaScheduler([], quotas, clock=lambda: NOW), _items("3@a.com", "4@a.com"))
+    assert [addr for _, addr, _ in resumed] == ["3@a.com"]
+
+    # 下一个时间窗恢复
+    later = _run(QuotaScheduler([], quotas, clock=lambda: NOW + 86400), _items("4@a.com"))
+    assert len(later) == 1
+
+
+def test_concurrent_schedulers_never_exceed_quota(db):
+    quotas = quota_settings({"domain_per_hour": 50})
+    results = []
+
+    def worker(n):
+        emails = [f"{n}-{i}@a.com" for i in range(40)]
+        results.extend(_run(QuotaScheduler([], quotas, clock=lambda: NOW), _items(*emails)))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 50
@@ -0,0 +1,30 @@
+import dataclasses
+
+from conftest import wait_for
+from webapp import jobstore
+from webapp.jobs import FINISHED
+
+
+def _campaign(n, body="<p>{{email}}</p>"):
+    return jobstore.create_campaign("list", (f"user{i}@example.com" for i in range(n)), ["hello"], body)
+
+
+def test_invalid_server_list_fails_the_campaign(web):
+    cid = _campaign(3)
+    core = dataclasses.replace(web._load_core_settings(), servers=())
+    job = web._start_send_job(cid, "list", core)
+    assert wait_for(lambda: job.status in FINISHED)
+    assert job.status == "failed" and job.result["ok"] is False
+    assert jobstore.get_campaign(cid)["status"] == "failed"
+
+
+def test_send_list_reports_dropped_addresses(web, client):
+    res = client.post("/api/send_list", json={
+        "recipients": "info@example.com\njane@example.com\nbad@@example.com",
+        "html_body": "<p>hi</p>",
+    }).get_json()
+    # 角色账号默认保留，只丢弃语法错误的地址
+    assert res["ok"] and res["recipients"] == 2 and res["dropped"] == 1
+    job = web.JOBS.get(res["job_id"])
+    assert wait_for(lambda: job.status in FINISHED)
+    assert job.result["success"] == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from webapp import tracking
+from webapp.tracking import Tracker
+
+
+@pytest.fixture(autouse=True)
+def no_flush_thread(monkeypatch):
+    # 测试里显式 flush()；后台线程会在换库后继续运行，干扰后续测试
+    monkeypatch.setattr(Tracker, "_ensure_started", lambda self: None)
+
+
+def _rows():
+    return tracking._conn().execute("SELECT trace, campaign_id, opens, clicks FROM tracking_messages ORDER BY trace").fetchall()
+
+
+def test_unknown_or_foreign_traces_are_not_recorded(db):
+    t = Tracker()
+    t.record_sent(1, "abc", "s", "a@x.com")
+    assert not t.hit(1, "forged", "open")
+    assert not t.hit(2, "abc", "open")  # trace 属于其它任务
+    assert t.hit(1, "abc", "open")
+    t.flush()
+    assert _rows() == [("abc", 1, 1, 0)]
+    assert t.stats["ignored"] == 2
+
+
+def test_repeated_hits_are_collapsed_within_window(db):
+    t = Tracker()
+    t.record_sent(1, "abc", "s", "a@x.com")
+    assert t.hit(1, "abc", "open")
+    assert not t.hit(1, "abc", "open")
+    assert t.hit(1, "abc", "click")
+    assert not t.hit(1, "abc", "click")
+    t.flush()
+    assert _rows() == [("abc", 1, 1, 1)]
+
+    t2 = Tracker(repeat_window=0)
+    t2.record_sent(1, "def", "s", "a@x.com")
+    assert t2.hit(1, "def", "open") and t2.hit(1, "def", "open")
+
+
+def test_traces_registered_by_other_workers_are_verified_from_db(db):
+    sender = Tracker()
+    sender.record_sent(3, "xyz", "s", "a@x.com")
+    sender.flush()
+    other = Tracker()
+    assert other.hit(3, "xyz", "open")
+    other.flush()
+    assert _rows() == [("xyz", 3, 1, 0)]
+
+
+def test_open_pixel_ignores_forged_trace(client):
+    r = client.get("/t/o/1/forged.gif")
+    assert r.status_code == 200 and r.mimetype == "image/gif"
+    tracking.TRACKER.flush()
+    assert _rows() == []
@@ -0,0 +1,29 @@
+from webapp.validate import TYPO, Validator, suggest_domain
+
+
+def test_real_providers_near_popular_domains_are_not_typos():
+    for domain in ("mail.com", "ymail.com", "email.com", "zmail.com", "gmx.net", "yahoo.de"):
+        assert suggest_domain(domain) is None, domain
+
+
+def test_typos_are_still_suggested():
+    assert suggest_domain("gmial.com") == "gmail.com"
+    assert suggest_domain("gmaill.com") == "gmail.com"
+    assert suggest_domain("hotmial.com") == "hotmail.com"
+    assert suggest_domain("qq.con") == "qq.com"
+
+
+def test_validator_keeps_real_providers():
+    emails = ["a@mail.com", "b@ymail.com", "c@email.com", "d@zmail.com", "e@gmial.com"]
+    kept, report = Validator(check_mx=False).validate(emails)
+    assert kept == emails[:4]
+    assert report.to_dict()["rejected"][TYPO] == 1
+
+
+def test_role_accounts_kept_unless_enabled():
+    from webapp.validate import ROLE
+    emails = ["info@example.com", "sales@example.com", "jane@example.com"]
+    kept, _ = Validator(check_mx=False).validate(emails)
+    assert kept == emails
+    kept, report = Validator(reject_roles=True, check_mx=False).validate(emails)
+    assert kept == ["jane@example.com"] and report.to_dict()["rejected"][ROLE] == 2
@@ -1,25 +1,29 @@
 import os
 import threading
 import base64
-import random
 import time
 import secrets
+from collections import deque
 from functools import wraps
-from flask import Flask, jsonify, request, render_template, send_from_directory, Response
-import toml
+from flask import Flask, jsonify, request, render_template, Response
+
+from webapp.jobs import FINISHED, JobManager
+from webapp.pipeline import new_trace, render_body, schedule_quotas, skip_suppressed, validator_for
+from webapp.progress import ProgressState
+from webapp.settings import SettingsError
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
 CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.toml")
-RECIP_PATH = os.path.join(PROJECT_ROOT, "recipients.txt")
 BODY_PATH = os.path.join(PROJECT_ROOT, "body_template.html")
 BODY_TXT_PATH = os.path.join(PROJECT_ROOT, "body_template.txt")
 PROGRESS_PATH = os.path.join(PROJECT_ROOT, "send_progress.json")
-CANCEL_PATH = os.path.join(PROJECT_ROOT, "send_cancel.flag")
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
 AUTH_USER = os.getenv("MAILER_AUTH_USER", "admin").strip()
 AUTH_PASS = os.getenv("MAILER_AUTH_PASS", "admin").strip()
+# Postal webhook 地址需带 ?token=<MAILER_WEBHOOK_TOKEN>；未设置时 webhook 不可用
+WEBHOOK_TOKEN = os.getenv("MAILER_WEBHOOK_TOKEN", "").strip()
 
 
 def check_auth(auth_header: str) -> bool:
@@ -43,6 +47,12 @@ def require_basic_auth():
     p = request.path or ""
     if p.startswith("/static/") or p == "/favicon.ico":
         return None
+    # Postal webhook 无法携带 Basic 认证，改由 URL 中的 token 校验
+    if p == "/api/webhooks/postal":
+        return None
+    # 打开 / 点击追踪由收件人的邮件客户端访问
+    if p.startswith("/t/"):
+        return None
     auth = request.headers.get("Authorization")
     if not check_auth(auth):
         return Response(
@@ -51,15 +61,24 @@ def require_basic_auth():
         )
 
 
+def _settings_store():
+    from webapp.settings import store_for
+    return store_for(CONFIG_PATH)
+
+
 def load_config():
-    if not os.path.exists(CONFIG_PATH):
-        return {}
-    return toml.load(CONFIG_PATH)
+    # 进程内缓存，文件 mtime 变化时才重新解析；返回副本
+    return _settings_store().raw()
 
 
 def save_config(cfg):
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        toml.dump(cfg, f)
+    # 先校验再原子写入，返回新的 Settings；不合法时抛出 SettingsError
+    return _settings_store().save(cfg)
+
+
+@app.errorhandler(SettingsError)
+def _settings_error(e):
+    return jsonify({"ok": False, "error": f"配置有误：{e}", "errors": e.errors}), 400
 
 
 @app.route("/")
@@ -78,7 +97,9 @@ def api_post_config():
     data = request.get_json()
     if not isinstance(data, dict):
         return jsonify({"ok": False, "error": "Invalid payload"}), 400
-    save_config(data)
+    settings = save_config(data)
+    # 运行中的任务立即使用新的速率上限
+    JOBS.set_global_rate(settings.per_hour_limit)
     return jsonify({"ok": True})
 
 
@@ -90,26 +111,42 @@ def api_upload():
 
 @app.route("/api/send", methods=["POST"])
 def api_send():
-    # 在后台线程中执行发送，立即返回任务 id (简化为固定 id)
+    # 在后台线程中执行 Excel 发送，返回任务 id（只有 Excel 模式才导入该脚本及其读表依赖）
     from send_email_postal_excel import send_from_config
+    from webapp import jobstore
+
+    # Excel 模式不使用收件人快照，仅登记一个任务以获得 ID
+    cid = jobstore.create_campaign("excel", [], [], "")
+
+    def worker(job):
+        def on_progress(sent, success, total, to_addr):
+            _job_progress(job, {"mode": "excel", "status": job.status, "sent": sent, "success": success, "total": total, "current_email": to_addr})
 
-    def worker():
         # send_from_config 会返回结果字典
-        res = send_from_config(CONFIG_PATH, confirm=False)
+        # 与其它任务一样从 job.limiter 取令牌，才不会在全局速率的平分中白占一份
+        res = send_from_config(CONFIG_PATH, confirm=False, should_stop=job.checkpoint, on_progress=on_progress, limiter=job.limiter)
         if isinstance(res, dict):
             res["mode"] = "excel"
-        # 将结果写入文件供前端查询（简单实现）
-        with open(os.path.join(PROJECT_ROOT, "last_send_result.json"), "w", encoding="utf-8") as f:
-            import json
-            json.dump(res, f, ensure_ascii=False)
+            res["job_id"] = cid
+        status = (res or {}).get("status") or ("completed" if (res or {}).get("ok") else "failed")
+        jobstore.set_status(cid, status)
+        JOBS.finish(job, status, res)
+        _write_last_result(res)
+        _job_progress(job, {**job.progress, "mode": "excel", "status": status})
 
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return jsonify({"ok": True, "task": "send_task"})
+    JOBS.start(cid, "excel", worker)
+    return jsonify({"ok": True, "task": "send_task", "job_id": cid})
 
 
 @app.route("/api/last_result", methods=["GET"])
 def api_last_result():
+    # 指定 job_id 时返回该任务的结果，否则返回最近一次结束的任务结果
+    job_id = request.args.get("job_id", type=int)
+    if job_id:
+        job = JOBS.get(job_id)
+        if job is None or job.result is None:
+            return jsonify({"ok": False, "error": "no result"}), 404
+        return jsonify(job.result)
     path = os.path.join(PROJECT_ROOT, "last_send_result.json")
     if not os.path.exists(path):
         return jsonify({"ok": False, "error": "no result"}), 404
@@ -119,43 +156,13 @@ def api_last_result():
     return jsonify(data)
 
 
-def _load_core_settings():
-    cfg = load_config()
-    postal = cfg.get("postal", {})
-    setting = cfg.get("setting", {})
-    subjects = setting.get("subjects") or []
-    if isinstance(subjects, str):
-        subjects = [subjects]
-    # 清洗为字符串列表
-    subjects = [str(s).strip() for s in subjects if str(s).strip()]
-    single_subject = setting.get("subject", "")
-    if not subjects and single_subject:
-        subjects = [single_subject]
-
-    # 发件邮箱：支持 from_emails 数组，兼容旧的 from_email
-    from_emails = postal.get("from_emails")
-    if isinstance(from_emails, str):
-        from_emails = [from_emails]
-    if not isinstance(from_emails, list):
-        fe = postal.get("from_email", "")
-        from_emails = [fe] if fe else []
-    from_emails = [str(e).strip() for e in from_emails if str(e).strip()]
-
-    # 每小时限制，兼容旧的 limit
-    per_hour_limit = setting.get("per_hour_limit", 0) or setting.get("limit", 0)
+# 运行中的任务检查配置文件是否修改了速率上限的间隔（秒）
+RATE_REFRESH_INTERVAL = 5.0
 
-    return {
-        "server": postal.get("server", ""),
-        "key": postal.get("key", ""),
-        "from_name": postal.get("from_name", ""),
-        # 向后兼容：提供 from_email（首个）与 from_emails（数组）
-        "from_email": (from_emails[0] if from_emails else ""),
-        "from_emails": from_emails,
-        "subject": single_subject,
-        "subjects": subjects,
-        "per_hour_limit": per_hour_limit,
-        "proxy": setting.get("proxy", ""),
-    }
+
+def _load_core_settings():
+    # 已校验的不可变配置（见 webapp.settings）；配置不合法时抛出 SettingsError，由错误处理返回 400
+    return _settings_store().current()
 
 
 def _normalize_email_list(raw: str):
@@ -169,45 +176,29 @@ def _normalize_email_list(raw: str):
     return parts
 
 
-def _read_recipients_file():
-    # 返回 (列表顺序, 小写去重字典)
-    existing = []
-    if os.path.exists(RECIP_PATH):
-        with open(RECIP_PATH, "r", encoding="utf-8") as f:
-            for line in f:
-                e = line.strip()
-                if e and "@" in e:
-                    existing.append(e)
-    seen = {}
-    ordered = []
-    for e in existing:
-        k = e.strip().lower()
-        if k not in seen:
-            seen[k] = e
-            ordered.append(e)
-    return ordered, seen
+def _validator(core, payload: dict):
+    # 本次请求可用 validate=false 关闭校验、check_mx 覆盖配置（与命令行发送共用，见 webapp.pipeline）
+    return validator_for(core, payload)
+
+
+def _dedupe_rules(core, payload: dict):
+    # 本次请求可用 dedupe_rules 覆盖配置（如 ["lower", "gmail_dots", "plus_tags"]）；含未知规则时返回 None
+    from webapp.dedupe import RULES
+    rules = payload.get("dedupe_rules")
+    if rules is None:
+        return core.dedupe_rules
+    if isinstance(rules, str):
+        rules = [r.strip() for r in rules.split(",")]
+    rules = tuple(r for r in rules if r)
+    if not rules or any(r not in RULES for r in rules):
+        return None
+    return rules
 
 
 def _merge_and_save_recipients(new_emails):
-    ordered, seen = _read_recipients_file()
-    appended = 0
-    for e in new_emails:
-        k = e.strip().lower()
-        if k not in seen:
-            seen[k] = e
-            ordered.append(e)
-            appended += 1
-    # 去重完成后打乱顺序
-    random.shuffle(ordered)
-    with open(RECIP_PATH, "w", encoding="utf-8") as f:
-        for e in ordered:
-            f.write(e + "\n")
-    return {"total": len(ordered), "appended": appended}
-
-
-def _load_all_recipients():
-    ordered, _ = _read_recipients_file()
-    return ordered
+    # 追加到收件人库（规范化地址唯一索引去重），不再整体重写文件
+    from webapp import recipients
+    return recipients.add_many(new_emails)
 
 
 def _save_body_template(html_body: str):
@@ -223,73 +214,437 @@ def _save_body_template(html_body: str):
         pass
 
 
-def _update_progress(data: dict):
-    try:
-        data = dict(data)
-        data["updated_at"] = int(time.time())
-        with open(PROGRESS_PATH, "w", encoding="utf-8") as f:
-            import json
-            json.dump(data, f, ensure_ascii=False)
-    except Exception:
-        pass
-
-
-def _clear_cancel_flag():
-    try:
-        if os.path.exists(CANCEL_PATH):
-            os.remove(CANCEL_PATH)
-    except Exception:
-        pass
-
+# 进度只保存在内存中，按间隔节流落盘到 send_progress.json（重启后可恢复显示）
+_PROGRESS = ProgressState(PROGRESS_PATH)
 
-def _set_cancel_flag():
-    try:
-        with open(CANCEL_PATH, "w", encoding="utf-8") as f:
-            f.write("stop")
-    except Exception:
-        pass
 
+def _update_progress(data: dict):
+    _PROGRESS.update(data)
 
-def _is_cancelled() -> bool:
-    return os.path.exists(CANCEL_PATH)
 
+def _write_last_result(result: dict):
+    # 兼容旧接口：保存最近一次结束的任务结果；各任务的结果另见 /api/jobs/<id>
+    # 先写临时文件再替换：多个 worker 同时结束时读到的总是完整的 JSON
+    import json
+    path = os.path.join(PROJECT_ROOT, "last_send_result.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _job_progress(job, data: dict):
+    # 同时更新任务自身的进度与全局（最近活动任务的）进度快照
+    job.progress = data
+    _update_progress({"job_id": job.id, "campaign_id": job.id, **data})
+
+
+def _run_send_job(job, core, profile: bool = False):
+    """后台发送任务：有界线程池并发发送，共享令牌桶限速（worker_list / worker_all 共用）
+    - 收件人来自 jobstore 中该任务的 pending 快照，结果批量落库，可随时中断后续发
+    - 配置了发件人/域名配额时，先经 QuotaScheduler 重排并指定发件邮箱
+    - 暂停 / 取消由 job.checkpoint() 控制，速率为 JobManager 分配的份额
+    - 开启 batch_size 且模板不含占位符时，按 (主题, 发件邮箱) 分组，每次 API 调用发送一批
+    - 每次调用只尝试一次：429/5xx/网络错误交给该服务器共享的 AdaptiveController 调速，收件人进入重试队列
+    - 配置了多个 Postal 服务器（[[postal.servers]]）时按权重、容量与健康状态分流，见 webapp.pool
+    - 集群模式（MAILER_CLUSTER）下收件人按租约分片认领，多个 worker 同时处理同一任务，见 webapp.cluster
+    - job.profiler 不为 None 时记录各阶段耗时（可在运行中通过 /api/jobs/<id>/profile 开启），见 webapp.profiling
+    """
+    from webapp.postal import init_session, send_batch_once, send_mail_once
+    from webapp import cluster, jobstore, metrics, suppression
+    from webapp.deliveries import INGESTOR
+    from webapp.engine import group_batches, run_campaign
+    from webapp.template import compile_template
+
+    cid = job.id
+    if profile:
+        from webapp.profiling import StageProfiler
+        job.profiler = StageProfiler(cid)
+    camp = jobstore.get_campaign(cid)
+    mode = camp["mode"]
+    subjects = camp["subjects"]
+    # 模板只解析一次，之后每封邮件一次 join
+    source = camp["html_body"]
+    # 是否可批量发送只看原模板：追踪改写的链接含 {{_trace}}，但同一批本就共用一个 trace
+    static_body = compile_template(source).is_static
+    tracking = None
+    if core.track_opens or core.track_clicks:
+        from webapp.tracking import TRACKER, CampaignTracking, rewrite_links, save_links
+        tracking = CampaignTracking(cid, core.tracking_url, core.track_opens, core.track_clicks)
+        if core.track_clicks:
+            source, links = rewrite_links(source, core.tracking_url, cid)
+            save_links(cid, links)
+    html_body = compile_template(source)
+    from webapp.pool import pool_for
+    # 服务器池在下面的 try 中取得（配置有误时按失败收尾，不让任务停在 running）
+    pool = controller = None
 
-def _sleep_with_cancel(seconds: float) -> bool:
-    if seconds <= 0:
-        return False
-    end = time.time() + seconds
-    while True:
-        if _is_cancelled():
-            return True
-        now = time.time()
-        if now >= end:
+    def pick_subject(i: int):
+        if not subjects:
+            return ""
+        return subjects[(i - 1) % len(subjects)]
+    def pick_from(i: int):
+        froms = core.from_emails
+        if froms:
+            return froms[(i - 1) % len(froms)]
+        return core.from_email
+
+    # requests.Session 不保证线程安全：每个发送线程对每个服务器各持有一个会话（连接池按线程、按服务器复用）
+    local = threading.local()
+
+    def get_session(server):
+        sessions = getattr(local, "sessions", None)
+        if sessions is None:
+            sessions = local.sessions = {}
+        s = sessions.get(server.name)
+        if s is None:
+            s = sessions[server.name] = init_session(core.proxy)
+        return s
+
+    # 派发线程在 gate 中选好服务器并占用名额，发送线程按先进先出取用（任意收件人都可发往任意服务器）
+    routed = deque()
+
+    def gate(is_cancelled, n):
+        server = pool.acquire(is_cancelled, n)
+        if server is None:
             return False
-        time.sleep(min(1.0, end - now))
-
+        routed.append(server)
+        return True
+
+    job_label = str(cid)
+
+    def report(res, elapsed, from_email, n=1):
+        # 记录指标（结果对服务器健康与自适应控制器的反馈由 pool.release 完成）
+        metrics.POSTAL_LATENCY.observe(elapsed, job_label)
+        metrics.POSTAL_RESPONSES.inc(job_label, res.kind)
+        metrics.MESSAGES_ATTEMPTED.inc(job_label, from_email, amount=n)
+        return res
+
+    def post(server, fn, to, from_email, subject, rendered):
+        res = None
+        try:
+            res = fn(get_session(server), server.url, server.key, core.from_name, from_email, to, subject, rendered)
+            return res
+        finally:
+            pool.release(server, res)
+
+    def from_of(item):
+        return item[2] if len(item) > 2 and item[2] else pick_from(item[0])
+
+    def profile_send(prof, t_start, t_http, http_seconds, n=1):
+        # 剖析开启时：渲染 / 调用两段耗时与每封总耗时，并登记当前线程供采样
+        prof.register_thread()
+        prof.add("render", t_http - t_start, n)
+        prof.add("http", http_seconds, n)
+        prof.observe(t_http - t_start + http_seconds, http_seconds)
+
+    def send_one(i: int, addr: str, from_email=None):
+        server = routed.popleft()
+        prof = job.profiler
+        t_start = time.perf_counter()
+        try:
+            trace = new_trace()
+            rendered = render_body(html_body, addr, i, trace=trace, tracking=tracking)
+            from_email = from_email or pick_from(i)
+            subject = pick_subject(i)
+        except BaseException:
+            pool.release(server, None)
+            raise
+        t0 = time.perf_counter()
+        res = post(server, send_mail_once, addr, from_email, subject, rendered)
+        elapsed = time.perf_counter() - t0
+        report(res, elapsed, from_email)
+        if res.ok:
+            # 只入队，由投递状态的后台线程批量写库
+            INGESTOR.record_sent(cid, i, res.messages, trace)
+            if tracking is not None:
+                TRACKER.record_sent(cid, trace, subject, from_email)
+        if prof is not None:
+            profile_send(prof, t_start, t0, elapsed)
+        return res
+
+    def send_group(idxs, addrs, from_email, subject):
+        # 批量内容完全相同，只需渲染一次（含一条追踪注释）
+        server = routed.popleft()
+        prof = job.profiler
+        t_start = time.perf_counter()
+        try:
+            trace = new_trace()
+            rendered = render_body(html_body, addrs[0], idxs[0], trace=trace, tracking=tracking)
+        except BaseException:
+            pool.release(server, None)
+            raise
+        t0 = time.perf_counter()
+        res = post(server, send_batch_once, addrs, from_email, subject, rendered)
+        elapsed = time.perf_counter() - t0
+        report(res, elapsed, from_email, len(addrs))
+        if res.ok:
+            INGESTOR.record_sent(cid, {a.strip().lower(): i for i, a in zip(idxs, addrs)}, res.messages, trace)
+            if tracking is not None:
+                TRACKER.record_sent(cid, trace, subject, from_email, len(addrs))
+        if prof is not None:
+            profile_send(prof, t_start, t0, elapsed, len(addrs))
+        return res
+
+    def retry(item, res, attempt):
+        # 可重试的失败延后重新入队，不阻塞发送线程；超过最大次数后记为失败
+        if getattr(res, "retryable", False):
+            delay = controller.retry_delay(attempt, res.retry_after)
+            if delay is not None:
+                metrics.RETRIES.inc(job_label)
+            return delay
+        return None
 
-def _render_body(template_html: str, email: str, index: int):
-    # 简单占位符替换：{{email}}、{{index}}、{{domain}}
-    if not template_html:
-        return ""
+    # 续发时从库里已有的结果继续累计；sent 为已处理数（含因抑制列表跳过的）
+    done = jobstore.counts(cid)
+    total = done["total"]
+    state = {
+        "sent": done[jobstore.SENT] + done[jobstore.FAILED] + done[jobstore.SKIPPED],
+        "success": done[jobstore.SENT],
+        "skipped": done[jobstore.SKIPPED],
+    }
+    state_lock = threading.Lock()
+    writer = jobstore.StateWriter(cid)
+
+    def progress(current_email=None):
+        data = {"mode": mode, "status": job.status, "sent": state["sent"], "success": state["success"], "skipped": state["skipped"], "total": total, "backoff": controller.snapshot()}
+        if len(pool.servers) > 1:
+            data["servers"] = pool.snapshot()
+        if current_email:
+            data["current_email"] = current_email
+        _job_progress(job, data)
+
+    def on_done(item, res):
+        ok = bool(getattr(res, "ok", False))
+        writer.record(item[0], ok)
+        if ok:
+            metrics.MESSAGES_SUCCEEDED.inc(job_label, from_of(item))
+            job.meter.mark()
+        else:
+            metrics.MESSAGES_FAILED.inc(job_label, from_of(item), getattr(res, "kind", "exception"))
+        with state_lock:
+            state["sent"] += 1
+            if ok:
+                state["success"] += 1
+        progress(item[1])
+
+    def on_group_done(item, res):
+        # res.recipients 为 {收件人: 是否被接受}；整批失败时全部记为失败
+        idxs, addrs = item[0], item[1]
+        accepted = (getattr(res, "recipients", None) or {}) if getattr(res, "ok", False) else {}
+        n_ok = 0
+        with state_lock:
+            for idx, addr in zip(idxs, addrs):
+                ok = bool(accepted.get(addr))
+                writer.record(idx, ok)
+                state["sent"] += 1
+                if ok:
+                    state["success"] += 1
+                    n_ok += 1
+        if n_ok:
+            metrics.MESSAGES_SUCCEEDED.inc(job_label, item[2], amount=n_ok)
+            job.meter.mark(n_ok)
+        if n_ok < len(addrs):
+            reason = getattr(res, "kind", "exception") if not getattr(res, "ok", False) else "rejected"
+            metrics.MESSAGES_FAILED.inc(job_label, item[2], reason, amount=len(addrs) - n_ok)
+        progress(addrs[-1])
+
+    # 抑制列表快照；任务运行中列表有变化（退订 / 硬退信 / 手动添加）时在检查点上换成新快照
+    suppressed = {"set": suppression.snapshot()}
+
+    def on_suppressed(item):
+        # 发送前检查抑制列表（内存 set，O(1)），命中的记为 skipped，不占速率与 API 调用
+        writer.record_state(item[0], jobstore.SKIPPED)
+        metrics.MESSAGES_SKIPPED.inc(job_label, "suppressed")
+        with state_lock:
+            state["sent"] += 1
+            state["skipped"] += 1
+
+    # 配置文件中的 per_hour_limit 在运行中被修改时，在派发检查点上生效（最多每 RATE_REFRESH_INTERVAL 秒检查一次 mtime）
+    # 抑制列表同样在这里比对库中的版本号，版本变化时才重新加载
+    rate_check = {"at": time.monotonic(), "per_hour": core.per_hour_limit}
+
+    poller = cluster.StatusPoller(cid) if cluster.ENABLED else None
+
+    seen = {"status": "running"}
+
+    def sync_status():
+        # 集群模式：其它 worker 收到的暂停 / 继续 / 取消经由 campaigns.status 同步到本地任务（只在状态变化时处理）
+        status = poller.poll()
+        if status == seen["status"]:
+            return
+        seen["status"] = status
+        if status == "paused":
+            JOBS.pause(cid)
+        elif status == "running":
+            JOBS.resume(cid)
+        elif status in ("stopping", "stopped"):
+            JOBS.cancel(cid)
+
+    def checkpoint():
+        now = time.monotonic()
+        if now - rate_check["at"] >= RATE_REFRESH_INTERVAL:
+            rate_check["at"] = now
+            try:
+                per_hour = _load_core_settings().per_hour_limit
+            except SettingsError:
+                per_hour = rate_check["per_hour"]
+            if per_hour != rate_check["per_hour"]:
+                rate_check["per_hour"] = per_hour
+                JOBS.set_global_rate(per_hour)
+            suppressed["set"] = suppression.snapshot()
+        return job.checkpoint(sync_status if poller else None)
+
+    def profiled(fn, stage):
+        # 记账 / 检查点的耗时（剖析未开启时只多一次属性读取）
+        def wrapper(*args):
+            prof = job.profiler
+            if prof is None:
+                return fn(*args)
+            prof.register_thread()
+            t0 = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                prof.add(stage, time.perf_counter() - t0)
+        return wrapper
+
+    def on_wait(reason, seconds):
+        metrics.WAIT_SECONDS.inc(job_label, reason, amount=seconds)
+        prof = job.profiler
+        if prof is not None:
+            prof.add(f"wait_{reason}", seconds)
+
+    checkpoint = profiled(checkpoint, "checkpoint")
+
+    batch_size = core.batch_size
+    batched = batch_size > 1 and static_body
+    status = "interrupted"
+    error = None
+    leases = None
     try:
-        domain = email.split("@", 1)[1] if "@" in email else ""
-    except Exception:
-        domain = ""
-    out = (
-        template_html
-        .replace("{{email}}", email)
-        .replace("{{index}}", str(index))
-        .replace("{{domain}}", domain)
-    )
-    # 附加不可见追踪行：64位随机码 + 时间戳（HTML 注释，不被展示）
-    trace = f"{secrets.token_hex(8)}-{int(time.time())}"
-    out = f"{out}\n<!-- trace:{trace} -->"
-    return out
+        try:
+            pool = pool_for(core.servers)
+        except ValueError as e:
+            status, error = "failed", str(e)
+            return
+        # 重试间隔与次数各服务器相同，取首个服务器的控制器计算
+        controller = pool.primary.controller
+        progress()
+        if cluster.ENABLED:
+            cluster.ensure_chunks(cid)
+            leases = cluster.LeaseQueue(cid)
+        items = skip_suppressed(
+            leases if leases is not None else jobstore.iter_pending(cid), on_suppressed, current=lambda: suppressed["set"]
+        )
+        # 配额调度：按域名轮询重排，受限的域名/发件人不会阻塞其它收件人
+        items = schedule_quotas(items, core, checkpoint)
+        if batched:
+            def group_key(item):
+                i = item[0]
+                return (item[2] if len(item) > 2 and item[2] else pick_from(i)), pick_subject(i)
+
+            items = (
+                ([it[0] for it in group], [it[1] for it in group], k[0], k[1])
+                for k, group in group_batches(items, batch_size, group_key)
+            )
+        outcome = run_campaign(
+            items,
+            send_group if batched else send_one,
+            concurrency=core.concurrency,
+            limiter=job.limiter,
+            is_cancelled=checkpoint,
+            on_done=profiled(on_group_done if batched else on_done, "bookkeeping"),
+            cost=(lambda item: len(item[0])) if batched else None,
+            gate=gate,
+            retry=retry,
+            on_wait=on_wait,
+            stats=job.engine_stats,
+        )
+        state["retries"] = outcome["retried"]
+        status = "stopped" if outcome["stopped"] else "completed"
+    finally:
+        writer.close()
+        if job.profiler is not None:
+            job.profiler.stop()
+        db_status = status
+        if leases is not None:
+            # 结果已落库：标记收尾完成的分片并释放其余租约；任务整体状态只在所有分片完成（或被取消）时更新，
+            # 异常退出时不改状态，剩余分片由其它 worker 接手
+            leases.close()
+            if status == "completed" and not cluster.all_done(cid):
+                db_status = None
+            elif status == "interrupted":
+                db_status = None
+        if db_status:
+            jobstore.set_status(cid, db_status)
+        result = {"ok": True, "mode": mode, "job_id": cid, "campaign_id": cid, "success": state["success"], "total": total, "status": status, "sent": state["sent"], "skipped": state["skipped"], "retries": state.get("retries", 0)}
+        if error:
+            result.update(ok=False, error=error)
+        JOBS.finish(job, status, result)
+        _write_last_result(result)
+        _job_progress(job, {"mode": mode, "status": status, "sent": state["sent"], "success": state["success"], "skipped": state["skipped"], "total": total})
+
+
+def _job_manager():
+    # 集群模式下所有任务（及所有 worker）共用数据库中的全局令牌桶
+    from webapp import cluster
+    return JobManager(limiter=cluster.global_bucket() if cluster.ENABLED else None)
+
+
+# 进程内任务管理器：任务 ID 即 jobstore 中的 campaign id
+JOBS = _job_manager()
+
+
+def _collect_job_metrics():
+    # 抓取时现算的瞬时值：各运行中任务的队列深度、在途数、实际速率与限速
+    from webapp import pool
+    from webapp.deliveries import INGESTOR
+    from webapp.tracking import TRACKER
+    jobs = JOBS.active()
+    pending, inflight, retry_queue, send_rate, limit_rate = [], [], [], [], []
+    for j in jobs:
+        label = {"job": str(j.id)}
+        pending.append((label, max(0, (j.progress.get("total") or 0) - (j.progress.get("sent") or 0))))
+        inflight.append((label, j.engine_stats.get("inflight", 0)))
+        retry_queue.append((label, j.engine_stats.get("retry_queue", 0)))
+        send_rate.append((label, round(j.meter.rate(), 3)))
+        limit_rate.append((label, round(j.limiter.rate, 3)))
+    # 只输出当前配置中的服务器，修改配置后不残留旧服务器的序列
+    servers = pool.snapshots()
+    backoff_rate = [({"server": s["name"]}, s["backoff"]["rate_per_sec"] or 0) for s in servers]
+    server_up = [({"server": s["name"]}, 1 if s["state"] == pool.HEALTHY else 0) for s in servers]
+    server_inflight = [({"server": s["name"]}, s["inflight"]) for s in servers]
+    return [
+        ("mailer_jobs_active", "gauge", "运行中（含暂停）的任务数", [({}, len(jobs))]),
+        ("mailer_queue_pending", "gauge", "任务中尚未处理的收件人数", pending),
+        ("mailer_inflight_requests", "gauge", "在途的 Postal 请求数", inflight),
+        ("mailer_retry_queue", "gauge", "等待重试的收件人数", retry_queue),
+        ("mailer_send_rate", "gauge", "最近 60 秒实际成功发送速率（封/秒）", send_rate),
+        ("mailer_rate_limit_per_second", "gauge", "任务当前的限速（封/秒，0 为不限）", limit_rate),
+        ("mailer_backoff_rate_per_second", "gauge", "自适应退避的当前速率上限（封/秒，0 为未限速）", backoff_rate),
+        ("mailer_postal_server_up", "gauge", "Postal 服务器是否在用（1 健康，0 已摘除）", server_up),
+        ("mailer_postal_server_inflight", "gauge", "各 Postal 服务器的在途请求数", server_inflight),
+        ("mailer_webhook_queue", "gauge", "待写入的投递事件数", [({}, INGESTOR.pending())]),
+        ("mailer_tracking_pending", "gauge", "内存中待写入的打开 / 点击 / 发送登记数", [({}, TRACKER.pending())]),
+    ]
+
+
+def _register_metrics():
+    from webapp.metrics import REGISTRY
+    REGISTRY.add_collector(_collect_job_metrics)
+
+
+_register_metrics()
+
+
+def _start_send_job(cid: int, mode: str, core, profile: bool = False):
+    """启动（或续发）一个任务；该任务已在运行时返回 None。profile=True 时从第一封开始分阶段剖析"""
+    return JOBS.start(cid, mode, lambda job: _run_send_job(job, core, profile), per_hour=core.per_hour_limit)
 
 
 @app.route("/api/send_list", methods=["POST"])
 def api_send_list():
-    from send_email_postal_excel import init_session, send_mail
     payload = request.get_json(silent=True) or {}
     recipients_text = payload.get("recipients", "")
     dedupe = bool(payload.get("dedupe", True))
@@ -305,94 +660,52 @@ def api_send_list():
     if not emails:
         return jsonify({"ok": False, "error": "未解析到有效邮箱"}), 400
 
-    # 去重（保序）
+    core = _load_core_settings()
+    # 去重（保序）：按指纹标记，不再额外构建规范化字符串的 set
+    dedupe_info = None
     if dedupe:
-        seen = set()
-        uniq = []
-        for e in emails:
-            k = e.strip().lower()
-            if k not in seen:
-                seen.add(k)
-                uniq.append(e)
-        emails = uniq
-
-    # 合并并保存到 recipients.txt（累积且去重）
+        rules = _dedupe_rules(core, payload)
+        if rules is None:
+            return jsonify({"ok": False, "error": "dedupe_rules 含未知规则"}), 400
+        from webapp.dedupe import dedupe_list
+        emails, stats = dedupe_list(emails, rules)
+        dedupe_info = stats.to_dict()
+
+    # 入队前离线校验：语法、角色账号、拼写错误域名、可选 MX
+    validator = _validator(core, payload)
+    report = None
+    if validator is not None:
+        emails, report = validator.validate(emails)
+        if not emails:
+            return jsonify({"ok": False, "error": "校验后没有可发送的邮箱", "validation": report.to_dict()}), 400
+
+    # 合并保存到收件人库（累积且去重）
     merge_info = _merge_and_save_recipients(emails)
 
-    core = _load_core_settings()
-    subjects = core.get("subjects") or []
+    subjects = list(core.subjects)
     # 若前端传了 subject_override 则全程使用该主题；否则从 subjects 轮询
     if subject_override:
         subjects = [subject_override]
     if not subjects:
         return jsonify({"ok": False, "error": "主题(subjects)不能为空（在设置中至少提供一个或本次传入 subject）"}), 400
 
-    delay = 0
-    try:
-        limit = int(core.get("per_hour_limit") or 0)
-        delay = (3600 / limit) if limit > 0 else 0
-    except Exception:
-        delay = 0
-
     # 保存邮件内容模板
     _save_body_template(html_body)
 
-    def pick_subject(i: int):
-        if not subjects:
-            return ""
-        return subjects[(i - 1) % len(subjects)]
-    def pick_from(i: int):
-        froms = core.get("from_emails") or []
-        if froms:
-            return froms[(i - 1) % len(froms)]
-        return core.get("from_email")
-
-    def worker_list(to_list):
-        _clear_cancel_flag()
-        session = init_session(core.get("proxy") or "")
-        success = 0
-        total = len(to_list)
-        _update_progress({"mode": "list", "status": "running", "sent": 0, "success": 0, "total": total})
-        stopped = False
-        for i, addr in enumerate(to_list, start=1):
-            if _is_cancelled():
-                stopped = True
-                break
-            rendered = _render_body(html_body, addr, i)
-            subject_now = pick_subject(i)
-            ok = send_mail(
-                session,
-                core.get("server"),
-                core.get("key"),
-                core.get("from_name"),
-                pick_from(i),
-                addr,
-                subject_now,
-                rendered,
-            )
-            if ok:
-                success += 1
-            _update_progress({"mode": "list", "status": "running", "sent": i, "success": success, "total": total, "current_email": addr})
-            if delay > 0 and i < total:
-                if _sleep_with_cancel(delay):
-                    stopped = True
-                    break
-        status = "stopped" if stopped else "completed"
-        sent = i-1 if stopped else total
-        result = {"ok": True, "mode": "list", "success": success, "total": total, "status": status, "sent": sent}
-        with open(os.path.join(PROJECT_ROOT, "last_send_result.json"), "w", encoding="utf-8") as f:
-            import json
-            json.dump(result, f, ensure_ascii=False)
-        _update_progress({"mode": "list", "status": status, "sent": sent, "success": success, "total": total})
-
-    t = threading.Thread(target=worker_list, args=(emails,), daemon=True)
-    t.start()
+    from webapp import jobstore
+    cid = jobstore.create_campaign("list", emails, subjects, html_body)
+    _start_send_job(cid, "list", core, profile=bool(payload.get("profile")))
     return jsonify({
         "ok": True,
         "task": "send_list",
+        "job_id": cid,
+        "campaign_id": cid,
         "recipients": len(emails),
         "saved_total": merge_info.get("total"),
-        "saved_appended": merge_info.get("appended")
+        "saved_appended": merge_info.get("appended"),
+        "dedupe": dedupe_info,
+        "validation": report.to_dict() if report else None,
+        "dropped": (report.total - report.valid) if report else 0,
     })
 
 
@@ -415,12 +728,11 @@ def api_save_list():
 
 @app.route("/api/send_all", methods=["POST"])
 def api_send_all():
-    from send_email_postal_excel import init_session, send_mail
     payload = request.get_json(silent=True) or {}
     subject_override = (payload.get("subject") or "").strip()
     html_body = (payload.get("html_body") or "").strip()
     core = _load_core_settings()
-    subjects = core.get("subjects") or []
+    subjects = list(core.subjects)
     if subject_override:
         subjects = [subject_override]
     if not subjects:
@@ -432,117 +744,555 @@ def api_send_all():
             html_body = f.read()
     _save_body_template(html_body)
 
-    to_list = _load_all_recipients()
-    if not to_list:
-        return jsonify({"ok": False, "error": "recipients.txt 为空"}), 400
+    from webapp import jobstore, recipients
+    if not recipients.count():
+        return jsonify({"ok": False, "error": "收件人列表为空"}), 400
+
+    # 从收件人库流式写入任务快照（边读边校验），不在内存中构建完整列表
+    source = recipients.iter_emails()
+    # 收件人库已按小写地址唯一；配置了更多规则（Gmail 点号、+标签等）时再按指纹去重一遍（读库两次，内存有界）
+    rules = _dedupe_rules(core, payload)
+    if rules is None:
+        return jsonify({"ok": False, "error": "dedupe_rules 含未知规则"}), 400
+    dedupe_info = None
+    from webapp.dedupe import DEFAULT_RULES, dedupe_iter
+    if tuple(rules) != DEFAULT_RULES:
+        source, stats = dedupe_iter(recipients.iter_emails, rules)
+        dedupe_info = stats.to_dict()
+    validator = _validator(core, payload)
+    report = None
+    if validator is not None:
+        from webapp.validate import Report
+        report = Report()
+        source = validator.iter_valid(source, report)
+    cid = jobstore.create_campaign("all", source, subjects, html_body)
+    _start_send_job(cid, "all", core, profile=bool(payload.get("profile")))
+    total = jobstore.get_campaign(cid)["total"]
+    return jsonify({
+        "ok": True,
+        "task": "send_all",
+        "job_id": cid,
+        "campaign_id": cid,
+        "recipients": total,
+        "dedupe": dedupe_info,
+        "validation": report.to_dict() if report else None,
+        "dropped": (report.total - report.valid) if report else 0,
+    })
 
-    delay = 0
+
+def _resume_campaign(cid: int):
+    """从 jobstore 中的 pending 收件人续发一个已停止 / 中断的任务，返回 (响应 dict, 状态码)"""
+    from webapp import jobstore
+    camp = jobstore.get_campaign(int(cid))
+    if not camp:
+        return {"ok": False, "error": "任务不存在"}, 404
+    if camp["status"] not in jobstore.UNFINISHED or camp["mode"] not in ("list", "all"):
+        return {"ok": False, "error": f"任务状态为 {camp['status']}，无需续发"}, 400
+    pending = jobstore.counts(camp["id"])[jobstore.PENDING]
+    if not pending:
+        return {"ok": False, "error": "该任务没有待发送的收件人"}, 400
+    running = JOBS.get(camp["id"])
+    if running is not None and running.status not in FINISHED:
+        return {"ok": False, "error": "该任务正在运行"}, 409
+    from webapp import cluster
+    if cluster.ENABLED:
+        # 重新开放仍有 pending 收件人的分片，其它 worker 的轮询线程会一起接手
+        cluster.ensure_chunks(camp["id"], reset=True)
+    jobstore.set_status(camp["id"], "running")
+    if _start_send_job(camp["id"], camp["mode"], _load_core_settings()) is None:
+        return {"ok": False, "error": "该任务正在运行"}, 409
+    return {"ok": True, "task": "resume", "job_id": camp["id"], "campaign_id": camp["id"], "pending": pending, "total": camp["total"]}, 200
+
+
+@app.route("/api/resume", methods=["POST"])
+def api_resume():
+    # 续发未完成的任务：默认取最近一个 stopped / interrupted 且仍有 pending 的任务
+    from webapp import jobstore
+    payload = request.get_json(silent=True) or {}
+    cid = payload.get("campaign_id") or payload.get("job_id") or jobstore.latest_unfinished()
+    if not cid:
+        return jsonify({"ok": False, "error": "没有可续发的任务"}), 404
+    body, code = _resume_campaign(cid)
+    return jsonify(body), code
+
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    # 本进程内的任务（运行中与最近结束的）
+    return jsonify({"ok": True, "jobs": JOBS.list()})
+
+
+@app.route("/api/jobs/<int:job_id>", methods=["GET"])
+def api_job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is not None:
+        return jsonify({"ok": True, **job.to_dict()})
+    # 不在内存中（例如重启前的任务）：从 jobstore 汇总
+    from webapp import jobstore
+    camp = jobstore.get_campaign(job_id)
+    if not camp:
+        return jsonify({"ok": False, "error": "任务不存在"}), 404
+    c = jobstore.counts(job_id)
+    return jsonify({
+        "ok": True,
+        "id": job_id,
+        "mode": camp["mode"],
+        "status": camp["status"],
+        "started_at": camp["created_at"],
+        "total": camp["total"],
+        "sent": c[jobstore.SENT] + c[jobstore.FAILED] + c[jobstore.SKIPPED],
+        "success": c[jobstore.SENT],
+        "skipped": c[jobstore.SKIPPED],
+        "pending": c[jobstore.PENDING],
+    })
+
+
+def _cluster_set_status(job_id: int, status: str, expect) -> bool:
+    # 集群模式：任务可能运行在其它 worker 上，通过 campaigns.status 下发，各 worker 在派发检查点同步
+    from webapp import cluster, jobstore
+    if not cluster.ENABLED:
+        return False
+    camp = jobstore.get_campaign(job_id)
+    if not camp or camp["status"] not in expect:
+        return False
+    jobstore.set_status(job_id, status)
+    return True
+
+
+@app.route("/api/jobs/<int:job_id>/pause", methods=["POST"])
+def api_job_pause(job_id):
+    if _cluster_set_status(job_id, "paused", ("running",)) and JOBS.get(job_id) is None:
+        return jsonify({"ok": True, "job_id": job_id, "status": "paused"})
+    if not JOBS.pause(job_id):
+        return jsonify({"ok": False, "error": "任务不存在或不在运行中"}), 400
+    job = JOBS.get(job_id)
+    _job_progress(job, {**job.progress, "status": job.status})
+    return jsonify({"ok": True, "job_id": job_id, "status": job.status})
+
+
+@app.route("/api/jobs/<int:job_id>/resume", methods=["POST"])
+def api_job_resume(job_id):
+    if _cluster_set_status(job_id, "running", ("paused",)) and JOBS.get(job_id) is None:
+        return jsonify({"ok": True, "job_id": job_id, "status": "running"})
+    if JOBS.resume(job_id):
+        job = JOBS.get(job_id)
+        _job_progress(job, {**job.progress, "status": job.status})
+        return jsonify({"ok": True, "job_id": job_id, "status": job.status})
+    # 不是暂停中的任务：尝试从持久化队列续发
+    body, code = _resume_campaign(job_id)
+    return jsonify(body), code
+
+
+@app.route("/api/jobs/<int:job_id>/cancel", methods=["POST"])
+def api_job_cancel(job_id):
+    if _cluster_set_status(job_id, "stopping", ("running", "paused")) and JOBS.get(job_id) is None:
+        return jsonify({"ok": True, "job_id": job_id, "status": "stopping"})
+    if not JOBS.cancel(job_id):
+        return jsonify({"ok": False, "error": "任务不存在或已结束"}), 400
+    job = JOBS.get(job_id)
+    _job_progress(job, {**job.progress, "status": job.status})
+    return jsonify({"ok": True, "job_id": job_id, "status": job.status})
+
+
+@app.route("/api/jobs/<int:job_id>/profile", methods=["POST"])
+def api_job_profile_start(job_id):
+    # 对运行中的任务开启分阶段剖析；sample_seconds > 0 时同时开启一个采样窗口（interval_ms 为采样间隔）
+    from webapp.profiling import SAMPLE_INTERVAL, StageProfiler
+    job = JOBS.get(job_id)
+    if job is None or job.status in FINISHED:
+        return jsonify({"ok": False, "error": "任务不存在或已结束"}), 400
+    payload = request.get_json(silent=True) or {}
     try:
-        limit = int(core.get("per_hour_limit") or 0)
-        delay = (3600 / limit) if limit > 0 else 0
-    except Exception:
-        delay = 0
+        seconds = float(payload.get("sample_seconds") or 0)
+        interval = float(payload.get("interval_ms") or SAMPLE_INTERVAL * 1000) / 1000
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "sample_seconds / interval_ms 应为数字"}), 400
+    prof = job.profiler
+    if prof is None or not prof.active:
+        prof = job.profiler = StageProfiler(job_id)
+    if seconds > 0:
+        prof.sample(seconds, interval)
+    return jsonify({"ok": True, **prof.report()})
+
+
+@app.route("/api/jobs/<int:job_id>/profile/stop", methods=["POST"])
+def api_job_profile_stop(job_id):
+    # 停止剖析（保留已收集的数据供下载）
+    job = JOBS.get(job_id)
+    if job is None or job.profiler is None:
+        return jsonify({"ok": False, "error": "该任务没有剖析数据"}), 404
+    job.profiler.stop()
+    return jsonify({"ok": True, **job.profiler.report()})
+
+
+@app.route("/api/jobs/<int:job_id>/profile", methods=["GET"])
+def api_job_profile(job_id):
+    # 剖析报告（JSON）；?download=1 时作为附件下载
+    import json
+    job = JOBS.get(job_id)
+    if job is None or job.profiler is None:
+        return jsonify({"ok": False, "error": "该任务没有剖析数据"}), 404
+    data = {"ok": True, **job.profiler.report()}
+    if request.args.get("download"):
+        return Response(
+            json.dumps(data, ensure_ascii=False, indent=2),
+            mimetype="application/json",
+            headers={"Content-Disposition": f"attachment; filename=profile-{job_id}.json"},
+        )
+    return jsonify(data)
 
-    def pick_subject(i: int):
-        if not subjects:
-            return ""
-        return subjects[(i - 1) % len(subjects)]
-    def pick_from(i: int):
-        froms = core.get("from_emails") or []
-        if froms:
-            return froms[(i - 1) % len(froms)]
-        return core.get("from_email")
-
-    def worker_all():
-        _clear_cancel_flag()
-        session = init_session(core.get("proxy") or "")
-        success = 0
-        total = len(to_list)
-        _update_progress({"mode": "all", "status": "running", "sent": 0, "success": 0, "total": total})
-        stopped = False
-        for i, addr in enumerate(to_list, start=1):
-            if _is_cancelled():
-                stopped = True
-                break
-            rendered = _render_body(html_body, addr, i)
-            subject_now = pick_subject(i)
-            ok = send_mail(
-                session,
-                core.get("server"),
-                core.get("key"),
-                core.get("from_name"),
-                pick_from(i),
-                addr,
-                subject_now,
-                rendered,
-            )
-            if ok:
-                success += 1
-            _update_progress({"mode": "all", "status": "running", "sent": i, "success": success, "total": total, "current_email": addr})
-            if delay > 0 and i < total:
-                if _sleep_with_cancel(delay):
-                    stopped = True
-                    break
-        status = "stopped" if stopped else "completed"
-        sent = i-1 if stopped else total
-        result = {"ok": True, "mode": "all", "success": success, "total": total, "status": status, "sent": sent}
-        with open(os.path.join(PROJECT_ROOT, "last_send_result.json"), "w", encoding="utf-8") as f:
-            import json
-            json.dump(result, f, ensure_ascii=False)
-        _update_progress({"mode": "all", "status": status, "sent": sent, "success": success, "total": total})
-
-    t = threading.Thread(target=worker_all, daemon=True)
-    t.start()
-    return jsonify({"ok": True, "task": "send_all", "recipients": len(to_list)})
+
+@app.route("/api/jobs/<int:job_id>/profile/stacks", methods=["GET"])
+def api_job_profile_stacks(job_id):
+    # 采样窗口的折叠栈（flamegraph.pl / speedscope 可直接读取）
+    job = JOBS.get(job_id)
+    sampler = job.profiler.sampler if job is not None and job.profiler is not None else None
+    if sampler is None:
+        return jsonify({"ok": False, "error": "该任务没有采样数据"}), 404
+    return Response(
+        sampler.folded(),
+        mimetype="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename=profile-{job_id}.folded"},
+    )
 
 
 @app.route("/api/recipients_info", methods=["GET"])
 def api_recipients_info():
-    ordered, _ = _read_recipients_file()
-    return jsonify({"total": len(ordered), "preview": ordered[:50]})
+    # 总数与各域名计数来自内存中增量维护的缓存，预览只读首页
+    from webapp import recipients
+    domains = recipients.domain_counts()
+    return jsonify({
+        "total": sum(n for _, n in domains),
+        "preview": [e for _, e in recipients.page(0, 50)],
+        "domains": [{"domain": d, "count": n} for d, n in domains[:20]],
+    })
+
+
+def _recipient_filters():
+    # ?domain= / ?status=active|suppressed / ?q=（子串搜索）；状态不合法时抛出 ValueError
+    from webapp import recipients
+    status = (request.args.get("status") or "").strip().lower() or None
+    if status and status not in recipients.STATUSES:
+        raise ValueError(f"status 仅支持 {', '.join(recipients.STATUSES)}")
+    return {
+        "domain": (request.args.get("domain") or "").strip() or None,
+        "status": status,
+        "q": (request.args.get("q") or "").strip() or None,
+    }
+
+
+# 分页接口每页条数上限
+RECIPIENTS_PAGE_MAX = 500
+
+
+@app.route("/api/recipients", methods=["GET"])
+def api_recipients():
+    # 游标分页与搜索：?after=<上一页的 next_cursor>&limit=&domain=&status=&q=
+    from webapp import recipients
+    try:
+        filters = _recipient_filters()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    limit = min(max(request.args.get("limit", 50, type=int) or 50, 1), RECIPIENTS_PAGE_MAX)
+    rows = recipients.query(request.args.get("after", 0, type=int) or 0, limit, **filters)
+    return jsonify({
+        "ok": True,
+        "items": [{"id": i, "email": e, "domain": d, "created_at": t} for i, e, d, t in rows],
+        "next_cursor": rows[-1][0] if len(rows) == limit else None,
+    })
+
+
+@app.route("/api/recipients/domains", methods=["GET"])
+def api_recipients_domains():
+    # 各域名的收件人数（降序）；?limit= 默认 100，0 为全部
+    from webapp import recipients
+    domains = recipients.domain_counts(max(request.args.get("limit", 100, type=int) or 0, 0))
+    return jsonify({"ok": True, "domains": [{"domain": d, "count": n} for d, n in domains]})
+
+
+# 导入任务进度记录在数据库中（多 worker 时任一进程都能查询），保留最近若干条
+_IMPORTS_KEEP = 20
+
+
+def _run_import(import_id: str, tmp_path: str, size: int):
+    from webapp import recipients
+    try:
+        with open(tmp_path, "rb") as f:
+            def on_batch(parsed, appended):
+                recipients.update_import(import_id, bytes_read=f.tell(), parsed=parsed, appended=appended, duplicates=parsed - appended)
+            res = recipients.add_stream(recipients.iter_tokens(f), on_batch=on_batch)
+        recipients.update_import(import_id, status="completed", bytes_read=size, **res)
+    except Exception as e:
+        recipients.update_import(import_id, status="failed", error=str(e))
+    finally:
+        try:
+            os.remove(tmp_path)
+        except Exception:
+            pass
+
+
+@app.route("/api/recipients_import", methods=["POST"])
+def api_recipients_import():
+    # 大文件导入：上传内容分块落到临时文件，后台线程按块解析、边解析边去重、分批写库
+    import shutil
+    import tempfile
+    import uuid
+    from webapp import recipients
+    upload = request.files.get("file")
+    src = upload.stream if upload is not None else request.stream
+    fd, tmp_path = tempfile.mkstemp(prefix="mailer-import-")
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(src, out, 1024 * 1024)
+    size = os.path.getsize(tmp_path)
+    if size == 0:
+        os.remove(tmp_path)
+        return jsonify({"ok": False, "error": "上传内容为空"}), 400
+
+    import_id = uuid.uuid4().hex[:12]
+    recipients.create_import(import_id, getattr(upload, "filename", "") or "", size, keep=_IMPORTS_KEEP)
+    t = threading.Thread(target=_run_import, args=(import_id, tmp_path, size), daemon=True)
+    t.start()
+    return jsonify({"ok": True, "import_id": import_id, "bytes": size})
+
+
+@app.route("/api/recipients_import/<import_id>", methods=["GET"])
+def api_recipients_import_status(import_id):
+    from webapp import recipients
+    state = recipients.get_import(import_id)
+    if state is None:
+        return jsonify({"ok": False, "error": "导入任务不存在"}), 404
+    return jsonify({"ok": True, **state})
 
 
 @app.route("/api/recipients_export", methods=["GET"])
 def api_recipients_export():
-    if not os.path.exists(RECIP_PATH):
-        return jsonify({"ok": False, "error": "recipients.txt 不存在"}), 404
-    return send_from_directory(PROJECT_ROOT, os.path.basename(RECIP_PATH), as_attachment=True)
+    # 分批流式导出：?format=txt（默认，与旧版 recipients.txt 相同）|csv，可按 domain / status / q 筛选
+    # ?gzip=1 下载 .gz 文件；否则客户端支持时以 Content-Encoding: gzip 传输（浏览器自动解压）
+    from webapp import recipients
+    try:
+        filters = _recipient_filters()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    fmt = "csv" if (request.args.get("format") or "").lower() == "csv" else "txt"
+    filename = f"recipients.{fmt}"
+    mimetype = "text/csv" if fmt == "csv" else "text/plain"
+    body = recipients.iter_export(fmt, **filters)
+    headers = {}
+    if request.args.get("gzip") in ("1", "true"):
+        body = recipients.gzip_chunks(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    elif "gzip" in (request.headers.get("Accept-Encoding") or ""):
+        body = recipients.gzip_chunks(body)
+        headers.update({"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    return Response(body, mimetype=mimetype, headers=headers)
 
 
 @app.route("/api/recipients_clear", methods=["POST"])
 def api_recipients_clear():
-    with open(RECIP_PATH, "w", encoding="utf-8") as f:
-        f.write("")
+    from webapp import recipients
+    recipients.clear()
+    return jsonify({"ok": True})
+
+
+@app.route("/api/validate", methods=["POST"])
+def api_validate():
+    # 只校验不发送：JSON {"recipients": 文本, "check_mx": bool} 或上传文件（字段 file）
+    from webapp import recipients
+    core = _load_core_settings()
+    upload = request.files.get("file")
+    if upload is not None:
+        payload = {k: request.form.get(k) == "true" for k in ("check_mx",) if k in request.form}
+        emails = recipients.iter_tokens(upload.stream)
+    else:
+        payload = request.get_json(silent=True) or {}
+        emails = _normalize_email_list(payload.get("recipients") or "")
+    payload.pop("validate", None)
+    validator = _validator(core, payload)
+    from webapp.validate import Report
+    report = Report()
+    for _ in validator.iter_valid(emails, report):
+        pass
+    return jsonify({"ok": True, **report.to_dict()})
+
+
+@app.route("/api/suppression", methods=["GET"])
+def api_suppression():
+    # 抑制列表概况：总数、按原因统计、前 50 条预览
+    from webapp import suppression
+    return jsonify({
+        "ok": True,
+        "total": suppression.count(),
+        "by_reason": suppression.counts_by_reason(),
+        "preview": [{"address": a, "reason": r, "created_at": t} for a, r, t in suppression.page("", 50)],
+    })
+
+
+@app.route("/api/suppression/import", methods=["POST"])
+def api_suppression_import():
+    # 导入：JSON {"entries": 文本, "reason": ...}，或上传文件（字段 file，可带表单字段 reason）
+    # 条目为邮箱地址，或 "@domain" 表示整域
+    from webapp import recipients, suppression
+    upload = request.files.get("file")
+    if upload is not None:
+        reason = (request.form.get("reason") or "manual").strip()
+        entries = recipients.iter_tokens(upload.stream)
+    else:
+        payload = request.get_json(silent=True) or {}
+        reason = (payload.get("reason") or "manual").strip()
+        entries = _normalize_email_list(payload.get("entries") or "")
+    if reason not in suppression.REASONS:
+        return jsonify({"ok": False, "error": f"reason 仅支持 {', '.join(suppression.REASONS)}"}), 400
+    return jsonify({"ok": True, **suppression.add_many(entries, reason)})
+
+
+@app.route("/api/suppression/remove", methods=["POST"])
+def api_suppression_remove():
+    from webapp import suppression
+    payload = request.get_json(silent=True) or {}
+    removed = suppression.remove_many(_normalize_email_list(payload.get("entries") or ""))
+    return jsonify({"ok": True, "removed": removed, "total": suppression.count()})
+
+
+@app.route("/api/suppression/export", methods=["GET"])
+def api_suppression_export():
+    # CSV 流式导出：address,reason,created_at
+    from webapp import suppression
+
+    def gen():
+        yield "address,reason,created_at\n"
+        for address, reason, created_at in suppression.iter_rows():
+            yield f"{address},{reason},{created_at}\n"
+
+    return Response(gen(), mimetype="text/csv", headers={"Content-Disposition": "attachment; filename=suppression.csv"})
+
+
+@app.route("/api/webhooks/postal", methods=["POST"])
+def api_webhook_postal():
+    # 只入内存队列，立即返回；解析与写库在后台线程批量完成
+    from webapp.deliveries import INGESTOR
+    token = request.args.get("token") or request.headers.get("X-Mailer-Token") or ""
+    if not WEBHOOK_TOKEN or not secrets.compare_digest(token, WEBHOOK_TOKEN):
+        return Response(status=403)
+    body = request.get_json(silent=True, force=True)
+    if body is None:
+        return jsonify({"ok": False, "error": "无效的 JSON"}), 400
+    if not INGESTOR.submit_event(body):
+        # 队列已满：让 Postal 稍后重投
+        return Response(status=503, headers={"Retry-After": "30"})
     return jsonify({"ok": True})
 
 
+@app.route("/api/deliveries", methods=["GET"])
+def api_deliveries():
+    # ?campaign_id= 返回该任务各投递状态的数量；?message_id= / ?token= / ?trace= 查询单条记录
+    from webapp import deliveries
+    out = {"ok": True, "queue": deliveries.INGESTOR.pending(), "stats": dict(deliveries.INGESTOR.stats)}
+    cid = request.args.get("campaign_id", type=int)
+    if cid is not None:
+        out["counts"] = deliveries.campaign_counts(cid)
+    if any(request.args.get(k) for k in ("message_id", "token", "trace")):
+        out["records"] = deliveries.lookup(
+            request.args.get("message_id", type=int), request.args.get("token"), request.args.get("trace")
+        )
+    return jsonify(out)
+
+
+@app.route("/t/o/<int:campaign_id>/<trace>.gif", methods=["GET"])
+def track_open(campaign_id, trace):
+    # 打开追踪像素：只计已登记且属于该任务的 trace，在内存中计数，由后台线程批量写库
+    from webapp.tracking import PIXEL, TRACKER
+    TRACKER.hit(campaign_id, trace[:64], "open")
+    return Response(PIXEL, mimetype="image/gif", headers={"Cache-Control": "no-store, max-age=0"})
+
+
+@app.route("/t/c/<int:campaign_id>/<int:link_no>/<trace>", methods=["GET"])
+def track_click(campaign_id, link_no, trace):
+    # 点击跳转：目标地址来自任务启动时登记的链接表，不接受 URL 参数（避免开放重定向）
+    from flask import redirect
+    from webapp.tracking import TRACKER
+    url = TRACKER.link(campaign_id, link_no)
+    if url is None:
+        return Response("not found", status=404)
+    TRACKER.hit(campaign_id, trace[:64], "click")
+    return redirect(url, code=302)
+
+
+@app.route("/api/tracking/<int:campaign_id>", methods=["GET"])
+def api_tracking(campaign_id):
+    # 某个任务按 (主题, 发件邮箱) 汇总的打开率 / 点击率
+    from webapp.tracking import TRACKER, campaign_stats
+    TRACKER.flush()
+    return jsonify({"ok": True, **campaign_stats(campaign_id)})
+
+
+@app.route("/api/metrics", methods=["GET"])
+def api_metrics():
+    # Prometheus 文本格式；与其它接口一样受 Basic 认证保护
+    from webapp.metrics import REGISTRY
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.route("/api/progress", methods=["GET"])
 def api_progress():
-    if not os.path.exists(PROGRESS_PATH):
-        return jsonify({"status": "idle"})
+    # 内存快照，无文件读取；集群模式下从数据库汇总所有 worker 的进度
+    from webapp import cluster
+    if cluster.ENABLED:
+        return jsonify(cluster.progress_snapshot())
+    return jsonify(_PROGRESS.snapshot())
+
+
+@app.route("/api/progress/stream", methods=["GET"])
+def api_progress_stream():
+    # Server-Sent Events：进度变化时推送最新快照（最多每 0.25 秒一次），空闲时每 15 秒发心跳
     import json
-    with open(PROGRESS_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return jsonify(data)
+    from webapp import cluster
+
+    def gen_cluster():
+        # 集群模式：进度分散在多个 worker，按秒轮询数据库汇总，变化时推送
+        last, idle = None, 0.0
+        while True:
+            data = cluster.progress_snapshot()
+            if data != last:
+                last, idle = data, 0.0
+                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            elif idle >= 15:
+                idle = 0.0
+                yield ": ping\n\n"
+            time.sleep(1.0)
+            idle += 1.0
+
+    def gen():
+        version = -1
+        while True:
+            version, data = _PROGRESS.wait(version, timeout=15)
+            if data is None:
+                yield ": ping\n\n"
+                continue
+            yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+            time.sleep(0.25)
+
+    return Response(gen_cluster() if cluster.ENABLED else gen(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route("/api/stop", methods=["POST"]) 
 def api_stop():
-    _set_cancel_flag()
+    # 取消指定任务（job_id），未指定则取消全部运行中的任务
+    payload = request.get_json(silent=True) or {}
+    job_id = payload.get("job_id")
+    from webapp import cluster
+    if job_id:
+        stopped = 1 if JOBS.cancel(int(job_id)) else 0
+        if cluster.ENABLED:
+            stopped = max(stopped, cluster.stop_campaigns(int(job_id)))
+    else:
+        stopped = JOBS.cancel_all()
+        if cluster.ENABLED:
+            stopped = max(stopped, cluster.stop_campaigns())
     # 标记状态为 stopping，前端立刻可见
-    try:
-        import json
-        if os.path.exists(PROGRESS_PATH):
-            with open(PROGRESS_PATH, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        else:
-            data = {"status": "idle"}
-        data["status"] = "stopping"
-        with open(PROGRESS_PATH, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False)
-    except Exception:
-        pass
-    return jsonify({"ok": True})
+    _PROGRESS.patch(status="stopping")
+    return jsonify({"ok": True, "stopped": stopped})
 
 
 @app.route("/api/body_template", methods=["GET"])
@@ -560,5 +1310,52 @@ def api_body_template():
     return jsonify({"ok": True, "html": content})
 
 
+def _mark_interrupted_campaigns():
+    # 进程（gunicorn worker）重启后，上次遗留的 running 任务已无线程执行，标记为可续发
+    # 集群模式下不标记：其它 worker 可能仍在发送，崩溃 worker 的分片在租约过期后由轮询线程接手
+    try:
+        from webapp import cluster, jobstore
+        if cluster.ENABLED:
+            return
+        jobstore.mark_interrupted()
+    except Exception as e:
+        print(f"⚠️ 无法检查未完成任务：{e}")
+
+
+_mark_interrupted_campaigns()
+
+
+# 集群模式下每个 worker 检查有可认领分片的运行中任务的间隔（秒）
+CLUSTER_POLL_INTERVAL = 5.0
+
+
+def _cluster_runner():
+    # 集群模式：发现其它 worker 创建或释放的任务分片并在本进程启动发送（同一任务本进程只运行一个）
+    from webapp import cluster
+    while True:
+        time.sleep(CLUSTER_POLL_INTERVAL)
+        try:
+            # 持有租约的 worker 已退出的 stopping 任务改为 stopped，之后可续发
+            cluster.finalize_stopping()
+            for cid, mode in cluster.running_campaigns():
+                job = JOBS.get(cid)
+                if job is not None and job.status not in FINISHED:
+                    continue
+                cluster.ensure_chunks(cid)
+                if cluster.has_claimable(cid):
+                    _start_send_job(cid, mode, _load_core_settings())
+        except Exception as e:
+            print(f"⚠️ 集群任务轮询失败：{e}")
+
+
+def _start_cluster_runner():
+    from webapp import cluster
+    if cluster.ENABLED:
+        threading.Thread(target=_cluster_runner, daemon=True, name="mailer-cluster-runner").start()
+
+
+_start_cluster_runner()
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=6253)
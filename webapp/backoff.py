@@ -0,0 +1,230 @@
+"""任务级自适应退避：AIMD 调速 + 全局 Retry-After + 熔断
+
+原先 urllib3 Retry(total=5) 与逐封发送自身的 4 次 sleep 重试叠加，一个收件人可能触发约 20 次请求，
+期间其它收件人仍在持续冲击已过载的服务器。这里改为所有发送共享一个控制器：
+
+- 429：速率乘性下降（短时间内多次只降一次）；近期 429 占比较高时 Retry-After 对所有发送生效，
+  偶发的 429 只让该收件人按 Retry-After 延后重试
+- 5xx / 网络错误：只计入熔断；近期窗口内错误占比超过阈值（服务器整体过载）时才降速，偶发错误不影响吞吐
+- 成功：速率按当前速率的比例回升（至少 increase_per_sec），回到上限后不再限制
+- 连续失败达到阈值：熔断（open），暂停派发一段时间后进入半开（half_open）以最低速率试探，成功即恢复
+- 失败的收件人不在发送线程里 sleep 重试，而是交回引擎的重试队列，按 retry_delay() 延后再发
+"""
+import random
+import threading
+import time
+from collections import deque
+
+from webapp.engine import TokenBucket, wait_or_cancel
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class AdaptiveController:
+    def __init__(
+        self,
+        min_rate: float = 0.2,
+        max_rate: float = 500.0,
+        increase_per_sec: float = 0.5,
+        increase_ratio: float = 0.2,
+        decrease_factor: float = 0.7,
+        decrease_cooldown: float = 2.0,
+        window: float = 10.0,
+        min_samples: int = 20,
+        error_ratio: float = 0.2,
+        throttle_pause_ratio: float = 0.1,
+        default_retry_after: float = 10.0,
+        max_retry_after: float = 300.0,
+        breaker_threshold: int = 20,
+        breaker_cooldown: float = 60.0,
+        max_attempts: int = 4,
+        clock=time.monotonic,
+    ):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_per_sec = increase_per_sec
+        self.increase_ratio = increase_ratio
+        self.window = window
+        self.min_samples = min_samples
+        self.error_ratio = error_ratio
+        self.throttle_pause_ratio = throttle_pause_ratio
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.default_retry_after = default_retry_after
+        self.max_retry_after = max_retry_after
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.max_attempts = max_attempts
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self.rate = None  # 每秒条数；None 表示未触发拥塞、不额外限速
+        self._bucket = TokenBucket(0)
+        self._last_increase = clock()
+        self._last_decrease = 0.0
+        self._pause_until = 0.0
+        self.state = CLOSED
+        self._open_until = 0.0
+        self._consecutive_failures = 0
+        self._recent_ok = deque(maxlen=200)
+        # 最近 window 秒的结果：(时间, 类型)，类型为 ok / throttled / error
+        self._outcomes = deque()
+        self._counts = {"ok": 0, "throttled": 0, "error": 0}
+        self.stats = {"throttled": 0, "server_errors": 0, "network_errors": 0, "breaker_trips": 0}
+
+    # —— 派发前 ——
+    def pause_remaining(self) -> float:
+        with self._lock:
+            now = self.clock()
+            until = max(self._pause_until, self._open_until if self.state == OPEN else 0.0)
+            if self.state == OPEN and now >= self._open_until:
+                # 冷却结束，半开试探：以最低速率放行
+                self.state = HALF_OPEN
+                self._set_rate_locked(self.min_rate)
+                self._last_increase = now
+            return max(0.0, until - now)
+
+    def ready_in(self) -> float:
+        """距离允许下一次发送的秒数（Retry-After / 熔断 / AIMD 速率），只查看不占用"""
+        return max(self.pause_remaining(), self._bucket.delay())
+
+    def before_send(self, is_cancelled=None) -> bool:
+        """阻塞到允许发送（Retry-After / 熔断 / AIMD 速率）；被取消返回 False"""
+        while True:
+            wait = self.pause_remaining()
+            if wait <= 0:
+                break
+            if wait_or_cancel(min(wait, 5.0), is_cancelled):
+                return False
+        return self._bucket.acquire(is_cancelled)
+
+    # —— 结果反馈 ——
+    def on_success(self):
+        with self._lock:
+            now = self.clock()
+            self._recent_ok.append(now)
+            self._record_locked(now, "ok")
+            self._consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+            if self.rate is not None:
+                step = max(self.increase_per_sec, self.rate * self.increase_ratio)
+                self._set_rate_locked(self.rate + step * (now - self._last_increase))
+            self._last_increase = now
+
+    def on_throttled(self, retry_after=None):
+        with self._lock:
+            self.stats["throttled"] += 1
+            now = self.clock()
+            self._record_locked(now, "throttled")
+            if self._ratio_locked("throttled") >= self.throttle_pause_ratio:
+                self._pause_until = max(self._pause_until, now + self._parse_retry_after(retry_after))
+            self._decrease_locked()
+
+    def on_server_error(self):
+        with self._lock:
+            self.stats["server_errors"] += 1
+            self._error_locked()
+
+    def on_network_error(self):
+        with self._lock:
+            self.stats["network_errors"] += 1
+            self._error_locked()
+
+    def retry_delay(self, attempt: int, retry_after=None):
+        """第 attempt 次尝试失败后再次入队的延迟；超过最大次数返回 None（记为失败）"""
+        if attempt >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            return self._parse_retry_after(retry_after)
+        return min(60.0, 2.0 ** attempt) * (0.5 + random.random())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "rate_per_sec": round(self.rate, 3) if self.rate is not None else None,
+                "paused_for": round(max(0.0, max(self._pause_until, self._open_until if self.state == OPEN else 0.0) - self.clock()), 1),
+                **self.stats,
+            }
+
+    # —— 内部 ——
+    def _parse_retry_after(self, retry_after) -> float:
+        try:
+            wait = float(retry_after)
+        except (TypeError, ValueError):
+            wait = self.default_retry_after
+        return max(1.0, min(wait, self.max_retry_after))
+
+    def _observed_rate_locked(self) -> float:
+        if len(self._recent_ok) < 2:
+            return 1.0
+        span = self._recent_ok[-1] - self._recent_ok[0]
+        return (len(self._recent_ok) - 1) / span if span > 0 else float(len(self._recent_ok))
+
+    def _record_locked(self, now, kind):
+        self._outcomes.append((now, kind))
+        self._counts[kind] += 1
+        while self._outcomes and (now - self._outcomes[0][0] > self.window or len(self._outcomes) > 5000):
+            self._counts[self._outcomes.popleft()[1]] -= 1
+
+    def _ratio_locked(self, kind) -> float:
+        """近期窗口内某类结果的占比；样本不足 min_samples 时按 0 计（偶发错误不触发）"""
+        n = len(self._outcomes)
+        return self._counts[kind] / n if n >= self.min_samples else 0.0
+
+    def _error_locked(self):
+        self._record_locked(self.clock(), "error")
+        if self._ratio_locked("error") >= self.error_ratio:
+            self._decrease_locked()
+        self._failure_locked()
+
+    def _decrease_locked(self):
+        now = self.clock()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        current = self.rate if self.rate is not None else self._observed_rate_locked()
+        self._set_rate_locked(current * self.decrease_factor)
+        self._last_increase = now
+
+    def _failure_locked(self):
+        self._consecutive_failures += 1
+        if self.state == HALF_OPEN or self._consecutive_failures >= self.breaker_threshold:
+            if self.state != OPEN:
+                self.stats["breaker_trips"] += 1
+                print(f"⛔ 连续失败 {self._consecutive_failures} 次，熔断 {int(self.breaker_cooldown)}s")
+            self.state = OPEN
+            self._open_until = self.clock() + self.breaker_cooldown
+
+    def _set_rate_locked(self, rate: float):
+        rate = max(self.min_rate, rate)
+        if rate >= self.max_rate:
+            self.rate = None
+            self._bucket.set_rate(0)
+        else:
+            self.rate = rate
+            self._bucket.set_rate(rate * 3600)
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def controller_for(server: str) -> AdaptiveController:
+    """同一 Postal 服务器的所有任务共享一个控制器"""
+    key = (server or "").rstrip("/")
+    with _controllers_lock:
+        c = _controllers.get(key)
+        if c is None:
+            c = _controllers[key] = AdaptiveController()
+        return c
+
+
+def snapshots() -> dict:
+    """各 Postal 服务器控制器的当前状态"""
+    with _controllers_lock:
+        items = list(_controllers.items())
+    return {server: c.snapshot() for server, c in items}
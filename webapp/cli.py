@@ -0,0 +1,545 @@
+"""命令行发送：不启动 Web 服务，直接在服务器上运行与 Web 相同的发送任务（适合 cron / systemd）
+
+用法：python send_email_postal_excel.py [--excel [PATH] | --file PATH | --stored | --resume [ID]]
+                                       [--concurrency N] [--rate N] [--dry-run] [--output PATH] [--format csv|jsonl]
+
+- 收件人来源：Excel / CSV 表（每行自带内容与个性化字段）、收件人文件（每行一个或逗号 / 分号分隔）、收件人库
+- 与 Web 任务共用发送引擎、Postal 服务器池、自适应退避、抑制列表、发送前校验、配额调度（webapp.pipeline）与 jobstore：任务写入同一数据库，
+  可在 Web 中查看；中断（Ctrl-C / SIGTERM / 进程被杀）后用 --resume 从 pending 收件人续发
+- 进度条（tqdm）显示速率与预计剩余时间；非终端（cron / systemd）下改为每 --log-interval 秒输出一行
+- 每个收件人的结果写入 --output（csv 或 jsonl），续发时追加到同一文件
+- --dry-run 只读取与渲染，不调用 Postal、不写数据库
+- 退出码：0 完成，1 参数 / 配置错误，130 被中断（可续发）
+"""
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from webapp.db import PROJECT_ROOT
+
+CONFIG_PATH = os.path.join(PROJECT_ROOT, "config.toml")
+BODY_PATH = os.path.join(PROJECT_ROOT, "body_template.html")
+
+# 非终端下输出进度行的默认间隔（秒）
+LOG_INTERVAL = 30.0
+# 结束时等待投递登记（message id / trace）写库的最长时间
+DRAIN_TIMEOUT = 10.0
+
+RESULT_FIELDS = ("index", "email", "status", "kind", "error", "server", "attempts", "message_id", "time")
+
+
+class CliError(Exception):
+    pass
+
+
+def _parser():
+    p = argparse.ArgumentParser(
+        prog="send_email_postal_excel.py",
+        description="不启动 Web 服务直接发送（Excel / 收件人文件 / 收件人库），任务可在 Web 中查看并续发",
+    )
+    src = p.add_mutually_exclusive_group()
+    src.add_argument("--excel", nargs="?", const="", metavar="PATH", help="Excel / CSV 表（默认 setting.excel_file）；未指定来源时的默认值")
+    src.add_argument("--file", metavar="PATH", help="收件人文件，每行一个或逗号 / 分号分隔，内容取 --body")
+    src.add_argument("--stored", action="store_true", help="发送给收件人库（Web 中累积保存的列表），内容取 --body")
+    src.add_argument("--resume", nargs="?", const=0, type=int, metavar="ID", help="续发未完成的任务（默认最近一个）")
+    p.add_argument("--config", default=CONFIG_PATH, help="配置文件（默认项目根目录 config.toml）")
+    p.add_argument("--body", metavar="PATH", help=f"邮件 HTML 模板（默认 {os.path.basename(BODY_PATH)}）")
+    p.add_argument("--subject", help="本次统一使用的主题（默认按 setting.subjects 轮询）")
+    p.add_argument("--concurrency", type=int, help="同时在途的 Postal 请求数（默认 setting.concurrency）")
+    p.add_argument("--rate", type=int, help="每小时上限（默认 setting.per_hour_limit，Excel 表未配置时为 setting.limit×60；0 为不限）")
+    p.add_argument("--no-dedupe", action="store_true", help="收件人文件不去重（默认按 setting.dedupe_rules 去重）")
+    p.add_argument("--no-validate", action="store_true", help="收件人文件 / 收件人库不做发送前校验（默认与 Web 相同）")
+    p.add_argument("--check-mx", action="store_true", help="校验时查询 MX（默认取 setting.validate_mx）")
+    p.add_argument("--dry-run", action="store_true", help="只读取与渲染，不发送、不写数据库")
+    p.add_argument("--output", metavar="PATH", help="逐个收件人的结果文件（默认 send_result_<任务ID>.<格式>）")
+    p.add_argument("--format", choices=("csv", "jsonl"), default="csv", help="结果文件格式（默认 csv）")
+    p.add_argument("--quiet", action="store_true", help="不显示进度")
+    p.add_argument("--log-interval", type=float, default=LOG_INTERVAL, help="非终端下输出进度行的间隔秒数")
+    return p
+
+
+class ResultWriter:
+    """逐个收件人的结果（csv / jsonl），追加写入；on_done 在引擎的锁内调用，无需另加锁"""
+
+    def __init__(self, path: str, fmt: str = "csv"):
+        self.path = path
+        self.fmt = fmt
+        fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.writer(self._f)
+            if fresh:
+                self._csv.writerow(RESULT_FIELDS)
+
+    def write(self, idx, email, status, res=None, server="", attempts=1):
+        message = (getattr(res, "messages", None) or {}).get(email)
+        row = (
+            idx,
+            email,
+            status,
+            getattr(res, "kind", "") or "",
+            getattr(res, "error", "") or "",
+            server or "",
+            attempts,
+            message[0] if message else "",
+            int(time.time()),
+        )
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._f.write(json.dumps(dict(zip(RESULT_FIELDS, row)), ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._f.close()
+
+
+class Progress:
+    """终端下为 tqdm 进度条（速率 / 预计剩余时间）；非终端下按间隔输出进度行"""
+
+    def __init__(self, total, initial=0, quiet=False, log_interval=LOG_INTERVAL):
+        self.total = total
+        self.done = initial
+        self.ok = 0
+        self.failed = 0
+        self.skipped = 0
+        self.quiet = quiet
+        self.log_interval = log_interval
+        self._t0 = time.monotonic()
+        self._last_log = self._t0
+        self._bar = None
+        if not quiet and sys.stderr.isatty():
+            from tqdm import tqdm
+            self._bar = tqdm(total=total, initial=initial, unit="封", dynamic_ncols=True, smoothing=0.05)
+
+    def update(self, n=1, ok=0, failed=0, skipped=0):
+        self.done += n
+        self.ok += ok
+        self.failed += failed
+        self.skipped += skipped
+        if self._bar is not None:
+            self._bar.update(n)
+            self._bar.set_postfix(成功=self.ok, 失败=self.failed, 跳过=self.skipped, refresh=False)
+        elif not self.quiet:
+            now = time.monotonic()
+            if now - self._last_log >= self.log_interval:
+                self._last_log = now
+                print(self.line(now), flush=True)
+
+    def line(self, now=None) -> str:
+        elapsed = (now or time.monotonic()) - self._t0
+        processed = self.ok + self.failed + self.skipped
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        total = f"/{self.total}" if self.total else ""
+        eta = ""
+        if self.total and rate > 0:
+            eta = f"，预计剩余 {int(max(0, self.total - self.done) / rate)}s"
+        return f"⏳ 已处理 {self.done}{total}（成功 {self.ok}，失败 {self.failed}，跳过 {self.skipped}），{rate:.1f} 封/秒{eta}"
+
+    def close(self):
+        if self._bar is not None:
+            self._bar.close()
+
+
+def _read_body(path):
+    path = path or BODY_PATH
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            body = f.read()
+    except FileNotFoundError:
+        raise CliError(f"未找到邮件模板：{path}（用 --body 指定）")
+    if not body.strip():
+        raise CliError(f"邮件模板为空：{path}")
+    return body
+
+
+def _open_excel(raw_setting, path):
+    from webapp.rowsource import RowFormatError, open_rows
+    path = path or raw_setting.get("excel_file") or ""
+    if not path:
+        raise CliError("未指定 Excel 文件（--excel PATH 或 setting.excel_file）")
+    try:
+        return open_rows(
+            path,
+            email_column=raw_setting.get("email_column"),
+            body_column=raw_setting.get("body_column"),
+            sheet=raw_setting.get("sheet") or None,
+        )
+    except FileNotFoundError:
+        raise CliError(f"Excel 文件 {path} 未找到")
+    except RowFormatError as e:
+        raise CliError(str(e))
+
+
+def _excel_items(rows, pending):
+    """按 idx 合并 Excel 行与 pending 快照（两者都按原顺序），产出 (idx, email, row)；文件被改动时报错"""
+    pending = iter(pending)
+    nxt = next(pending, None)
+    for row in rows:
+        if nxt is None:
+            return
+        if row.index < nxt[0]:
+            continue
+        if row.index > nxt[0] or row.email != nxt[1]:
+            raise CliError(f"Excel 第 {nxt[0]} 行与任务快照不一致（文件在任务创建后被修改？）")
+        yield row.index, row.email, None, row
+        nxt = next(pending, None)
+
+
+def _file_emails(path, rules):
+    from webapp import recipients
+    if not os.path.exists(path):
+        raise CliError(f"收件人文件 {path} 未找到")
+
+    def read():
+        with open(path, "rb") as f:
+            yield from recipients.iter_tokens(f)
+
+    if rules is None:
+        return read(), None
+    from webapp.dedupe import dedupe_iter
+    source, stats = dedupe_iter(read, rules)
+    return source, stats
+
+
+def _stored_emails(rules):
+    from webapp import recipients
+    from webapp.dedupe import DEFAULT_RULES, dedupe_iter
+    if not recipients.count():
+        raise CliError("收件人库为空")
+    if rules is None or tuple(rules) == DEFAULT_RULES:
+        # 收件人库已按小写地址唯一
+        return recipients.iter_emails(), None
+    return dedupe_iter(recipients.iter_emails, rules)
+
+
+def rate_for(args, core, mode) -> int:
+    """本次发送的每小时上限：--rate 优先；Excel 表与 send_from_config 相同，setting.limit 按每分钟计"""
+    if args.rate is not None:
+        return args.rate
+    return core.excel_per_hour if mode == "excel" else core.per_hour_limit
+
+
+def run(args) -> int:
+    from webapp import jobstore
+    from webapp.deliveries import INGESTOR
+    from webapp.engine import TokenBucket, group_batches, run_campaign
+    from webapp.pipeline import new_trace, render_body, schedule_quotas, skip_suppressed, validator_for
+    from webapp.postal import SendResult, init_session, send_batch_once, send_mail_once
+    from webapp.settings import SettingsError, store_for
+    from webapp.template import compile_template
+
+    store = store_for(os.path.abspath(args.config))
+    if not os.path.exists(store.path):
+        raise CliError(f"未找到配置文件：{store.path}")
+    try:
+        core = store.current()
+    except SettingsError as e:
+        raise CliError(f"配置有误：{'；'.join(e.errors)}")
+    raw_setting = store.raw().get("setting") or {}
+    concurrency = args.concurrency if args.concurrency is not None else core.concurrency
+    rules = None if args.no_dedupe else core.dedupe_rules
+    overrides = {"validate": False} if args.no_validate else ({"check_mx": True} if args.check_mx else {})
+
+    # ---- 确定任务：续发已有任务，或从来源创建新任务（dry-run 只遍历来源） ----
+    cid = None
+    excel = None
+    dedupe = None
+    report = None
+    total = None
+    if args.resume is not None:
+        cid = args.resume or jobstore.latest_unfinished()
+        camp = jobstore.get_campaign(cid) if cid else None
+        if not camp:
+            raise CliError("没有可续发的任务" if not args.resume else f"任务 {args.resume} 不存在")
+        if camp["status"] not in jobstore.UNFINISHED:
+            raise CliError(f"任务 {cid} 状态为 {camp['status']}，无需续发")
+        if camp["status"] == "running":
+            print(f"⚠️ 任务 {cid} 状态为 running：请确认没有其它进程（Web 或命令行）正在发送它")
+        mode, subjects, body = camp["mode"], camp["subjects"], camp["html_body"]
+        if mode == "excel":
+            excel = _open_excel(raw_setting, args.excel)
+        counts = jobstore.counts(cid)
+        total = counts["total"]
+        initial = total - counts[jobstore.PENDING]
+        if not counts[jobstore.PENDING]:
+            raise CliError(f"任务 {cid} 没有待发送的收件人")
+        if not args.dry_run:
+            jobstore.set_status(cid, "running")
+    else:
+        subjects = [args.subject] if args.subject else list(core.subjects)
+        if not subjects:
+            raise CliError("主题(subjects)不能为空（在配置中提供或使用 --subject）")
+        initial = 0
+        if args.file:
+            mode, body = "list", _read_body(args.body)
+            source, dedupe = _file_emails(args.file, rules)
+        elif args.stored:
+            from webapp import recipients
+            mode, body = "all", _read_body(args.body)
+            source, dedupe = _stored_emails(rules)
+            total = recipients.count() if dedupe is None else None
+        if args.file or args.stored:
+            # 与 /api/send_list、/api/send_all 相同的发送前校验（边读边校验）
+            validator = validator_for(core, overrides)
+            if validator is not None:
+                from webapp.validate import Report
+                report = Report()
+                source = validator.iter_valid(source, report)
+                total = None
+        else:
+            mode, body = "excel", ""
+            excel = _open_excel(raw_setting, args.excel)
+            total = excel.total
+            source = (r.email for r in excel)
+        if not args.dry_run:
+            cid = jobstore.create_campaign(mode, source, subjects, body)
+            if excel is not None:
+                # Excel 读两遍：先写入收件人快照（续发依据），再逐行读取内容发送
+                excel = _open_excel(raw_setting, args.excel)
+            total = jobstore.get_campaign(cid)["total"]
+            if not total:
+                jobstore.set_status(cid, "completed")
+                raise CliError("没有可发送的收件人")
+
+    per_hour = rate_for(args, core, mode)
+
+    if cid is None:
+        # dry-run 的新任务：直接遍历来源
+        if excel is not None:
+            items = ((r.index, r.email, None, r) for r in excel)
+        else:
+            items = ((i, e, None, None) for i, e in enumerate(source, 1))
+    elif excel is not None:
+        items = _excel_items(excel, jobstore.iter_pending(cid))
+    else:
+        items = ((i, e, None, None) for i, e in jobstore.iter_pending(cid))
+
+    output = args.output or os.path.join(
+        PROJECT_ROOT, f"send_result_{cid if cid is not None else 'dry_run'}.{args.format}"
+    )
+    results = ResultWriter(output, args.format)
+    tpl = compile_template(body) if body else None
+    batched = core.batch_size > 1 and tpl is not None and tpl.is_static and excel is None
+
+    def pick_subject(i):
+        return subjects[(i - 1) % len(subjects)] if subjects else ""
+
+    def pick_from(i):
+        froms = core.from_emails
+        return froms[(i - 1) % len(froms)] if froms else core.from_email
+
+    # ---- 发送：服务器池选择 + 每线程每服务器一个会话，与 Web 任务相同 ----
+    from webapp.pool import pool_for
+    pool = pool_for(core.servers)
+    controller = pool.primary.controller
+    local = threading.local()
+    # 派发线程在 gate 中选好服务器并占用名额，发送线程按先进先出取用
+    routed = deque()
+    served = {}
+    attempts = {}
+
+    def get_session(server):
+        sessions = getattr(local, "sessions", None)
+        if sessions is None:
+            sessions = local.sessions = {}
+        s = sessions.get(server.name)
+        if s is None:
+            s = sessions[server.name] = init_session(core.proxy)
+        return s
+
+    def gate(is_cancelled, n):
+        server = pool.acquire(is_cancelled, n)
+        if server is None:
+            return False
+        routed.append(server)
+        return True
+
+    def post(key, fn, to, from_email, subject, render):
+        # 先取出 gate 选好的服务器再渲染：渲染出错（模板 / 缺列）时同样在 finally 中释放名额
+        server = routed.popleft()
+        served[key] = server.name
+        res = None
+        try:
+            rendered = render()
+            res = fn(get_session(server), server.url, server.key, core.from_name, from_email, to, subject, rendered)
+            return res
+        finally:
+            pool.release(server, res)
+
+    def send_one(i, addr, from_email, row):
+        # 与 Web 任务相同的渲染（占位符与 trace 注释）；Excel 行使用该行自己的内容与个性化字段
+        trace = new_trace()
+
+        def render():
+            if row is not None:
+                return render_body(row.body, addr, i, row.fields, trace=trace)
+            return render_body(tpl, addr, i, trace=trace)
+
+        from_email = from_email or pick_from(i)
+        if args.dry_run:
+            render()
+            return SendResult(True, "dry_run", 0, False, None, "", None)
+        res = post(i, send_mail_once, addr, from_email, pick_subject(i), render)
+        if res.ok and cid is not None:
+            INGESTOR.record_sent(cid, i, res.messages, trace)
+        return res
+
+    def send_group(idxs, addrs, from_email, subject):
+        trace = new_trace()
+
+        def render():
+            return render_body(tpl, addrs[0], idxs[0], trace=trace)
+
+        if args.dry_run:
+            render()
+            return SendResult(True, "dry_run", 0, False, None, "", {a: True for a in addrs})
+        res = post(idxs[0], send_batch_once, addrs, from_email, subject, render)
+        if res.ok and cid is not None:
+            INGESTOR.record_sent(cid, {a.strip().lower(): i for i, a in zip(idxs, addrs)}, res.messages, trace)
+        return res
+
+    def retry(item, res, attempt):
+        if getattr(res, "retryable", False):
+            delay = controller.retry_delay(attempt, res.retry_after)
+            if delay is not None:
+                attempts[item[0] if not batched else item[0][0]] = attempt + 1
+            return delay
+        return None
+
+    writer = jobstore.StateWriter(cid) if cid is not None and not args.dry_run else None
+    progress = Progress(total, initial, args.quiet, args.log_interval)
+
+    def state_of(ok):
+        if args.dry_run:
+            return "dry_run"
+        return jobstore.SENT if ok else jobstore.FAILED
+
+    def on_done(item, res):
+        i, addr = item[0], item[1]
+        ok = bool(getattr(res, "ok", False))
+        if writer is not None:
+            writer.record(i, ok)
+        results.write(i, addr, state_of(ok), res, served.pop(i, ""), attempts.pop(i, 1))
+        progress.update(1, ok=int(ok), failed=int(not ok))
+
+    def on_group_done(item, res):
+        idxs, addrs = item[0], item[1]
+        accepted = (getattr(res, "recipients", None) or {}) if getattr(res, "ok", False) else {}
+        server, tries = served.pop(idxs[0], ""), attempts.pop(idxs[0], 1)
+        n_ok = 0
+        for i, addr in zip(idxs, addrs):
+            ok = bool(accepted.get(addr))
+            n_ok += ok
+            if writer is not None:
+                writer.record(i, ok)
+            results.write(i, addr, state_of(ok), res, server, tries)
+        progress.update(len(addrs), ok=n_ok, failed=len(addrs) - n_ok)
+
+    def on_suppressed(item):
+        if writer is not None:
+            writer.record_state(item[0], jobstore.SKIPPED)
+        results.write(item[0], item[1], jobstore.SKIPPED, None, "", 0)
+        progress.update(1, skipped=1)
+
+    stop = threading.Event()
+
+    def schedule(items):
+        # 配额调度（与 Web 任务相同）只处理 (i, addr)，Excel 行在调度窗口内暂存并按 i 取回
+        if not core.quotas:
+            return items
+        rows = {}
+
+        def pairs():
+            for i, addr, _, row in items:
+                if row is not None:
+                    rows[i] = row
+                yield i, addr
+
+        return ((i, addr, from_email, rows.pop(i, None)) for i, addr, from_email in schedule_quotas(pairs(), core, stop.is_set))
+
+    items = schedule(skip_suppressed(items, on_suppressed))
+    if batched:
+        def group_key(item):
+            return item[2] or pick_from(item[0]), pick_subject(item[0])
+
+        items = (
+            ([it[0] for it in group], [it[1] for it in group], k[0], k[1])
+            for k, group in group_batches(items, core.batch_size, group_key)
+        )
+
+    def on_signal(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        stop.set()
+        print("\n⏸ 收到中断信号：等待在途请求结束后退出（再按一次 Ctrl-C 立即退出）", file=sys.stderr)
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, on_signal)
+        signal.signal(signal.SIGTERM, on_signal)
+
+    name = f"任务 {cid}" if cid is not None else "演练"
+    print(f"▶ {name}（{mode}）开始：收件人 {total if total is not None else '未知'}，已处理 {initial}，并发 {concurrency}，每小时上限 {per_hour or '不限'}")
+    if dedupe is not None:
+        print(f"🔁 去重：{dedupe.input} → {dedupe.unique}（规则 {', '.join(dedupe.rules)}）")
+
+    def print_report():
+        d = report.to_dict()
+        reasons = "，".join(f"{k} {n}" for k, n in d["rejected"].items() if n)
+        print(f"🔎 校验：{d['total']} 个，有效 {d['valid']}，拒绝 {d['invalid']}" + (f"（{reasons}）" if reasons else ""))
+
+    # 新任务的快照写入时已完成校验；dry-run 边发边校验，结束时再输出
+    if report is not None and cid is not None:
+        print_report()
+
+    status = "interrupted"
+    try:
+        outcome = run_campaign(
+            items,
+            send_group if batched else send_one,
+            concurrency=concurrency,
+            limiter=None if args.dry_run else TokenBucket(per_hour),
+            is_cancelled=stop.is_set,
+            on_done=on_group_done if batched else on_done,
+            cost=(lambda item: len(item[0])) if batched else None,
+            gate=None if args.dry_run else gate,
+            retry=None if args.dry_run else retry,
+        )
+        status = "stopped" if outcome["stopped"] else "completed"
+    finally:
+        progress.close()
+        results.close()
+        if writer is not None:
+            writer.close()
+            jobstore.set_status(cid, status)
+            if not INGESTOR.drain(DRAIN_TIMEOUT):
+                print("⚠️ 部分投递登记未能在退出前写入")
+
+    print(progress.line())
+    if report is not None and cid is None:
+        print_report()
+    print(f"📄 逐个收件人的结果：{output}")
+    if status == "stopped":
+        if cid is not None and not args.dry_run:
+            print(f"⏸ 任务 {cid} 已停止，续发：python send_email_postal_excel.py --resume {cid}")
+        return 130
+    print(f"✅ 全部完成：成功 {progress.ok}，失败 {progress.failed}，跳过 {progress.skipped}")
+    return 0
+
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+    try:
+        return run(args)
+    except CliError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        print("\n⛔ 已强制退出；未完成的收件人仍为 pending，可用 --resume 续发", file=sys.stderr)
+        return 130
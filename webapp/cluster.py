@@ -0,0 +1,408 @@
+"""多进程 / 多主机协同发送：基于 SQLite（WAL）的租约分片与全局令牌桶
+
+设置环境变量 MAILER_CLUSTER=1 后启用（所有 worker 需共享同一个 mailer.db，多主机时放在共享存储上）：
+
+- 每个任务的收件人按 idx 切成固定大小的分片（campaign_chunks），worker 以带过期时间的租约认领分片，
+  后台心跳续约；worker 崩溃后租约过期，分片中仍为 pending 的收件人由其它 worker 接手（至少发送一次）
+- 分片读完后进入“收尾”状态，直到其中的收件人全部写回结果（含重试）才标记完成，期间继续续约
+- 全局速率预算存放在 rate_buckets 表中，所有 worker 按块预留令牌，合计不超过 per_hour_limit
+- 暂停 / 取消通过 campaigns.status 传递，各 worker 在派发检查点轮询；stopping 的任务在没有有效租约后
+  （所有 worker 已收尾，或持有租约的 worker 崩溃、租约过期）由轮询线程标记为 stopped，可再续发
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+
+from webapp import jobstore
+from webapp.db import connect, ensure_schema, get_conn
+from webapp.engine import wait_or_cancel
+
+ENABLED = os.getenv("MAILER_CLUSTER", "").strip().lower() in ("1", "true", "yes", "on")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+CHUNK_SIZE = 500
+LEASE_SECONDS = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaign_chunks (
+    campaign_id INTEGER NOT NULL,
+    chunk_no INTEGER NOT NULL,
+    lo INTEGER NOT NULL,
+    hi INTEGER NOT NULL,
+    owner TEXT,
+    expires_at REAL NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, chunk_no)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    rate REAL NOT NULL DEFAULT 0,
+    burst REAL NOT NULL DEFAULT 1,
+    tokens REAL NOT NULL DEFAULT 0,
+    updated REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("jobstore", jobstore.SCHEMA, conn)
+    ensure_schema("cluster", SCHEMA, conn)
+    return conn
+
+
+def _own_conn():
+    # 租约心跳与令牌桶各用独立连接，事务不与发送线程共享的连接交错
+    conn = connect()
+    ensure_schema("jobstore", jobstore.SCHEMA, conn)
+    ensure_schema("cluster", SCHEMA, conn)
+    return conn
+
+
+def ensure_chunks(cid: int, reset: bool = False):
+    """为任务建立分片（已存在则跳过）；reset=True 时重新开放仍有 pending 收件人的分片（续发）"""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        exists = conn.execute("SELECT 1 FROM campaign_chunks WHERE campaign_id = ? LIMIT 1", (cid,)).fetchone()
+        if not exists:
+            row = conn.execute("SELECT MAX(idx) FROM campaign_recipients WHERE campaign_id = ?", (cid,)).fetchone()
+            last = row[0] or 0
+            conn.executemany(
+                "INSERT OR IGNORE INTO campaign_chunks (campaign_id, chunk_no, lo, hi) VALUES (?, ?, ?, ?)",
+                [(cid, n, lo, min(lo + CHUNK_SIZE - 1, last)) for n, lo in enumerate(range(1, last + 1, CHUNK_SIZE))],
+            )
+        elif reset:
+            conn.execute(
+                "UPDATE campaign_chunks SET done = 0, owner = NULL, expires_at = 0 WHERE campaign_id = ? AND EXISTS ("
+                "SELECT 1 FROM campaign_recipients r WHERE r.campaign_id = campaign_chunks.campaign_id "
+                "AND r.idx BETWEEN campaign_chunks.lo AND campaign_chunks.hi AND r.state = 'pending')",
+                (cid,),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def has_claimable(cid: int) -> bool:
+    row = _conn().execute(
+        "SELECT 1 FROM campaign_chunks WHERE campaign_id = ? AND done = 0 AND (owner IS NULL OR expires_at < ?) LIMIT 1",
+        (cid, time.time()),
+    ).fetchone()
+    return row is not None
+
+
+def all_done(cid: int) -> bool:
+    row = _conn().execute("SELECT 1 FROM campaign_chunks WHERE campaign_id = ? AND done = 0 LIMIT 1", (cid,)).fetchone()
+    return row is None
+
+
+class LeaseQueue:
+    """按租约逐片产出某个任务的 pending 收件人 (idx, email)
+
+    与 jobstore.iter_pending 的产出格式相同，可直接作为发送引擎的 items；用完后必须调用 close()
+    """
+
+    def __init__(self, cid: int, lease_seconds: float = LEASE_SECONDS, worker_id: str = WORKER_ID):
+        self.cid = cid
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id
+        self._conn = _own_conn()
+        self._lock = threading.Lock()
+        self._owned = {}  # chunk_no -> (lo, hi)
+        self._draining = set()
+        self._lost = set()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew_loop, daemon=True, name=f"mailer-lease-{cid}")
+        self._heartbeat.start()
+        self.claimed = 0
+
+    # —— 租约 ——
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT chunk_no, lo, hi FROM campaign_chunks WHERE campaign_id = ? AND done = 0 "
+                    "AND (owner IS NULL OR expires_at < ?) ORDER BY chunk_no LIMIT 1",
+                    (self.cid, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE campaign_chunks SET owner = ?, expires_at = ? WHERE campaign_id = ? AND chunk_no = ?",
+                        (self.worker_id, now + self.lease_seconds, self.cid, row[0]),
+                    )
+                    self._owned[row[0]] = (row[1], row[2])
+                    self.claimed += 1
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _renew_loop(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                self.renew()
+                self.finish_drained()
+            except Exception as e:
+                print(f"⚠️ 续约失败：{e}")
+
+    def renew(self):
+        """续约所有持有的分片；被其它 worker 接手（租约已过期）的分片记为丢失"""
+        expires = time.time() + self.lease_seconds
+        with self._lock, self._conn:
+            for chunk_no in list(self._owned):
+                cur = self._conn.execute(
+                    "UPDATE campaign_chunks SET expires_at = ? WHERE campaign_id = ? AND chunk_no = ? AND owner = ?",
+                    (expires, self.cid, chunk_no, self.worker_id),
+                )
+                if cur.rowcount == 0:
+                    self._owned.pop(chunk_no, None)
+                    self._draining.discard(chunk_no)
+                    self._lost.add(chunk_no)
+
+    def finish_drained(self):
+        """已读完的分片中收件人都已写回结果时标记完成"""
+        with self._lock:
+            for chunk_no in list(self._draining):
+                lo, hi = self._owned[chunk_no]
+                pending = self._conn.execute(
+                    "SELECT 1 FROM campaign_recipients WHERE campaign_id = ? AND idx BETWEEN ? AND ? AND state = 'pending' LIMIT 1",
+                    (self.cid, lo, hi),
+                ).fetchone()
+                if pending is None:
+                    with self._conn:
+                        self._conn.execute(
+                            "UPDATE campaign_chunks SET done = 1, owner = NULL WHERE campaign_id = ? AND chunk_no = ? AND owner = ?",
+                            (self.cid, chunk_no, self.worker_id),
+                        )
+                    self._draining.discard(chunk_no)
+                    self._owned.pop(chunk_no, None)
+
+    # —— 产出 ——
+    def __iter__(self):
+        while not self._stop.is_set():
+            row = self._claim()
+            if row is None:
+                return
+            chunk_no, lo, hi = row
+            for item in self._iter_chunk(lo, hi):
+                if chunk_no in self._lost:
+                    # 租约丢失：剩余收件人已由其它 worker 接手
+                    break
+                yield item
+            with self._lock:
+                if chunk_no in self._owned:
+                    self._draining.add(chunk_no)
+
+    def _iter_chunk(self, lo: int, hi: int, batch: int = 200):
+        last = lo - 1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT idx, email FROM campaign_recipients WHERE campaign_id = ? AND state = 'pending' "
+                    "AND idx > ? AND idx <= ? ORDER BY idx LIMIT ?",
+                    (self.cid, last, hi, batch),
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def close(self):
+        """结果已全部落库后调用：标记收尾完成的分片，释放其余租约以便其它 worker 立即接手"""
+        self._stop.set()
+        self._heartbeat.join(timeout=5)
+        try:
+            self.finish_drained()
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "UPDATE campaign_chunks SET owner = NULL, expires_at = 0 WHERE campaign_id = ? AND chunk_no = ? AND owner = ?",
+                    [(self.cid, n, self.worker_id) for n in self._owned],
+                )
+                self._owned.clear()
+                self._draining.clear()
+        finally:
+            self._conn.close()
+
+
+class SharedTokenBucket:
+    """跨进程的令牌桶：状态存放在 rate_buckets 表，每次预留一小块令牌，块内按速率均匀放行
+
+    与 engine.TokenBucket 接口一致（set_rate / reserve / acquire / rate），可直接作为发送引擎的 limiter
+    """
+
+    def __init__(self, name: str = "global", block_seconds: float = 0.5):
+        self.name = name
+        self.block_seconds = block_seconds
+        self._lock = threading.Lock()
+        self._conn = _own_conn()
+        self._local = 0.0  # 已预留、尚未放行的令牌数
+        self._next = 0.0  # 下一个本地令牌可用的时间（monotonic）
+        self._checked = 0.0
+        self.rate = self._read_rate()
+
+    def _read_rate(self) -> float:
+        row = self._conn.execute("SELECT rate FROM rate_buckets WHERE name = ?", (self.name,)).fetchone()
+        return row[0] if row else 0.0
+
+    def set_rate(self, per_hour):
+        try:
+            per_hour = float(per_hour or 0)
+        except (TypeError, ValueError):
+            per_hour = 0.0
+        rate = per_hour / 3600.0 if per_hour > 0 else 0.0
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO rate_buckets (name, rate, burst, tokens, updated) VALUES (?, ?, 1, 1, ?) "
+                "ON CONFLICT(name) DO UPDATE SET rate = excluded.rate",
+                (self.name, rate, time.time()),
+            )
+            self.rate = rate
+
+    def _reserve_block(self, n: float) -> float:
+        """从共享桶中预留 n 个令牌，返回最后一个令牌的等待秒数（透支模型，与 TokenBucket.reserve 相同）"""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT rate, burst, tokens, updated FROM rate_buckets WHERE name = ?", (self.name,)).fetchone()
+            now = time.time()
+            if row is None or row[0] <= 0:
+                conn.execute("COMMIT")
+                self.rate = row[0] if row else 0.0
+                return 0.0
+            rate, burst, tokens, updated = row
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate) - n
+            conn.execute("UPDATE rate_buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.rate = rate
+        return 0.0 if tokens >= 0 else -tokens / rate
+
+    def reserve(self, n: int = 1) -> float:
+        with self._lock:
+            if self.rate <= 0:
+                # 不限速：每秒最多读一次共享速率，其余直接放行
+                now = time.monotonic()
+                if now - self._checked < 1.0:
+                    return 0.0
+                self._checked = now
+                self.rate = self._read_rate()
+                if self.rate <= 0:
+                    return 0.0
+            if self._local < n:
+                block = max(float(n), (self.rate or 0.0) * self.block_seconds, 1.0)
+                wait_last = self._reserve_block(block - self._local)
+                if self.rate <= 0:
+                    self._local = 0.0
+                    return 0.0
+                now = time.monotonic()
+                # 块内第一个令牌的可用时间
+                self._next = max(self._next, now + wait_last - (block - 1) / self.rate)
+                self._local = block
+            self._local -= n
+            now = time.monotonic()
+            t = max(now, self._next)
+            self._next = t + n / self.rate if self.rate > 0 else now
+            return t - now
+
+    def acquire(self, is_cancelled=None, n: int = 1) -> bool:
+        return not wait_or_cancel(self.reserve(n), is_cancelled)
+
+
+_bucket = None
+_bucket_lock = threading.Lock()
+
+
+def global_bucket() -> SharedTokenBucket:
+    """本进程共享的全局令牌桶（所有 worker 共用同一行 rate_buckets）"""
+    global _bucket
+    with _bucket_lock:
+        if _bucket is None:
+            _bucket = SharedTokenBucket("global")
+        return _bucket
+
+
+class StatusPoller:
+    """按间隔读取 campaigns.status（其它 worker 的暂停 / 取消经由它传递）"""
+
+    def __init__(self, cid: int, interval: float = 1.0):
+        self.cid = cid
+        self.interval = interval
+        self._at = 0.0
+        self._status = None
+
+    def poll(self):
+        now = time.monotonic()
+        if now - self._at >= self.interval:
+            self._at = now
+            row = _conn().execute("SELECT status FROM campaigns WHERE id = ?", (self.cid,)).fetchone()
+            self._status = row[0] if row else None
+        return self._status
+
+
+def running_campaigns():
+    """状态为 running 的 list / all 任务 [(id, mode)]（Excel 模式只在发起它的 worker 上运行）"""
+    return _conn().execute(
+        "SELECT id, mode FROM campaigns WHERE status = 'running' AND mode IN ('list', 'all') ORDER BY id"
+    ).fetchall()
+
+
+def stop_campaigns(cid: int = None) -> int:
+    """把运行中 / 暂停的任务标记为 stopping，各 worker 在检查点看到后取消；返回受影响的任务数"""
+    conn = _conn()
+    with conn:
+        if cid is None:
+            cur = conn.execute(
+                "UPDATE campaigns SET status = 'stopping', updated_at = ? WHERE status IN ('running', 'paused')",
+                (int(time.time()),),
+            )
+        else:
+            cur = conn.execute(
+                "UPDATE campaigns SET status = 'stopping', updated_at = ? WHERE id = ? AND status IN ('running', 'paused')",
+                (int(time.time()), cid),
+            )
+    return cur.rowcount
+
+
+def finalize_stopping() -> int:
+    """把已没有有效租约的 stopping 任务标记为 stopped（单进程路径由 JobManager 收尾）；返回受影响的任务数"""
+    conn = _conn()
+    with conn:
+        cur = conn.execute(
+            "UPDATE campaigns SET status = 'stopped', updated_at = ? WHERE status = 'stopping' AND NOT EXISTS ("
+            "SELECT 1 FROM campaign_chunks k WHERE k.campaign_id = campaigns.id AND k.done = 0 "
+            "AND k.owner IS NOT NULL AND k.expires_at >= ?)",
+            (int(time.time()), time.time()),
+        )
+    return cur.rowcount
+
+
+def progress_snapshot() -> dict:
+    """最近一个 list / all 任务在所有 worker 上的汇总进度（格式与 ProgressState 快照相同）"""
+    row = _conn().execute(
+        "SELECT id, mode, status FROM campaigns WHERE mode IN ('list', 'all') ORDER BY id DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return {}
+    cid, mode, status = row
+    c = jobstore.counts(cid)
+    return {
+        "job_id": cid,
+        "campaign_id": cid,
+        "mode": mode,
+        "status": status,
+        "sent": c[jobstore.SENT] + c[jobstore.FAILED] + c[jobstore.SKIPPED],
+        "success": c[jobstore.SENT],
+        "skipped": c[jobstore.SKIPPED],
+        "total": c["total"],
+    }
@@ -0,0 +1,48 @@
+"""SQLite 连接与建表辅助（数据库位于项目根目录 mailer.db，可用 MAILER_DB 覆盖）
+
+- WAL + synchronous=NORMAL：提交不逐条 fsync，读写互不阻塞
+- 每个线程复用一个连接；各模块通过 ensure_schema 幂等建表
+"""
+import os
+import sqlite3
+import threading
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.getenv("MAILER_DB") or os.path.join(PROJECT_ROOT, "mailer.db")
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_done = set()
+
+
+def connect(path=None) -> sqlite3.Connection:
+    """新建一个连接（调用方自行管理生命周期，可跨线程使用但需自行加锁）"""
+    conn = sqlite3.connect(path or DB_PATH, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def get_conn() -> sqlite3.Connection:
+    """当前线程的共享连接"""
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != DB_PATH:
+        conn = connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+    return conn
+
+
+def ensure_schema(name: str, sql: str, conn=None):
+    """按名称幂等执行建表脚本（每个进程每个数据库只执行一次）"""
+    key = (DB_PATH, name)
+    if key in _schema_done:
+        return
+    with _schema_lock:
+        if key in _schema_done:
+            return
+        c = conn or get_conn()
+        c.executescript(sql)
+        c.commit()
+        _schema_done.add(key)
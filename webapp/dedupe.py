@@ -0,0 +1,237 @@
+"""大规模收件人列表的去重：可插拔的规范化规则 + 内存有界的指纹去重
+
+- 规范化规则按名称组合，例如 ("lower", "gmail_dots", "plus_tags")：
+  lower 小写整个地址；gmail_dots 去掉 Gmail 本地部分的点并把 googlemail.com 视为 gmail.com；
+  plus_tags 对支持子地址的服务商去掉 "+标签"（plus_tags_all 对所有域名生效）；可用 register_rule 添加自定义规则
+- 每个地址只保留一个 64 位指纹（规范化结果的 hash），不保存规范化字符串；保留每组中第一次出现的原始写法与顺序
+- 有 numpy 时指纹放在 int64 数组里一次排序（1000 万约 80 MB）；否则按段排序后溢写临时文件，多路归并，
+  内存只与段大小有关
+- 需要遍历输入两次（先算指纹，再按标记输出），因此输入为列表或可重复调用的迭代器工厂
+- 64 位指纹在 1000 万地址下误判为重复的概率约为百万分之三
+"""
+import heapq
+import os
+import tempfile
+from array import array
+
+DEFAULT_RULES = ("lower",)
+
+GMAIL_DOMAINS = frozenset(("gmail.com", "googlemail.com"))
+# 支持 "+标签" 子地址（投递到同一邮箱）的服务商
+PLUS_DOMAINS = frozenset((
+    "gmail.com", "googlemail.com", "outlook.com", "hotmail.com", "live.com", "msn.com",
+    "icloud.com", "me.com", "mac.com", "fastmail.com", "protonmail.com", "proton.me", "yandex.ru", "yandex.com",
+))
+
+# 外部排序每段的条数（每条一个 Python int，约 40 字节）
+RUN_SIZE = 1_000_000
+_IDX_BITS = 36
+_IDX_MASK = (1 << _IDX_BITS) - 1
+_FP_MASK = (1 << 64) - 1
+_READ_PAIRS = 65536
+
+
+def _lower(local, domain):
+    return local.lower(), domain
+
+
+def _gmail_dots(local, domain):
+    if domain in GMAIL_DOMAINS:
+        return local.replace(".", ""), "gmail.com"
+    return local, domain
+
+
+def _plus_tags(local, domain):
+    if domain in PLUS_DOMAINS:
+        return local.split("+", 1)[0], domain
+    return local, domain
+
+
+def _plus_tags_all(local, domain):
+    return local.split("+", 1)[0], domain
+
+
+RULES = {
+    "lower": _lower,
+    "gmail_dots": _gmail_dots,
+    "plus_tags": _plus_tags,
+    "plus_tags_all": _plus_tags_all,
+}
+
+
+def register_rule(name: str, fn):
+    """注册自定义规则：fn(local, domain) -> (local, domain)，domain 已是小写"""
+    RULES[name] = fn
+
+
+def normalizer(rules=DEFAULT_RULES):
+    """返回 email -> 规范化键 的函数；未知规则名抛出 ValueError"""
+    rules = tuple(rules or ())
+    unknown = [r for r in rules if r not in RULES]
+    if unknown:
+        raise ValueError(f"未知的去重规则：{', '.join(unknown)}")
+    if rules == DEFAULT_RULES:
+        # 默认规则与原来的 strip().lower() 一致，走最快的路径
+        return lambda e: e.strip().lower()
+    fns = [RULES[r] for r in rules]
+
+    def key(email: str) -> str:
+        email = email.strip()
+        local, at, domain = email.rpartition("@")
+        if not at:
+            return email.lower()
+        domain = domain.lower()
+        for fn in fns:
+            local, domain = fn(local, domain)
+        return f"{local}@{domain}"
+
+    return key
+
+
+class DedupeStats:
+    __slots__ = ("input", "unique", "method", "rules")
+
+    def __init__(self, rules):
+        self.input = 0
+        self.unique = 0
+        self.method = ""
+        self.rules = list(rules)
+
+    @property
+    def duplicates(self) -> int:
+        return self.input - self.unique
+
+    def to_dict(self) -> dict:
+        return {
+            "input": self.input,
+            "unique": self.unique,
+            "duplicates": self.duplicates,
+            "method": self.method,
+            "rules": self.rules,
+        }
+
+
+def _mask_numpy(np, make_iter, key, n_hint):
+    fps = np.fromiter((hash(key(e)) for e in make_iter()), dtype=np.int64, count=n_hint if n_hint is not None else -1)
+    n = len(fps)
+    # return_index 使用稳定排序，得到每个指纹第一次出现的位置
+    _, first = np.unique(fps, return_index=True)
+    del fps
+    mask = np.zeros(n, dtype=bool)
+    mask[first] = True
+    # 压成位图（每条 1 bit），与外部排序路径共用同一种标记格式
+    return _BitMask(bytearray(np.packbits(mask, bitorder="little").tobytes())), n, len(first)
+
+
+def _spill(run, tmpdir):
+    run.sort()
+    pairs = array("Q")
+    for v in run:
+        pairs.append(v >> _IDX_BITS)
+        pairs.append(v & _IDX_MASK)
+    fd, path = tempfile.mkstemp(prefix="mailer-dedupe-", suffix=".run", dir=tmpdir)
+    with os.fdopen(fd, "wb") as f:
+        pairs.tofile(f)
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            pairs = array("Q")
+            try:
+                pairs.fromfile(f, _READ_PAIRS * 2)
+            except EOFError:
+                pass
+            if not pairs:
+                return
+            it = iter(pairs)
+            for fp in it:
+                yield (fp << _IDX_BITS) | next(it)
+
+
+def _mask_external(make_iter, key, run_size, tmpdir):
+    run = []
+    paths = []
+    n = 0
+    try:
+        for e in make_iter():
+            run.append(((hash(key(e)) & _FP_MASK) << _IDX_BITS) | n)
+            n += 1
+            if len(run) >= run_size:
+                paths.append(_spill(run, tmpdir))
+                run = []
+        if paths:
+            if run:
+                paths.append(_spill(run, tmpdir))
+            run = []
+            merged = heapq.merge(*[_read_run(p) for p in paths])
+        else:
+            run.sort()
+            merged = run
+        mask = bytearray((n + 7) // 8)
+        prev = -1
+        unique = 0
+        # 同一指纹的条目按位置升序相邻，第一条即首次出现
+        for v in merged:
+            fp = v >> _IDX_BITS
+            if fp != prev:
+                prev = fp
+                idx = v & _IDX_MASK
+                mask[idx >> 3] |= 1 << (idx & 7)
+                unique += 1
+        return _BitMask(mask), n, unique
+    finally:
+        for p in paths:
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+class _BitMask:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: bytearray):
+        self.bits = bits
+
+    def __getitem__(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+
+def _first_mask(make_iter, key, stats, n_hint=None, use_numpy=True, run_size=RUN_SIZE, tmpdir=None):
+    if use_numpy:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None:
+            stats.method = "numpy"
+            return _mask_numpy(np, make_iter, key, n_hint)
+    stats.method = "external_sort"
+    return _mask_external(make_iter, key, run_size, tmpdir)
+
+
+def dedupe_iter(make_iter, rules=DEFAULT_RULES, **kw):
+    """make_iter() 每次返回一个新的迭代器（会被调用两次）；返回 (去重后的生成器, DedupeStats)
+
+    统计在第一遍完成后即可读取；生成器按原顺序产出每组第一次出现的地址
+    """
+    stats = DedupeStats(rules)
+    mask, n, unique = _first_mask(make_iter, normalizer(rules), stats, **kw)
+    stats.input, stats.unique = n, unique
+
+    def gen():
+        for i, e in enumerate(make_iter()):
+            if i >= n:
+                return
+            if mask[i]:
+                yield e
+
+    return gen(), stats
+
+
+def dedupe_list(emails, rules=DEFAULT_RULES, **kw):
+    """列表去重（保序），返回 (新列表, DedupeStats)"""
+    kept, stats = dedupe_iter(lambda: iter(emails), rules, n_hint=len(emails), **kw)
+    return list(kept), stats
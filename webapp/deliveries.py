@@ -0,0 +1,256 @@
+"""投递状态：发送时登记 Postal message id，之后由 webhook 事件（送达 / 延迟 / 退信）更新
+
+- webhook 请求只把事件放进内存队列就返回，不做任何磁盘 IO
+- 后台线程按条数或时间间隔攒批，一个事务写入 deliveries 表（以 message id 为主键，另有 token / trace 索引）
+- 硬退信的地址批量加入抑制列表（reason=hard_bounce）；软退信（4.x.x、邮箱满等临时错误）只记录状态，不抑制
+- 发送时的登记也走同一队列，不增加发送线程的写库开销
+"""
+import queue
+import re
+import threading
+import time
+
+from webapp.db import connect, ensure_schema, get_conn
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    message_id INTEGER PRIMARY KEY,
+    token TEXT,
+    email TEXT,
+    campaign_id INTEGER,
+    idx INTEGER,
+    trace TEXT,
+    status TEXT NOT NULL,
+    detail TEXT,
+    updated_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_token ON deliveries (token);
+CREATE INDEX IF NOT EXISTS idx_deliveries_trace ON deliveries (trace);
+CREATE INDEX IF NOT EXISTS idx_deliveries_campaign ON deliveries (campaign_id, status);
+"""
+
+SENT = "sent"
+DELIVERED = "delivered"
+DELAYED = "delayed"
+HELD = "held"
+BOUNCED = "bounced"
+FAILED = "failed"
+
+# 已是终态时，不被迟到的中间状态覆盖
+FINAL = (DELIVERED, BOUNCED, FAILED)
+
+# Postal 事件 -> 投递状态
+EVENT_STATUS = {
+    "MessageSent": DELIVERED,
+    "MessageDelivered": DELIVERED,
+    "MessageDelayed": DELAYED,
+    "MessageHeld": HELD,
+    "MessageDeliveryFailed": FAILED,
+    "MessageBounced": BOUNCED,
+}
+
+# 退信详情中的 SMTP 状态码：增强状态码（5.1.1 / 4.2.2）或三位应答码（550 / 452）
+_SMTP_CODE = re.compile(r"(?<![\d.])([245])(?:\.\d{1,3}\.\d{1,3}|\d\d(?=[\s\-:]|$))")
+_HARD_WORDS = ("hardfail", "hard bounce", "hard_bounce", "permanent")
+
+QUEUE_SIZE = 100000
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 1.0
+
+_UPSERT_SENT = (
+    "INSERT INTO deliveries (message_id, token, email, campaign_id, idx, trace, status, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, 'sent', ?) "
+    "ON CONFLICT(message_id) DO UPDATE SET token = excluded.token, email = excluded.email, "
+    "campaign_id = excluded.campaign_id, idx = excluded.idx, trace = excluded.trace"
+)
+_FINAL_SQL = ", ".join(f"'{s}'" for s in FINAL)
+_UPSERT_EVENT = (
+    "INSERT INTO deliveries (message_id, token, email, status, detail, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(message_id) DO UPDATE SET "
+    f"status = CASE WHEN deliveries.status IN ({_FINAL_SQL}) "
+    f"AND excluded.status NOT IN ({_FINAL_SQL}) THEN deliveries.status ELSE excluded.status END, "
+    "detail = excluded.detail, updated_at = excluded.updated_at, "
+    "token = COALESCE(deliveries.token, excluded.token), email = COALESCE(deliveries.email, excluded.email)"
+)
+
+
+def is_hard_bounce(*texts) -> bool:
+    """按退信详情判断是否为硬退信：以第一个 SMTP 状态码为准（5 开头为硬退信，4 开头为软退信），
+    没有状态码时看是否带 hard / permanent 标记；无法判断时按软退信处理（不抑制）"""
+    text = " ".join(str(t) for t in texts if t).lower()
+    m = _SMTP_CODE.search(text)
+    if m:
+        return m.group(1) == "5"
+    return any(w in text for w in _HARD_WORDS)
+
+
+def parse_event(body: dict):
+    """把 Postal webhook 请求体解析为 (message_id, token, email, status, detail, hard_bounce)；无关事件返回 None"""
+    if not isinstance(body, dict):
+        return None
+    status = EVENT_STATUS.get(body.get("event"))
+    payload = body.get("payload") or {}
+    if status is None or not isinstance(payload, dict):
+        return None
+    if status == BOUNCED:
+        # 退信事件里的 original_message 才是我们发出的那封
+        msg = payload.get("original_message") or {}
+        bounce = payload.get("bounce") or {}
+        if not isinstance(bounce, dict):
+            bounce = {}
+        detail = bounce.get("subject") or payload.get("details") or ""
+        hard = is_hard_bounce(
+            bounce.get("subject"), bounce.get("details"), bounce.get("tag"), payload.get("details"), payload.get("output")
+        )
+    else:
+        msg = payload.get("message") or {}
+        detail = payload.get("details") or payload.get("output") or ""
+        hard = status == FAILED and str(payload.get("status") or "").lower() == "hardfail"
+    try:
+        message_id = int(msg.get("id"))
+    except (TypeError, ValueError):
+        return None
+    email = (msg.get("to") or "").strip().lower() or None
+    return message_id, msg.get("token"), email, status, str(detail)[:500], hard
+
+
+class Ingestor:
+    """内存队列 + 单个后台写线程"""
+
+    def __init__(self, maxsize: int = QUEUE_SIZE, batch_size: int = BATCH_SIZE, interval: float = FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {"received": 0, "written": 0, "dropped": 0, "hard_bounces": 0, "soft_bounces": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._run, daemon=True, name="mailer-deliveries")
+                t.start()
+                self._thread = t
+
+    def submit_event(self, body) -> bool:
+        """webhook 调用：入队即返回；队列满返回 False（由调用方回 503 让 Postal 稍后重投）"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(("event", body))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["received"] += 1
+        return True
+
+    def record_sent(self, campaign_id, idx, messages, trace):
+        """发送成功后登记 message id / token / trace；messages 为 {收件人: (id, token)}，批量发送时 idx 为 {收件人: idx}"""
+        if not messages:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(("sent", (campaign_id, idx, messages, trace)))
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def drain(self, timeout: float = 10.0) -> bool:
+        """等待已入队的条目全部写库（命令行发送退出前调用）；超时返回 False"""
+        q = self._queue
+        end = time.monotonic() + timeout
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                q.all_tasks_done.wait(remaining)
+        return True
+
+    def _run(self):
+        conn = connect()
+        ensure_schema("deliveries", SCHEMA, conn)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(conn, batch)
+            except Exception as e:
+                print(f"❌ 写入投递状态失败：{e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, conn, batch):
+        now = int(time.time())
+        sent_rows = []
+        event_rows = []
+        bounced = []
+        for kind, data in batch:
+            if kind == "sent":
+                campaign_id, idx, messages, trace = data
+                for addr, (message_id, token) in messages.items():
+                    i = idx.get(addr) if isinstance(idx, dict) else idx
+                    sent_rows.append((message_id, token, addr, campaign_id, i, trace, now))
+                continue
+            parsed = parse_event(data)
+            if parsed is None:
+                continue
+            message_id, token, email, status, detail, hard = parsed
+            event_rows.append((message_id, token, email, status, detail, now))
+            if hard and email:
+                bounced.append(email)
+            elif status == BOUNCED:
+                self.stats["soft_bounces"] += 1
+        with conn:
+            if sent_rows:
+                conn.executemany(_UPSERT_SENT, sent_rows)
+            if event_rows:
+                conn.executemany(_UPSERT_EVENT, event_rows)
+        self.stats["written"] += len(sent_rows) + len(event_rows)
+        if bounced:
+            from webapp import suppression
+            suppression.add_many(bounced, reason="hard_bounce")
+            self.stats["hard_bounces"] += len(bounced)
+
+
+INGESTOR = Ingestor()
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("deliveries", SCHEMA, conn)
+    return conn
+
+
+def campaign_counts(campaign_id: int) -> dict:
+    """某个任务各投递状态的数量"""
+    return dict(_conn().execute(
+        "SELECT status, COUNT(*) FROM deliveries WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+    ).fetchall())
+
+
+def lookup(message_id=None, token=None, trace=None):
+    """按 message id / token / trace 查询投递记录"""
+    if message_id is not None:
+        where, arg = "message_id = ?", int(message_id)
+    elif token:
+        where, arg = "token = ?", token
+    elif trace:
+        where, arg = "trace = ?", trace
+    else:
+        return []
+    cols = ("message_id", "token", "email", "campaign_id", "idx", "trace", "status", "detail", "updated_at")
+    rows = _conn().execute(f"SELECT {', '.join(cols)} FROM deliveries WHERE {where} LIMIT 100", (arg,)).fetchall()
+    return [dict(zip(cols, r)) for r in rows]
@@ -0,0 +1,222 @@
+"""发送引擎：有界线程池并发发送 + 全局令牌桶限速
+
+Postal 的每次调用都是一次完整的 HTTP 往返，单线程逐封发送时吞吐量约等于 1/延迟。
+这里用固定大小的线程池同时保持多封在途请求，所有在途发送共享同一个令牌桶，
+从而在提升并发的同时仍然严格遵守 per_hour_limit。
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CONCURRENCY = 4
+MAX_CONCURRENCY = 64
+
+
+def wait_or_cancel(seconds: float, is_cancelled=None) -> bool:
+    """等待指定秒数，期间每秒检查一次取消；被取消返回 True"""
+    if seconds <= 0:
+        return bool(is_cancelled and is_cancelled())
+    end = time.monotonic() + seconds
+    while True:
+        if is_cancelled and is_cancelled():
+            return True
+        now = time.monotonic()
+        if now >= end:
+            return False
+        time.sleep(min(1.0, end - now))
+
+
+class TokenBucket:
+    """线程安全的令牌桶（按每小时条数配置，0 表示不限速）
+
+    - burst 为桶容量，默认 1，即严格均匀间隔，与原先的 sleep(3600/limit) 行为一致
+    - 令牌允许“透支”：reserve() 立即扣减并返回需等待的时间，多个调用方各自排到自己的时间片
+    """
+
+    def __init__(self, per_hour=0, burst=1):
+        self._lock = threading.Lock()
+        self.burst = max(1, int(burst or 1))
+        self.rate = 0.0
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self.set_rate(per_hour)
+
+    def set_rate(self, per_hour):
+        try:
+            per_hour = float(per_hour or 0)
+        except (TypeError, ValueError):
+            per_hour = 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = per_hour / 3600.0 if per_hour > 0 else 0.0
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last) * self.rate)
+        else:
+            self._tokens = float(self.burst)
+        self._last = now
+
+    def reserve(self, n: int = 1) -> float:
+        """取走 n 个令牌，返回调用方还需等待的秒数"""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self._tokens -= float(n)
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def delay(self, n: int = 1) -> float:
+        """距离可以取 n 个令牌还需等待的秒数（只查看，不扣减）；n 超过桶容量时按桶满计，超出部分由 reserve 透支"""
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            return max(0.0, (min(float(n), float(self.burst)) - self._tokens) / self.rate)
+
+    def acquire(self, is_cancelled=None, n: int = 1) -> bool:
+        """阻塞直到拿到 n 个令牌；等待期间被取消返回 False"""
+        return not wait_or_cancel(self.reserve(n), is_cancelled)
+
+
+def clamp_concurrency(value) -> int:
+    try:
+        n = int(value or 0)
+    except (TypeError, ValueError):
+        n = 0
+    if n <= 0:
+        n = DEFAULT_CONCURRENCY
+    return min(n, MAX_CONCURRENCY)
+
+
+def run_campaign(items, send_one, concurrency=1, limiter=None, is_cancelled=None, on_done=None, cost=None,
+                 gate=None, retry=None, on_wait=None, stats=None):
+    """按顺序派发 items 并发执行 send_one
+
+    - items：可迭代的参数元组，惰性消费，不会一次性全部提交
+    - send_one(*item) 的返回值原样交给 on_done（单封为 bool，批量为 {收件人: bool}），异常视为 False
+    - limiter：共享的 TokenBucket，派发前取令牌；cost(item) 为该任务消耗的令牌数（批量发送按收件人数计）
+    - gate(is_cancelled, n) -> bool：取令牌后再调用（例如选择服务器 / 自适应退避 / 熔断），n 为该条的 cost，返回 False 表示停止
+    - retry(item, result, attempt) -> 秒数或 None：返回秒数则延后重新入队（不占发送线程），None 表示结束
+    - on_done(item, ok)：在同一把锁内回调，便于计数与更新进度
+    - on_wait(reason, seconds)：派发前等待 limiter（"rate_limit"）与 gate（"backoff"）的耗时，供监控统计
+    - stats：可选 dict，运行中持续更新 inflight（在途数）与 retry_queue（重试队列长度），供外部读取
+    同时在途的发送数不超过 concurrency。返回 {"dispatched": n, "retried": n, "stopped": bool}
+    """
+    import heapq
+    import itertools
+
+    concurrency = max(1, int(concurrency or 1))
+    slots = threading.BoundedSemaphore(concurrency)
+    done_lock = threading.Lock()
+    cond = threading.Condition()
+    retry_heap = []  # (到期时间, 序号, attempt, item)
+    seq = itertools.count()
+    counters = stats if stats is not None else {}
+    counters.update(inflight=0, retried=0, retry_queue=0)
+
+    def cancelled():
+        return bool(is_cancelled and is_cancelled())
+
+    def task(item, attempt):
+        requeue = None
+        try:
+            try:
+                ok = send_one(*item)
+            except Exception as e:
+                print(f"❌ 发送异常：{e}")
+                ok = False
+            if retry is not None:
+                requeue = retry(item, ok, attempt)
+            if requeue is None and on_done is not None:
+                with done_lock:
+                    on_done(item, ok)
+        finally:
+            slots.release()
+            with cond:
+                counters["inflight"] -= 1
+                if requeue is not None:
+                    counters["retried"] += 1
+                    heapq.heappush(retry_heap, (time.monotonic() + requeue, next(seq), attempt + 1, item))
+                    counters["retry_queue"] = len(retry_heap)
+                cond.notify_all()
+
+    def next_entry():
+        """优先取已到期的重试项，其次取新收件人；都没有时返回 None"""
+        with cond:
+            if retry_heap and retry_heap[0][0] <= time.monotonic():
+                _, _, attempt, item = heapq.heappop(retry_heap)
+                counters["retry_queue"] = len(retry_heap)
+                return attempt, item
+        return None
+
+    dispatched = 0
+    stopped = False
+    source = iter(items)
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="mailer-send") as pool:
+        while True:
+            if cancelled():
+                stopped = True
+                break
+            entry = next_entry()
+            if entry is None and not exhausted:
+                try:
+                    entry = (1, next(source))
+                except StopIteration:
+                    exhausted = True
+                    continue
+            if entry is None:
+                # 新收件人已派发完：等待在途请求结束或重试项到期
+                with cond:
+                    if not retry_heap and counters["inflight"] == 0:
+                        break
+                    timeout = 1.0
+                    if retry_heap:
+                        timeout = min(timeout, max(0.0, retry_heap[0][0] - time.monotonic()))
+                    cond.wait(timeout)
+                continue
+            attempt, item = entry
+            # 先占在途名额再取令牌，避免令牌到手后还在排队导致突发
+            slots.acquire()
+            n = cost(item) if cost is not None else 1
+            if limiter is not None:
+                t0 = time.monotonic()
+                ok = limiter.acquire(cancelled, n)
+                if on_wait is not None:
+                    on_wait("rate_limit", time.monotonic() - t0)
+                if not ok:
+                    slots.release()
+                    stopped = True
+                    break
+            if gate is not None:
+                t0 = time.monotonic()
+                ok = gate(cancelled, n)
+                if on_wait is not None:
+                    on_wait("backoff", time.monotonic() - t0)
+                if not ok:
+                    slots.release()
+                    stopped = True
+                    break
+            with cond:
+                counters["inflight"] += 1
+            pool.submit(task, item, attempt)
+            dispatched += 1
+    return {"dispatched": dispatched, "retried": counters["retried"], "stopped": stopped}
+
+
+def group_batches(items, size: int, key):
+    """把相同 key 的 item 攒成批次，产出 (key, [item, ...])；各 key 分别攒满 size 即输出，结束时输出余量"""
+    size = max(1, int(size))
+    open_groups = {}
+    for item in items:
+        k = key(item)
+        group = open_groups.setdefault(k, [])
+        group.append(item)
+        if len(group) >= size:
+            del open_groups[k]
+            yield k, group
+    for k, group in open_groups.items():
+        yield k, group
@@ -0,0 +1,178 @@
+"""任务管理：每个发送任务有独立的 ID、状态、进度与结果，支持暂停 / 继续 / 取消
+
+- 暂停、取消通过进程内的 threading.Event 实现，不再轮询磁盘上的标志文件
+- 多个任务可同时运行，全局 per_hour_limit 在运行中的任务之间平均分配（暂停的任务不占份额）
+"""
+import threading
+import time
+
+from webapp.engine import TokenBucket
+from webapp.metrics import RateMeter
+
+RUNNING = "running"
+PAUSED = "paused"
+STOPPING = "stopping"
+FINISHED = ("completed", "stopped", "interrupted", "failed")
+
+
+class Job:
+    def __init__(self, job_id: int, mode: str, limiter=None):
+        self.id = job_id
+        self.mode = mode
+        self.status = RUNNING
+        self.started_at = int(time.time())
+        self.finished_at = None
+        self.progress = {"sent": 0, "success": 0, "total": 0}
+        self.result = None
+        self.limiter = limiter or TokenBucket(0)
+        # 发送引擎的运行时计数（在途数、重试队列长度），供 /api/metrics 读取
+        self.engine_stats = {}
+        self.meter = RateMeter()
+        # 分阶段剖析（webapp.profiling.StageProfiler），未开启时为 None
+        self.profiler = None
+        self._cancel = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def checkpoint(self, poll=None) -> bool:
+        """发送循环在派发前调用：暂停时阻塞直到继续或取消；返回 True 表示应停止
+
+        poll 为可选回调，在每次检查（包括暂停等待期间每秒）时调用，用于同步外部（其它 worker）的暂停 / 取消
+        """
+        if poll is not None:
+            poll()
+        while not self._resume.is_set():
+            if self._cancel.is_set():
+                return True
+            self._resume.wait(1.0)
+            if poll is not None:
+                poll()
+        return self._cancel.is_set()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "rate_per_hour": round(self.limiter.rate * 3600, 2),
+            **self.progress,
+            "result": self.result,
+        }
+
+
+class JobManager:
+    def __init__(self, keep_finished: int = 50, limiter=None):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._global_per_hour = 0
+        self.keep_finished = keep_finished
+        # 共享限速器（例如集群模式下跨进程的令牌桶）：所有任务共用，不再按任务平分
+        self.limiter = limiter
+
+    def start(self, job_id: int, mode: str, target, per_hour=None):
+        """登记任务并在后台线程运行 target(job)；同一 ID 正在运行时返回 None"""
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.status not in FINISHED:
+                return None
+            job = Job(job_id, mode, self.limiter)
+            self._jobs[job_id] = job
+            if per_hour is not None:
+                self._global_per_hour = per_hour
+            self._rebalance_locked()
+            self._trim_locked()
+
+        def run():
+            try:
+                target(job)
+            except Exception as e:
+                print(f"❌ 任务 {job_id} 异常退出：{e}")
+                self.finish(job, "interrupted", {"ok": False, "error": str(e)})
+
+        t = threading.Thread(target=run, daemon=True, name=f"mailer-job-{job_id}")
+        t.start()
+        return job
+
+    def finish(self, job: Job, status: str, result=None):
+        with self._lock:
+            if job.status in FINISHED:
+                return
+            job.status = status
+            job.result = result
+            job.finished_at = int(time.time())
+            self._rebalance_locked()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return [j.to_dict() for j in sorted(self._jobs.values(), key=lambda j: j.id, reverse=True)]
+
+    def active(self):
+        with self._lock:
+            return [j for j in self._jobs.values() if j.status not in FINISHED]
+
+    def pause(self, job_id) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != RUNNING:
+                return False
+            job._resume.clear()
+            job.status = PAUSED
+            self._rebalance_locked()
+            return True
+
+    def resume(self, job_id) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != PAUSED:
+                return False
+            job.status = RUNNING
+            self._rebalance_locked()
+            job._resume.set()
+            return True
+
+    def cancel(self, job_id) -> bool:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.status = STOPPING
+            job._cancel.set()
+            job._resume.set()
+            self._rebalance_locked()
+            return True
+
+    def cancel_all(self) -> int:
+        return sum(1 for job in self.active() if self.cancel(job.id))
+
+    def set_global_rate(self, per_hour):
+        with self._lock:
+            self._global_per_hour = per_hour
+            self._rebalance_locked()
+
+    def _rebalance_locked(self):
+        """按运行中的任务数平分全局速率；不限速时各任务也不限速"""
+        try:
+            total = float(self._global_per_hour or 0)
+        except (TypeError, ValueError):
+            total = 0.0
+        if self.limiter is not None:
+            self.limiter.set_rate(total)
+            return
+        running = [j for j in self._jobs.values() if j.status == RUNNING]
+        share = total / len(running) if (total > 0 and running) else 0
+        for j in running:
+            j.limiter.set_rate(share)
+
+    def _trim_locked(self):
+        finished = sorted((j for j in self._jobs.values() if j.status in FINISHED), key=lambda j: j.id)
+        for j in finished[:-self.keep_finished] if len(finished) > self.keep_finished else []:
+            self._jobs.pop(j.id, None)
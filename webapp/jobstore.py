@@ -0,0 +1,265 @@
+"""持久化的发送队列：每个 campaign 的收件人快照及其状态（pending / sent / failed / skipped）
+
+- 创建任务时把收件人按顺序写入快照，之后 recipients.txt 如何变化都不影响该任务
+- 发送结果由 StateWriter 缓冲后批量提交，避免每封邮件一次 fsync
+- 进程重启或线程意外退出后，未完成的任务可从 pending 状态精确续发
+- 各状态的计数在 campaign_counts 中随结果提交增量维护，读取进度不需要扫描收件人表
+- 收件人来源是生成器（边读边校验、查 MX）时先落到临时文件，写事务只包含插入，不在校验期间占用写锁
+"""
+import json
+import threading
+import time
+
+from webapp.db import ensure_schema, get_conn, connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mode TEXT NOT NULL,
+    status TEXT NOT NULL,
+    subjects TEXT NOT NULL,
+    html_body TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_recipients (
+    campaign_id INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    updated_at INTEGER,
+    PRIMARY KEY (campaign_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_campaign_recipients_state ON campaign_recipients (campaign_id, state, idx);
+CREATE TABLE IF NOT EXISTS campaign_counts (
+    campaign_id INTEGER PRIMARY KEY,
+    sent INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+# 命中抑制列表、未实际发送
+SKIPPED = "skipped"
+
+# 任务状态：running 表示有线程正在发送；进程退出后仍为 running 的任务视为 interrupted
+UNFINISHED = ("running", "stopped", "interrupted")
+
+INSERT_BATCH = 5000
+# 临时文件超过该大小才落盘，小列表只在内存中
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("jobstore", SCHEMA, conn)
+    return conn
+
+
+def _spool(recipients):
+    """把惰性来源完整读出到临时文件（每行一个 JSON 字符串），返回逐个读回的生成器"""
+    import tempfile
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode="w+", encoding="utf-8")
+    for addr in recipients:
+        f.write(json.dumps(addr, ensure_ascii=False))
+        f.write("\n")
+    f.seek(0)
+
+    def read():
+        with f:
+            for line in f:
+                yield json.loads(line)
+    return read()
+
+
+def create_campaign(mode: str, recipients, subjects, html_body: str) -> int:
+    """写入任务与收件人快照（单事务、分批 executemany），返回 campaign id
+
+    recipients 不是 list / tuple 时先读完（校验、MX 查询在此时进行），再开写事务插入
+    """
+    conn = _conn()
+    if not isinstance(recipients, (list, tuple)):
+        recipients = _spool(recipients)
+    now = int(time.time())
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO campaigns (mode, status, subjects, html_body, total, created_at, updated_at) VALUES (?, 'running', ?, ?, 0, ?, ?)",
+            (mode, json.dumps(list(subjects or []), ensure_ascii=False), html_body or "", now, now),
+        )
+        cid = cur.lastrowid
+        total = 0
+        batch = []
+        for addr in recipients:
+            total += 1
+            batch.append((cid, total, addr))
+            if len(batch) >= INSERT_BATCH:
+                conn.executemany("INSERT INTO campaign_recipients (campaign_id, idx, email) VALUES (?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO campaign_recipients (campaign_id, idx, email) VALUES (?, ?, ?)", batch)
+        conn.execute("UPDATE campaigns SET total = ? WHERE id = ?", (total, cid))
+        conn.execute("INSERT OR REPLACE INTO campaign_counts (campaign_id) VALUES (?)", (cid,))
+    return cid
+
+
+def get_campaign(cid: int):
+    row = _conn().execute(
+        "SELECT id, mode, status, subjects, html_body, total, created_at, updated_at FROM campaigns WHERE id = ?",
+        (cid,),
+    ).fetchone()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "mode": row[1],
+        "status": row[2],
+        "subjects": json.loads(row[3] or "[]"),
+        "html_body": row[4],
+        "total": row[5],
+        "created_at": row[6],
+        "updated_at": row[7],
+    }
+
+
+def set_status(cid: int, status: str):
+    conn = _conn()
+    with conn:
+        conn.execute("UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ?", (status, int(time.time()), cid))
+
+
+def mark_interrupted():
+    """进程启动时调用：上次遗留的 running 任务已没有线程在跑，标记为 interrupted 以便续发；
+    停止过程中退出的 stopping 任务标记为 stopped"""
+    conn = _conn()
+    now = int(time.time())
+    with conn:
+        conn.execute("UPDATE campaigns SET status = 'interrupted', updated_at = ? WHERE status = 'running'", (now,))
+        conn.execute("UPDATE campaigns SET status = 'stopped', updated_at = ? WHERE status = 'stopping'", (now,))
+
+
+def latest_unfinished():
+    """最近一个仍有 pending 收件人且未在运行的任务 id"""
+    row = _conn().execute(
+        "SELECT c.id FROM campaigns c WHERE c.status IN ('stopped', 'interrupted') AND EXISTS ("
+        "SELECT 1 FROM campaign_recipients r WHERE r.campaign_id = c.id AND r.state = 'pending') "
+        "ORDER BY c.id DESC LIMIT 1"
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _scan_counts(conn, cid: int) -> dict:
+    out = {PENDING: 0, SENT: 0, FAILED: 0, SKIPPED: 0}
+    for state, n in conn.execute(
+        "SELECT state, COUNT(*) FROM campaign_recipients WHERE campaign_id = ? GROUP BY state", (cid,)
+    ):
+        out[state] = n
+    return out
+
+
+def counts(cid: int) -> dict:
+    """各状态的收件人数：读 campaign_counts 一行（O(1)）；没有计数行的旧任务扫描一次后补建"""
+    conn = _conn()
+    row = conn.execute(
+        "SELECT c.total, n.sent, n.failed, n.skipped FROM campaigns c JOIN campaign_counts n ON n.campaign_id = c.id "
+        "WHERE c.id = ?",
+        (cid,),
+    ).fetchone()
+    if row is None:
+        # 在写事务内扫描并写入，与 StateWriter 的提交互斥，之后的结果都在此基础上累加
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = _scan_counts(conn, cid)
+            conn.execute(
+                "INSERT OR REPLACE INTO campaign_counts (campaign_id, sent, failed, skipped) VALUES (?, ?, ?, ?)",
+                (cid, out[SENT], out[FAILED], out[SKIPPED]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        out["total"] = sum(out.values())
+        return out
+    total, sent, failed, skipped = row
+    return {
+        PENDING: max(0, total - sent - failed - skipped),
+        SENT: sent,
+        FAILED: failed,
+        SKIPPED: skipped,
+        "total": total,
+    }
+
+
+def iter_pending(cid: int, batch: int = 1000):
+    """按原始顺序惰性读取 pending 收件人，产出 (idx, email)；用 idx 游标分页，不受并发状态更新影响"""
+    conn = _conn()
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT idx, email FROM campaign_recipients WHERE campaign_id = ? AND state = 'pending' AND idx > ? ORDER BY idx LIMIT ?",
+            (cid, last, batch),
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last = rows[-1][0]
+
+
+class StateWriter:
+    """缓冲每封邮件的发送结果，按条数或时间间隔批量提交（线程安全）"""
+
+    def __init__(self, cid: int, batch_size: int = 200, interval: float = 2.0):
+        self.cid = cid
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._buf = []
+        self._last_flush = time.monotonic()
+        self._conn = connect()
+        ensure_schema("jobstore", SCHEMA, self._conn)
+
+    def record(self, idx: int, ok: bool):
+        self.record_state(idx, SENT if ok else FAILED)
+
+    def record_state(self, idx: int, state: str):
+        with self._lock:
+            self._buf.append((state, int(time.time()), self.cid, idx))
+            if len(self._buf) >= self.batch_size or time.monotonic() - self._last_flush >= self.interval:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._buf:
+            return
+        rows, self._buf = self._buf, []
+        by_state = {}
+        for r in rows:
+            by_state.setdefault(r[0], []).append(r)
+        changed = {SENT: 0, FAILED: 0, SKIPPED: 0}
+        conn = self._conn
+        with conn:
+            # 只更新仍为 pending 的行（同一收件人重复上报时以第一次为准），实际变更数即计数增量
+            for state, rs in by_state.items():
+                before = conn.total_changes
+                conn.executemany(
+                    "UPDATE campaign_recipients SET state = ?, updated_at = ? WHERE campaign_id = ? AND idx = ? AND state = 'pending'",
+                    rs,
+                )
+                changed[state] = changed.get(state, 0) + conn.total_changes - before
+            conn.execute(
+                "UPDATE campaign_counts SET sent = sent + ?, failed = failed + ?, skipped = skipped + ? WHERE campaign_id = ?",
+                (changed[SENT], changed[FAILED], changed[SKIPPED], self.cid),
+            )
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._conn.close()
@@ -0,0 +1,173 @@
+"""Prometheus 文本格式的指标（无第三方依赖）
+
+- Counter / Histogram 按标签值元组分桶，每次更新只是一次加锁的 dict 查找与加法，可在每封邮件上调用
+- 队列深度、当前速率等瞬时值不在发送循环里维护，而是在抓取时由 collector 回调现算
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+# Postal API 调用延迟（秒）的分桶
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, v in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [各桶计数..., 总数, 总和]
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    def render(self):
+        with self._lock:
+            items = [(labels, list(row)) for labels, row in self._values.items()]
+        for labels, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                le = 'le="%s"' % _num(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(round(row[-1], 6))}"
+
+
+class RateMeter:
+    """最近 window 秒内的完成速率（条/秒）；mark() 只是一次 deque.append"""
+
+    def __init__(self, window: float = 60.0, maxlen: int = 5000, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._events = deque(maxlen=maxlen)
+
+    def mark(self, n: int = 1):
+        self._events.append((self.clock(), n))
+
+    def rate(self) -> float:
+        now = self.clock()
+        events = [e for e in list(self._events) if now - e[0] <= self.window]
+        if not events:
+            return 0.0
+        span = max(now - events[0][0], 1.0)
+        return sum(n for _, n in events) / span
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """fn() 返回 [(指标名, 类型, 说明, [(标签 dict, 值), ...]), ...]，抓取时调用"""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for m in metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.render())
+        for fn in collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(e)}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, v in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_num(v)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+MESSAGES_ATTEMPTED = REGISTRY.counter(
+    "mailer_messages_attempted_total", "Postal API 调用次数（按收件人计，含重试）", ("job", "from_address"))
+MESSAGES_SUCCEEDED = REGISTRY.counter(
+    "mailer_messages_succeeded_total", "最终发送成功的收件人数", ("job", "from_address"))
+MESSAGES_FAILED = REGISTRY.counter(
+    "mailer_messages_failed_total", "最终发送失败的收件人数（按原因）", ("job", "from_address", "reason"))
+MESSAGES_SKIPPED = REGISTRY.counter(
+    "mailer_messages_skipped_total", "发送前跳过的收件人数（按原因）", ("job", "reason"))
+POSTAL_RESPONSES = REGISTRY.counter(
+    "mailer_postal_responses_total", "Postal API 调用结果（ok / rejected / throttled / server_error / network）", ("job", "kind"))
+POSTAL_LATENCY = REGISTRY.histogram(
+    "mailer_postal_request_seconds", "单次 Postal API 调用耗时（秒）", ("job",))
+RETRIES = REGISTRY.counter(
+    "mailer_retries_total", "延后重新入队的次数", ("job",))
+WAIT_SECONDS = REGISTRY.counter(
+    "mailer_wait_seconds_total", "派发前等待的时间（秒）：rate_limit 为限速令牌，backoff 为自适应退避 / 熔断", ("job", "reason"))
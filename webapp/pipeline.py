@@ -0,0 +1,71 @@
+"""Web 任务、命令行与 Excel 发送共用的步骤：渲染、发送前校验、抑制列表、配额调度
+
+各路径调用同一组函数，配置了校验 / 配额、抑制列表有内容时行为一致
+"""
+import secrets
+import time
+
+
+def new_trace() -> str:
+    # 64位随机码 + 时间戳
+    return f"{secrets.token_hex(8)}-{int(time.time())}"
+
+
+def render_body(template_html, email: str, index: int, fields=None, trace=None, tracking=None):
+    # 占位符：{{email}}、{{index}}、{{domain}}，以及 fields 中的任意每收件人字段
+    # template_html 可以是原始字符串，也可以是预编译好的 CompiledTemplate（发送循环中复用）
+    # trace 由调用方传入时可与 Postal message id 一起登记，便于关联投递事件
+    # tracking 为 webapp.tracking.CampaignTracking 时附加打开追踪像素（改写后的链接通过 {{_trace}} 带上 trace）
+    from webapp.template import CompiledTemplate, compile_template
+    if not template_html:
+        return ""
+    tpl = template_html if isinstance(template_html, CompiledTemplate) else compile_template(template_html)
+    values = dict(fields) if fields else {}
+    values["email"] = email
+    values["index"] = index
+    values["domain"] = email.split("@", 1)[1] if "@" in email else ""
+    # 附加不可见追踪行（HTML 注释，不被展示）
+    trace = trace or new_trace()
+    values["_trace"] = trace
+    suffix = f"\n<!-- trace:{trace} -->"
+    if tracking is not None:
+        suffix += tracking.pixel(trace)
+    return tpl.render(values, suffix)
+
+
+def validator_for(core, overrides=None):
+    """按配置构建 Validator；overrides 中 validate=False 关闭校验、check_mx 覆盖配置，关闭时返回 None"""
+    from webapp.validate import Validator
+    overrides = overrides or {}
+    if overrides.get("validate") is False:
+        return None
+    check_mx = bool(overrides.get("check_mx")) if "check_mx" in overrides else core.validate_mx
+    return Validator(reject_roles=core.reject_role_accounts, check_mx=check_mx)
+
+
+def skip_suppressed(items, on_skip, email=lambda item: item[1], current=None):
+    """惰性过滤命中抑制列表（地址或整域）的条目：命中的交给 on_skip(item) 记为 skipped，其余原样产出
+
+    - email(item) 取出收件人地址，默认 item[1]（(i, addr, ...) 元组）
+    - current 为返回 SuppressionSet 的函数，每条调用一次（任务运行中可换成新快照）；默认开始时取一次快照
+    """
+    if current is None:
+        from webapp import suppression
+        snap = suppression.snapshot()
+        current = lambda: snap  # noqa: E731
+    for item in items:
+        if current().is_suppressed(email(item)):
+            on_skip(item)
+            continue
+        yield item
+
+
+def schedule_quotas(items, core, is_cancelled=None):
+    """配置了发件人 / 域名配额时按域名轮询重排：(i, addr) -> (i, addr, from_email)；未配置时原样返回
+
+    受限的域名 / 发件人不会阻塞其它收件人
+    """
+    if not core.quotas:
+        return items
+    from webapp.scheduler import QuotaScheduler
+    return QuotaScheduler(core.from_emails, core.quotas).schedule(items, is_cancelled)
@@ -0,0 +1,228 @@
+"""多 Postal 服务器 / 多 API Key 池：加权轮询、按服务器限容、健康检查与故障转移
+
+- 每个服务器有权重、每小时上限（per_hour）与最大在途数（max_inflight），以及各自的自适应控制器（429 / AIMD）
+- 选择时只考虑此刻可用的服务器（健康、未满、令牌与退避都已就绪），在其中做平滑加权轮询；都不可用时等待最早就绪的一个
+- 连续 FAIL_THRESHOLD 次 5xx / 网络错误（含超时）后摘除，RECHECK_AFTER 秒后放行一个试探请求，
+  成功即恢复，失败则摘除时间加倍（最长 MAX_RECHECK）；429 与被拒收不算故障
+- 失败的收件人仍由引擎的重试队列延后重发，重发时会选到其它健康的服务器
+- 进程内只有一个池，所有任务共享（在途数、健康状态、控制器都是全局的）；修改配置后按服务器身份
+  （名称 / 地址 / Key）保留已有服务器的状态，配置中已删除的服务器不再被选中，也不再出现在监控指标中
+"""
+import threading
+import time
+
+from webapp.backoff import controller_for
+from webapp.engine import TokenBucket, wait_or_cancel
+
+FAIL_THRESHOLD = 5
+RECHECK_AFTER = 30.0
+MAX_RECHECK = 300.0
+
+HEALTHY = "healthy"
+DOWN = "down"
+
+
+def _identity(cfg):
+    return (cfg.name or cfg.server, cfg.server, cfg.key)
+
+
+class PostalServer:
+    def __init__(self, cfg):
+        self.name = cfg.name or cfg.server
+        self.url = cfg.server
+        self.key = cfg.key
+        self.identity = _identity(cfg)
+        self.limiter = TokenBucket(cfg.per_hour)
+        self.update(cfg)
+        self.controller = controller_for(self.name)
+        self.state = HEALTHY
+        self.inflight = 0
+        self.failures = 0
+        self.down_count = 0
+        self.down_until = 0.0
+        self.probing = False
+        self.current = 0  # 平滑加权轮询的当前值
+        self.stats = {"sent": 0, "failed": 0, "ejections": 0}
+
+    def update(self, cfg):
+        """同一服务器的权重 / 上限被修改时就地生效"""
+        self.weight = max(1, int(cfg.weight or 1))
+        self.max_inflight = int(cfg.max_inflight or 0)
+        self.limiter.set_rate(cfg.per_hour)
+
+    def ready_in(self, now: float, cost: int) -> float:
+        """此刻起还需多久才能向该服务器派发；不可用（满载 / 试探中）返回 None"""
+        if self.state == DOWN:
+            if self.probing:
+                return None
+            if now < self.down_until:
+                return self.down_until - now
+        if self.max_inflight and self.inflight >= self.max_inflight:
+            return None
+        return max(self.limiter.delay(cost), self.controller.ready_in())
+
+    def snapshot(self) -> dict:
+        return {
+            "name": self.name,
+            "server": self.url,
+            "state": self.state,
+            "weight": self.weight,
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "per_hour": round(self.limiter.rate * 3600),
+            "recheck_in": round(max(0.0, self.down_until - time.monotonic()), 1) if self.state == DOWN else 0,
+            "backoff": self.controller.snapshot(),
+            **self.stats,
+        }
+
+
+class ServerPool:
+    def __init__(self, configs):
+        if not configs:
+            raise ValueError("没有配置 Postal 服务器")
+        self.configs = tuple(configs)
+        self.servers = [PostalServer(c) for c in configs]
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def reconfigure(self, configs):
+        """换成新的服务器配置：身份相同的服务器保留状态（在途数、健康、统计），其余新建"""
+        if not configs:
+            raise ValueError("没有配置 Postal 服务器")
+        configs = tuple(configs)
+        with self._lock:
+            if configs == self.configs:
+                return
+            existing = {s.identity: s for s in self.servers}
+            servers = []
+            for c in configs:
+                s = existing.pop(_identity(c), None)
+                if s is None:
+                    s = PostalServer(c)
+                else:
+                    s.update(c)
+                servers.append(s)
+            # 已删除服务器上的在途请求结束时照常 release，只是不会再被选中
+            self.servers = servers
+            self.configs = configs
+            self._changed.notify_all()
+
+    @property
+    def primary(self) -> PostalServer:
+        return self.servers[0]
+
+    def _pick_locked(self, cost: int):
+        """返回 (服务器, None) 或 (None, 建议等待秒数)"""
+        now = time.monotonic()
+        ready = []
+        wait = 1.0
+        for s in self.servers:
+            r = s.ready_in(now, cost)
+            if r is None:
+                continue
+            if r <= 0:
+                ready.append(s)
+            else:
+                wait = min(wait, r)
+        if not ready:
+            return None, wait
+        total = 0
+        best = None
+        for s in ready:
+            s.current += s.weight
+            total += s.weight
+            if best is None or s.current > best.current:
+                best = s
+        best.current -= total
+        best.inflight += 1
+        if best.state == DOWN:
+            best.probing = True
+        return best, None
+
+    def acquire(self, is_cancelled=None, cost: int = 1):
+        """阻塞到有可用服务器并占用一个在途名额，返回 PostalServer；被取消返回 None"""
+        while True:
+            with self._lock:
+                server, wait = self._pick_locked(cost)
+                if server is None:
+                    # 有请求结束（名额释放 / 试探结果）时提前醒来
+                    self._changed.wait(min(max(wait, 0.005), 1.0))
+            if server is None:
+                if is_cancelled and is_cancelled():
+                    return None
+                continue
+            # 选中时已就绪；并发选中同一服务器时取令牌最多排队一个时间片
+            if wait_or_cancel(server.limiter.reserve(cost), is_cancelled) or not server.controller.before_send(is_cancelled):
+                self.release(server, None)
+                return None
+            return server
+
+    def release(self, server: PostalServer, res):
+        """请求结束：释放名额，按结果更新健康状态并反馈给该服务器的控制器；res 为 None 表示未发出"""
+        kind = getattr(res, "kind", None)
+        if kind == "throttled":
+            server.controller.on_throttled(res.retry_after)
+        elif kind == "server_error":
+            server.controller.on_server_error()
+        elif kind == "network":
+            server.controller.on_network_error()
+        elif res is not None and res.ok:
+            server.controller.on_success()
+        with self._lock:
+            server.inflight -= 1
+            probing, server.probing = server.probing, False
+            if res is not None:
+                if kind in ("server_error", "network"):
+                    server.stats["failed"] += 1
+                    server.failures += 1
+                    if probing or server.failures >= FAIL_THRESHOLD:
+                        self._eject_locked(server)
+                else:
+                    # 服务器有响应（成功、429、拒收）即视为健康
+                    server.stats["sent"] += 1
+                    server.failures = 0
+                    if server.state == DOWN:
+                        print(f"✅ Postal 服务器 {server.name} 已恢复")
+                    server.state = HEALTHY
+                    server.down_count = 0
+            self._changed.notify_all()
+
+    def _eject_locked(self, server: PostalServer):
+        server.down_count += 1
+        delay = min(MAX_RECHECK, RECHECK_AFTER * 2 ** (server.down_count - 1))
+        server.down_until = time.monotonic() + delay
+        server.failures = 0
+        if server.state != DOWN:
+            server.stats["ejections"] += 1
+            print(f"⛔ Postal 服务器 {server.name} 连续失败，暂停使用 {int(delay)}s")
+        server.state = DOWN
+
+    def healthy(self) -> int:
+        with self._lock:
+            return sum(1 for s in self.servers if s.state == HEALTHY)
+
+    def snapshot(self):
+        with self._lock:
+            return [s.snapshot() for s in self.servers]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool_for(configs) -> ServerPool:
+    """进程内共享的池，按当前配置更新服务器列表（配置为空时抛出 ValueError）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ServerPool(configs)
+        else:
+            _pool.reconfigure(configs)
+        return _pool
+
+
+def snapshots():
+    """当前配置中各服务器的状态"""
+    with _pool_lock:
+        p = _pool
+    return p.snapshot() if p is not None else []
@@ -0,0 +1,119 @@
+"""Postal HTTP 客户端：会话、单次调用与结果分类
+
+只依赖 requests，不导入 pandas / tqdm / openpyxl，Web 发送路径与 Excel 脚本共用。
+重试、限速与任务级退避见 webapp.engine / webapp.backoff。
+"""
+import json
+from collections import namedtuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def init_session(proxy):
+    """初始化带连接重试和代理的 HTTP 会话
+    - 仅对建立连接失败做重试（请求尚未发出，重试是安全的）
+    - 429/5xx 不在这里重试，由任务级自适应控制器与引擎的重试队列统一退避，避免重试层层叠加
+    """
+    s = requests.Session()
+    retries = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=0,
+        backoff_factor=0.5,
+        allowed_methods=False,  # 对所有方法生效，包含 POST（仅连接阶段）
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retries)
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    if proxy:
+        s.proxies = {"http": proxy, "https": proxy}
+    return s
+
+
+# 单次调用 Postal 的结果
+# - ok：Postal 接受；retryable：429/5xx/网络错误等可稍后重试的失败
+# - kind：ok / rejected / throttled / server_error / network
+# - recipients：批量发送时每个收件人是否被接受
+# - messages：{收件人: (message id, token)}，用于把之后的 webhook 事件关联回收件人
+SendResult = namedtuple("SendResult", "ok kind status retryable retry_after error recipients messages", defaults=(None,))
+
+
+def post_once(session, server, key, data, label):
+    """POST /api/v1/send/message 一次，不重试、不 sleep，返回 SendResult"""
+    url = f"{server}/api/v1/send/message"
+    headers = {"X-Server-API-Key": key, "Content-Type": "application/json"}
+    try:
+        r = session.post(url, data=json.dumps(data), headers=headers, timeout=(10, 20))
+    except Exception as e:
+        print(f"⏳ {label} 网络错误：{e}")
+        return SendResult(False, "network", 0, True, None, str(e), None)
+    if r.status_code == 429:
+        print(f"⏳ {label} 触发限速 429")
+        return SendResult(False, "throttled", 429, True, r.headers.get("Retry-After"), "429 Too Many Requests", None)
+    if r.status_code >= 500:
+        print(f"⏳ {label} 服务器错误 {r.status_code}")
+        return SendResult(False, "server_error", r.status_code, True, r.headers.get("Retry-After"), f"HTTP {r.status_code}", None)
+    if r.status_code != 200:
+        print(f"❌ {label} HTTP错误 {r.status_code}：{r.text}")
+        return SendResult(False, "rejected", r.status_code, False, None, f"HTTP {r.status_code}", None)
+    try:
+        result = r.json()
+    except Exception:
+        result = {}
+    if result.get("status") != "success":
+        msg = (result.get("data") or {}).get("message", "未知错误")
+        print(f"❌ {label} 发件失败：{msg}")
+        return SendResult(False, "rejected", 200, False, None, msg, None)
+    return SendResult(True, "ok", 200, False, None, "", _accepted_recipients(result, data), _message_ids(result))
+
+
+def _accepted_recipients(result, data):
+    """按 Postal 响应 data.messages 判定每个收件人是否被接受"""
+    addrs = list(data.get("to") or []) + list(data.get("bcc") or [])
+    data_out = result.get("data") or {}
+    if "messages" not in data_out:
+        # 响应未列出逐个收件人时，以整体成功为准
+        return {a: True for a in addrs}
+    accepted = {str(k).strip().lower() for k in (data_out.get("messages") or {})}
+    return {a: a.strip().lower() in accepted for a in addrs}
+
+
+def _message_ids(result):
+    """响应 data.messages 形如 {收件人: {"id": 1, "token": "..."}}，整理为 {收件人: (id, token)}"""
+    out = {}
+    for addr, info in ((result.get("data") or {}).get("messages") or {}).items():
+        if isinstance(info, dict) and info.get("id") is not None:
+            out[str(addr).strip().lower()] = (info.get("id"), info.get("token"))
+    return out
+
+
+def _message_data(from_name, from_email, subject, html_body, to=None, bcc=None):
+    data = {
+        "from": f"{from_name} <{from_email}>",
+        "sender": from_email,
+        "subject": subject,
+        "html_body": html_body,
+    }
+    if to:
+        data["to"] = list(to)
+    if bcc:
+        data["bcc"] = list(bcc)
+    return data
+
+
+def send_mail_once(session, server, key, from_name, from_email, to_addr, subject, html_body):
+    """单收件人、单次尝试，返回 SendResult（重试由调用方决定）"""
+    data = _message_data(from_name, from_email, subject, html_body, to=[to_addr])
+    return post_once(session, server, key, data, to_addr)
+
+
+def send_batch_once(session, server, key, from_name, from_email, to_addrs, subject, html_body):
+    """多收件人（bcc）、单次尝试，返回 SendResult，recipients 为每个收件人是否被接受"""
+    data = _message_data(from_name, from_email, subject, html_body, bcc=to_addrs)
+    label = f"{to_addrs[0]} 等 {len(to_addrs)} 个收件人" if to_addrs else "空批次"
+    return post_once(session, server, key, data, label)
+
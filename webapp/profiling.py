@@ -0,0 +1,208 @@
+"""发送任务的分阶段性能剖析（按需开启）
+
+- 阶段耗时：渲染、Postal 调用、限速等待、退避等待、结果记账（落库缓冲 / 进度 / 指标）、派发检查点，
+  各阶段累计秒数与次数；另有每封（每次调用）耗时的分位数
+- 采样剖析：在指定时间窗口内按固定间隔抓取任务相关线程的调用栈，输出折叠栈（flamegraph.pl / speedscope 可直接读取）
+- 未开启时发送路径上只有一次属性读取与 None 判断；开启后每个阶段一次 perf_counter 与一次加锁累加
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+# 每封耗时保留的样本数上限（蓄水池抽样，内存与任务规模无关）
+RESERVOIR_SIZE = 20000
+SAMPLE_INTERVAL = 0.005
+MAX_SAMPLE_SECONDS = 300.0
+MAX_STACK_DEPTH = 64
+
+STAGES = ("render", "http", "wait_rate_limit", "wait_backoff", "bookkeeping", "checkpoint")
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class _Reservoir:
+    __slots__ = ("size", "values", "seen")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = []
+        self.seen = 0
+
+    def add(self, v: float):
+        self.seen += 1
+        if len(self.values) < self.size:
+            self.values.append(v)
+            return
+        j = random.randrange(self.seen)
+        if j < self.size:
+            self.values[j] = v
+
+    def summary(self) -> dict:
+        vals = sorted(self.values)
+        ms = lambda v: round(v * 1000, 3) if v is not None else None
+        return {
+            "count": self.seen,
+            "p50_ms": ms(_percentile(vals, 50)),
+            "p90_ms": ms(_percentile(vals, 90)),
+            "p99_ms": ms(_percentile(vals, 99)),
+            "max_ms": ms(vals[-1] if vals else None),
+        }
+
+
+class StageProfiler:
+    """一个任务的剖析数据；add / observe 可在任意发送线程调用"""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._stopped = None
+        self._lock = threading.Lock()
+        self._stages = {name: [0, 0.0] for name in STAGES}
+        self._message = _Reservoir(RESERVOIR_SIZE)
+        self._http = _Reservoir(RESERVOIR_SIZE)
+        self.threads = set()
+        self.sampler = None
+
+    def add(self, stage: str, seconds: float, n: int = 1):
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is None:
+                s = self._stages[stage] = [0, 0.0]
+            s[0] += n
+            s[1] += seconds
+
+    def observe(self, message_seconds: float, http_seconds: float):
+        """单次发送（渲染 + 调用）的总耗时与其中的 Postal 调用耗时"""
+        with self._lock:
+            self._message.add(message_seconds)
+            self._http.add(http_seconds)
+
+    def register_thread(self):
+        # 采样剖析只抓取登记过的线程（任务派发线程与发送线程）
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads.add(ident)
+
+    def stop(self):
+        if self._stopped is None:
+            self._stopped = time.perf_counter()
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    @property
+    def active(self) -> bool:
+        return self._stopped is None
+
+    def sample(self, seconds: float, interval: float = SAMPLE_INTERVAL):
+        """开始一个采样窗口（已有窗口在运行时先停止它）"""
+        if self.sampler is not None:
+            self.sampler.stop()
+        self.sampler = StackSampler(self.threads, min(float(seconds), MAX_SAMPLE_SECONDS), interval)
+        self.sampler.start()
+        return self.sampler
+
+    def report(self) -> dict:
+        wall = (self._stopped or time.perf_counter()) - self._t0
+        with self._lock:
+            stages = {k: (n, s) for k, (n, s) in self._stages.items()}
+            message = self._message.summary()
+            http = self._http.summary()
+        busy = sum(s for _, s in stages.values())
+        return {
+            "job_id": self.job_id,
+            "started_at": int(self.started_at),
+            "active": self.active,
+            "wall_seconds": round(wall, 3),
+            # 各阶段是所有线程的累计耗时，并发时总和会超过 wall_seconds；share 为占全部已测耗时的比例
+            "stages": {
+                k: {
+                    "count": n,
+                    "seconds": round(s, 4),
+                    "avg_ms": round(s / n * 1000, 3) if n else None,
+                    "share": round(s / busy, 4) if busy else 0.0,
+                }
+                for k, (n, s) in stages.items()
+            },
+            "per_message": message,
+            "http": http,
+            "sampling": self.sampler.summary() if self.sampler is not None else None,
+        }
+
+
+class StackSampler:
+    """按间隔抓取指定线程的调用栈并计数（sys._current_frames，不需要第三方依赖）"""
+
+    def __init__(self, threads, seconds: float, interval: float = SAMPLE_INTERVAL):
+        self.threads = threads
+        self.seconds = seconds
+        self.interval = max(0.001, interval)
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="mailer-profiler")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        end = time.monotonic() + self.seconds
+        own = threading.get_ident()
+        while not self._stop.is_set() and time.monotonic() < end:
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                if ident == own:
+                    continue
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+            self.samples += 1
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+
+    def summary(self) -> dict:
+        leaves = Counter()
+        for stack, n in list(self.stacks.items()):
+            leaves[stack.rsplit(";", 1)[-1]] += n
+        total = sum(leaves.values())
+        return {
+            "running": self.running,
+            "seconds": self.seconds,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "distinct_stacks": len(self.stacks),
+            # 最常见的栈顶函数（线程所处位置），完整调用栈见折叠栈下载
+            "top": [{"frame": f, "share": round(n / total, 4)} for f, n in leaves.most_common(10)] if total else [],
+        }
+
+    def folded(self) -> str:
+        """折叠栈格式：每行 "外层;...;内层 次数" """
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def _fold(frame) -> str:
+    parts = []
+    while frame is not None and len(parts) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
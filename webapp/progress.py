@@ -0,0 +1,72 @@
+"""发送进度：内存中维护最新快照，节流落盘，并支持 SSE 长连接等待变化
+
+- update() 只改内存并唤醒等待者，每封邮件都调用也没有文件 IO
+- 落盘间隔默认 2 秒，终态（completed / stopped 等）立即落盘；写临时文件后原子替换，读取方不会读到半个文件
+- wait() 供 SSE 使用：阻塞到版本号变化或超时
+"""
+import json
+import os
+import threading
+import time
+
+TERMINAL = ("completed", "stopped", "interrupted", "failed", "idle")
+
+
+class ProgressState:
+    def __init__(self, path: str, persist_interval: float = 2.0):
+        self.path = path
+        self.persist_interval = persist_interval
+        self._cond = threading.Condition()
+        self._data = None
+        self._version = 0
+        self._last_persist = 0.0
+
+    def update(self, data: dict):
+        data = dict(data)
+        data["updated_at"] = int(time.time())
+        with self._cond:
+            self._data = data
+            self._version += 1
+            self._cond.notify_all()
+            now = time.monotonic()
+            due = data.get("status") in TERMINAL or now - self._last_persist >= self.persist_interval
+            if due:
+                self._last_persist = now
+        if due:
+            self._persist(data)
+
+    def patch(self, **fields):
+        """在当前快照上修改部分字段（例如 status=stopping）"""
+        data = self.snapshot()
+        data.update(fields)
+        self.update(data)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            if self._data is not None:
+                return dict(self._data)
+        # 进程刚启动时内存为空，回退到上次落盘的结果
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {"status": "idle"}
+
+    def wait(self, last_version: int, timeout: float):
+        """等待版本号超过 last_version；返回 (version, 快照或 None 表示超时无变化)"""
+        with self._cond:
+            if self._version == last_version:
+                self._cond.wait(timeout)
+            if self._version == last_version:
+                return last_version, None
+            version = self._version
+        return version, self.snapshot()
+
+    def _persist(self, data: dict):
+        tmp = f"{self.path}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except Exception:
+            pass
@@ -0,0 +1,358 @@
+"""收件人库：SQLite 表 + 规范化地址唯一索引
+
+- 追加写入（INSERT OR IGNORE），不再整体读取、打乱并重写 recipients.txt
+- 成员判断走唯一索引，分页读取用 id 游标，计数为精确值
+- 旧的 recipients.txt 首次使用时自动导入一次；文本导入导出仍然可用
+- 按域名 / 状态 / 关键字筛选的查询都用 id 游标分批读取，内存与列表大小无关；按域名计数在内存中增量维护
+- 后台导入的进度记录在 recipient_imports 表中，多 worker 部署时任意进程都能查询
+"""
+import codecs
+import os
+import re
+import threading
+import time
+
+from webapp.db import PROJECT_ROOT, ensure_schema, get_conn
+
+LEGACY_TXT_PATH = os.path.join(PROJECT_ROOT, "recipients.txt")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipients (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    norm TEXT NOT NULL UNIQUE,
+    domain TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipients_domain ON recipients (domain, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS recipient_imports (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT NOT NULL DEFAULT '',
+    bytes_total INTEGER NOT NULL DEFAULT 0,
+    bytes_read INTEGER NOT NULL DEFAULT 0,
+    parsed INTEGER NOT NULL DEFAULT 0,
+    appended INTEGER NOT NULL DEFAULT 0,
+    duplicates INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    error TEXT,
+    started_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+WRITE_BATCH = 5000
+READ_CHUNK = 64 * 1024
+# 文本 / CSV 中的分隔符：空白、逗号、分号、引号、尖括号
+_TOKEN_SPLIT = re.compile(r"[\s,;\"'<>]+")
+
+# 状态筛选：active 为未被抑制，suppressed 为命中抑制列表（地址或整域）
+STATUSES = ("active", "suppressed")
+_SUPPRESSED = (
+    "EXISTS (SELECT 1 FROM suppression s WHERE s.address = recipients.norm OR s.address = '@' || recipients.domain)"
+)
+
+
+def normalize(email: str) -> str:
+    """去重使用的规范化地址"""
+    return email.strip().lower()
+
+
+def domain_of(email: str) -> str:
+    return email.rsplit("@", 1)[-1].strip().lower() if "@" in email else ""
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("recipients", SCHEMA, conn)
+    _migrate_legacy(conn)
+    return conn
+
+
+_migrated = set()
+
+
+def _migrate_legacy(conn):
+    """把旧版 recipients.txt 导入库中（每个数据库只做一次）"""
+    from webapp import db
+    if db.DB_PATH in _migrated:
+        return
+    _migrated.add(db.DB_PATH)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'legacy_txt_imported'").fetchone()
+    if row:
+        return
+    if os.path.exists(LEGACY_TXT_PATH):
+        with open(LEGACY_TXT_PATH, "r", encoding="utf-8") as f:
+            _insert(conn, (line.strip() for line in f))
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_txt_imported', ?)", (str(int(time.time())),))
+
+
+def _insert(conn, emails) -> int:
+    """分批 INSERT OR IGNORE，返回实际新增条数"""
+    before = conn.total_changes
+    now = int(time.time())
+    batch = []
+    with conn:
+        for e in emails:
+            e = (e or "").strip()
+            if not e or "@" not in e:
+                continue
+            batch.append((e, normalize(e), domain_of(e), now))
+            if len(batch) >= WRITE_BATCH:
+                conn.executemany("INSERT OR IGNORE INTO recipients (email, norm, domain, created_at) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT OR IGNORE INTO recipients (email, norm, domain, created_at) VALUES (?, ?, ?, ?)", batch)
+    return conn.total_changes - before
+
+
+def add_many(emails) -> dict:
+    """追加收件人（按规范化地址去重、保留首次出现的写法），返回 {"total", "appended"}"""
+    conn = _conn()
+    appended = _insert(conn, emails)
+    return {"total": count(), "appended": appended}
+
+
+def add_stream(emails, on_batch=None, batch_size: int = WRITE_BATCH) -> dict:
+    """流式追加：每攒够 batch_size 条提交一次，内存占用与输入大小无关
+
+    on_batch(parsed, appended) 在每批提交后回调，用于上报进度
+    """
+    conn = _conn()
+    parsed = appended = 0
+    batch = []
+    for e in emails:
+        batch.append(e)
+        if len(batch) >= batch_size:
+            parsed += len(batch)
+            appended += _insert(conn, batch)
+            batch = []
+            if on_batch:
+                on_batch(parsed, appended)
+    if batch:
+        parsed += len(batch)
+        appended += _insert(conn, batch)
+    if on_batch:
+        on_batch(parsed, appended)
+    return {"parsed": parsed, "appended": appended, "duplicates": parsed - appended, "total": count()}
+
+
+def iter_tokens(stream, chunk_size: int = READ_CHUNK, encoding: str = "utf-8-sig"):
+    """从二进制流中按块增量解析邮箱（兼容每行一个、逗号/分号分隔以及 CSV）
+
+    每次只读 chunk_size 字节，跨块的半截地址留到下一块拼接
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+    tail = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        parts = _TOKEN_SPLIT.split(tail + decoder.decode(chunk))
+        tail = parts.pop()
+        for p in parts:
+            if "@" in p:
+                yield p
+    for p in _TOKEN_SPLIT.split(tail + decoder.decode(b"", final=True)):
+        if "@" in p:
+            yield p
+
+
+def contains(email: str) -> bool:
+    row = _conn().execute("SELECT 1 FROM recipients WHERE norm = ?", (normalize(email),)).fetchone()
+    return row is not None
+
+
+def count() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM recipients").fetchone()[0]
+
+
+def page(after_id: int = 0, limit: int = 50):
+    """按插入顺序分页，返回 [(id, email), ...]；下一页传入最后一条的 id"""
+    return _conn().execute(
+        "SELECT id, email FROM recipients WHERE id > ? ORDER BY id LIMIT ?", (int(after_id or 0), int(limit))
+    ).fetchall()
+
+
+def _where(conn, domain=None, status=None, q=None):
+    """筛选条件，返回 (SQL 片段列表, 参数列表)；未知状态抛出 ValueError"""
+    clauses, params = [], []
+    if domain:
+        clauses.append("domain = ?")
+        params.append(domain.strip().lower().lstrip("@"))
+    if status:
+        if status not in STATUSES:
+            raise ValueError(f"未知的状态：{status}（可选 {', '.join(STATUSES)}）")
+        from webapp import suppression
+        ensure_schema("suppression", suppression.SCHEMA, conn)
+        clauses.append(_SUPPRESSED if status == "suppressed" else "NOT " + _SUPPRESSED)
+    if q:
+        # 子串匹配（不区分大小写）；按 id 顺序扫描，凑满一页即停
+        esc = q.strip().lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("norm LIKE ? ESCAPE '\\'")
+        params.append(f"%{esc}%")
+    return clauses, params
+
+
+def query(after_id: int = 0, limit: int = 50, domain=None, status=None, q=None):
+    """筛选后按 id 分页，返回 [(id, email, domain, created_at), ...]；下一页传入最后一条的 id"""
+    conn = _conn()
+    clauses, params = _where(conn, domain, status, q)
+    where = " AND ".join(["id > ?"] + clauses)
+    return conn.execute(
+        f"SELECT id, email, domain, created_at FROM recipients WHERE {where} ORDER BY id LIMIT ?",
+        [int(after_id or 0)] + params + [int(limit)],
+    ).fetchall()
+
+
+def iter_rows(domain=None, status=None, q=None, batch: int = WRITE_BATCH):
+    """按插入顺序惰性遍历筛选结果 (id, email, domain, created_at)"""
+    last = 0
+    while True:
+        rows = query(last, batch, domain, status, q)
+        if not rows:
+            return
+        yield from rows
+        last = rows[-1][0]
+
+
+class _DomainCounts:
+    """按域名计数的内存缓存：表只追加或整体清空，新行只需聚合 id 大于上次位置的部分
+
+    清空后重新写入的 id 都大于旧的最大 id，最小 id 因此改变，据此判断需要重算
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db = None
+        self._first = None
+        self._last = 0
+        self._counts = {}
+
+    def get(self) -> dict:
+        from webapp import db
+        conn = _conn()
+        with self._lock:
+            first, last = conn.execute("SELECT MIN(id), MAX(id) FROM recipients").fetchone()
+            if first is None:
+                self._db, self._first, self._last, self._counts = db.DB_PATH, None, 0, {}
+                return {}
+            if self._db != db.DB_PATH or first != self._first:
+                self._db, self._first, self._last, self._counts = db.DB_PATH, first, 0, {}
+            if last > self._last:
+                for domain, n in conn.execute(
+                    "SELECT domain, COUNT(*) FROM recipients WHERE id > ? AND id <= ? GROUP BY domain", (self._last, last)
+                ):
+                    self._counts[domain] = self._counts.get(domain, 0) + n
+                self._last = last
+            return dict(self._counts)
+
+
+_domain_counts = _DomainCounts()
+
+
+def domain_counts(limit: int = 0):
+    """各域名的收件人数，按数量降序返回 [(domain, count), ...]；limit 为 0 时返回全部"""
+    items = sorted(_domain_counts.get().items(), key=lambda kv: (-kv[1], kv[0]))
+    return items[:limit] if limit else items
+
+
+def iter_emails(batch: int = WRITE_BATCH):
+    """按插入顺序惰性遍历全部收件人"""
+    last = 0
+    while True:
+        rows = page(last, batch)
+        if not rows:
+            return
+        for _, email in rows:
+            yield email
+        last = rows[-1][0]
+
+
+def clear():
+    conn = _conn()
+    with conn:
+        conn.execute("DELETE FROM recipients")
+
+
+_IMPORT_FIELDS = ("status", "bytes_read", "parsed", "appended", "duplicates", "total", "error")
+
+
+def create_import(import_id: str, filename: str, bytes_total: int, keep: int = 20):
+    """登记一个后台导入任务（状态 running），只保留最近 keep 条记录"""
+    conn = _conn()
+    now = int(time.time())
+    with conn:
+        conn.execute(
+            "INSERT INTO recipient_imports (id, status, filename, bytes_total, started_at, updated_at) VALUES (?, 'running', ?, ?, ?, ?)",
+            (import_id, filename or "", bytes_total, now, now),
+        )
+        conn.execute(
+            "DELETE FROM recipient_imports WHERE rowid NOT IN (SELECT rowid FROM recipient_imports ORDER BY rowid DESC LIMIT ?)",
+            (keep,),
+        )
+
+
+def update_import(import_id: str, **fields):
+    """更新导入进度；只接受 _IMPORT_FIELDS 中的字段"""
+    cols = [k for k in fields if k in _IMPORT_FIELDS]
+    conn = _conn()
+    with conn:
+        conn.execute(
+            f"UPDATE recipient_imports SET {''.join(f'{c} = ?, ' for c in cols)}updated_at = ? WHERE id = ?",
+            [fields[c] for c in cols] + [int(time.time()), import_id],
+        )
+
+
+def get_import(import_id: str):
+    """导入任务的当前状态（dict），不存在时返回 None"""
+    conn = _conn()
+    cur = conn.execute("SELECT * FROM recipient_imports WHERE id = ?", (import_id,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    state = dict(zip([d[0] for d in cur.description], row))
+    return {k: v for k, v in state.items() if v is not None}
+
+
+def import_text(path: str) -> dict:
+    """从每行一个邮箱的文本文件导入"""
+    with open(path, "r", encoding="utf-8") as f:
+        return add_many(line.strip() for line in f)
+
+
+def iter_export(fmt: str = "txt", domain=None, status=None, q=None, chunk_size: int = READ_CHUNK):
+    """按筛选条件导出，产出约 chunk_size 字节的文本块；fmt 为 txt（每行一个邮箱，与旧版 recipients.txt 格式一致）或 csv"""
+    import csv
+    import io
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n") if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(("email", "domain", "created_at"))
+    for _, email, dom, created_at in iter_rows(domain, status, q):
+        if writer is not None:
+            writer.writerow((email, dom, created_at))
+        else:
+            buf.write(email + "\n")
+        if buf.tell() >= chunk_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """把文本块流式压缩为 gzip（每块压缩后立即输出，不在内存中攒整份文件）"""
+    import zlib
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
@@ -0,0 +1,127 @@
+"""Excel / CSV 的流式行读取：逐行产出，内存占用与文件行数无关
+
+- .xlsx / .xlsm：openpyxl 只读模式（按需解析 XML，不把整张表载入内存）
+- .csv / .tsv / .txt：标准库 csv，按行读取（兼容 UTF-8 BOM）
+- .xls：旧格式没有流式读取方式，退回 pandas.read_excel（仅在这种情况下才导入 pandas）
+- 第一行为表头；默认第一列为邮箱、第二列为内容，其余列按表头名作为个性化字段，也可按表头名或序号指定
+"""
+import csv
+import os
+
+CSV_EXTS = (".csv", ".tsv", ".txt")
+XLSX_EXTS = (".xlsx", ".xlsm")
+
+
+class RowFormatError(ValueError):
+    pass
+
+
+class Row:
+    __slots__ = ("index", "email", "body", "fields")
+
+    def __init__(self, index: int, email: str, body: str, fields: dict):
+        self.index = index
+        self.email = email
+        self.body = body
+        self.fields = fields
+
+
+def _cell(v) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        v = int(v)
+    return str(v).strip()
+
+
+def _resolve(header, spec, default: int) -> int:
+    """列说明可以是表头名或从 0 开始的序号；未指定时用 default"""
+    if spec is None or spec == "":
+        return default
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        i = int(spec)
+        if i >= len(header):
+            raise RowFormatError(f"列序号 {i} 超出范围（共 {len(header)} 列）")
+        return i
+    try:
+        return header.index(str(spec).strip())
+    except ValueError:
+        raise RowFormatError(f"未找到列：{spec}")
+
+
+class RowSource:
+    """可迭代的行来源：for row in source -> Row；total 为预估数据行数（未知时为 None）"""
+
+    def __init__(self, path: str, email_column=None, body_column=None, sheet=None, encoding="utf-8-sig"):
+        self.path = path
+        self.email_column = email_column
+        self.body_column = body_column
+        self.sheet = sheet
+        self.encoding = encoding
+        self.total = None
+        self.header = []
+        self._rows, self._close = self._open()
+        try:
+            first = next(self._rows)
+        except StopIteration:
+            first = None
+        self.header = [_cell(h) for h in (first or [])]
+        if len(self.header) < 2:
+            self.close()
+            raise RowFormatError("文件格式错误：至少需要两列（邮箱、内容）")
+        self._email_i = _resolve(self.header, email_column, 0)
+        self._body_i = _resolve(self.header, body_column, 1)
+        # 其余列作为个性化字段，表头名为占位符名
+        self._extra = [
+            (i, name) for i, name in enumerate(self.header)
+            if i not in (self._email_i, self._body_i) and name
+        ]
+
+    def _open(self):
+        ext = os.path.splitext(self.path)[1].lower()
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(self.path)
+        if ext in CSV_EXTS:
+            f = open(self.path, "r", encoding=self.encoding, newline="")
+            delimiter = "\t" if ext == ".tsv" else ","
+            return iter(csv.reader(f, delimiter=delimiter)), f.close
+        if ext in XLSX_EXTS:
+            from openpyxl import load_workbook
+            wb = load_workbook(self.path, read_only=True, data_only=True)
+            ws = wb[self.sheet] if self.sheet else wb.worksheets[0]
+            # 只读模式下 max_row 来自文件里的 dimension 记录，可能缺失
+            if ws.max_row:
+                self.total = max(0, ws.max_row - 1)
+            return ws.iter_rows(values_only=True), wb.close
+        # .xls 等旧格式：只能整表读入
+        import pandas as pd
+        df = pd.read_excel(self.path, sheet_name=self.sheet or 0, header=None, dtype=object)
+        self.total = max(0, len(df) - 1)
+        return (tuple(None if v != v else v for v in r) for r in df.itertuples(index=False)), lambda: None
+
+    def __iter__(self):
+        email_i, body_i, extra = self._email_i, self._body_i, self._extra
+        index = 0
+        try:
+            for values in self._rows:
+                if not values:
+                    continue
+                email = _cell(values[email_i]) if email_i < len(values) else ""
+                if not email:
+                    # 跳过空行（只读模式下表尾常有格式残留的空行）
+                    continue
+                index += 1
+                body = _cell(values[body_i]) if body_i < len(values) else ""
+                fields = {name: _cell(values[i]) for i, name in extra if i < len(values)}
+                yield Row(index, email, body, fields)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close is not None:
+            close, self._close = self._close, None
+            close()
+
+
+def open_rows(path: str, email_column=None, body_column=None, sheet=None) -> RowSource:
+    return RowSource(path, email_column=email_column, body_column=body_column, sheet=sheet)
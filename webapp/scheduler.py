@@ -0,0 +1,265 @@
+"""按发件邮箱 / 收件域名分别限额的调度器
+
+- 每个发件邮箱、每个收件域名各自有小时/日配额（固定时间窗计数，计数存放在数据库中，所有任务共用）
+- 收件人按域名分桶后轮询取出，某个域名额度用尽时跳过它继续发其它域名，不阻塞整个队列
+- 发件邮箱默认仍按 pick_from 的轮询顺序，首选邮箱额度用尽时顺延到下一个有额度的邮箱
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+
+from webapp.engine import wait_or_cancel
+
+HOUR = 3600
+DAY = 86400
+# 预读窗口：最多缓存多少个尚未派发的收件人，保证内存有界；
+# 已缓存的域名全部受限时窗口逐步放大，以便找到后面其它域名的收件人
+LOOKAHEAD = 5000
+MAX_LOOKAHEAD = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quota_usage (
+    key TEXT NOT NULL,
+    span INTEGER NOT NULL,
+    win INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, span, win)
+) WITHOUT ROWID;
+"""
+
+
+def _as_int(v) -> int:
+    try:
+        return max(0, int(v or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Quota:
+    """单个 key 的小时/日配额，0 表示不限；计数存放在 QuotaUsage 中"""
+
+    __slots__ = ("key", "per_hour", "per_day")
+
+    def __init__(self, key="", per_hour=0, per_day=0):
+        self.key = key
+        self.per_hour = _as_int(per_hour)
+        self.per_day = _as_int(per_day)
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.per_hour and not self.per_day
+
+    def windows(self, now):
+        """当前生效的固定时间窗 [(窗口长度, 窗口编号, 上限)]"""
+        out = []
+        if self.per_hour:
+            out.append((HOUR, int(now // HOUR), self.per_hour))
+        if self.per_day:
+            out.append((DAY, int(now // DAY), self.per_day))
+        return out
+
+
+class QuotaUsage:
+    """配额计数，存放在 mailer.db 的 quota_usage 表
+
+    并发的任务、中断后续发的任务以及集群中的其它 worker 共用同一份计数，配额对所有发送合计生效；
+    计数在派发时原子地检查并累加（BEGIN IMMEDIATE），不会因并发而超额
+    """
+
+    def __init__(self):
+        from webapp.db import connect, ensure_schema
+        self._conn = connect()
+        ensure_schema("scheduler", SCHEMA, self._conn)
+        self._lock = threading.Lock()
+        self._pruned = -1
+
+    def _wait(self, quota: Quota, now) -> float:
+        wait = 0.0
+        for span, win, limit in quota.windows(now):
+            row = self._conn.execute(
+                "SELECT count FROM quota_usage WHERE key = ? AND span = ? AND win = ?", (quota.key, span, win)
+            ).fetchone()
+            if row and row[0] >= limit:
+                wait = max(wait, (win + 1) * span - now)
+        return wait
+
+    def wait_time(self, quota: Quota, now) -> float:
+        """距离可以再发一封还需等待的秒数，0 表示当前可发"""
+        if quota.unlimited:
+            return 0.0
+        with self._lock:
+            return self._wait(quota, now)
+
+    def try_consume(self, quotas, now) -> bool:
+        """所有配额都有余量时各计一封并返回 True，否则不计数、返回 False"""
+        quotas = [q for q in quotas if q is not None and not q.unlimited]
+        if not quotas:
+            return True
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if any(self._wait(q, now) > 0 for q in quotas):
+                    conn.execute("ROLLBACK")
+                    return False
+                conn.executemany(
+                    "INSERT INTO quota_usage (key, span, win, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(key, span, win) DO UPDATE SET count = count + 1",
+                    [(q.key, span, win) for q in quotas for span, win, _ in q.windows(now)],
+                )
+                hour = int(now // HOUR)
+                if hour != self._pruned:
+                    # 清理已结束的时间窗
+                    conn.execute("DELETE FROM quota_usage WHERE (win + 1) * span <= ?", (now,))
+                    self._pruned = hour
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def close(self):
+        self._conn.close()
+
+
+def quota_settings(setting: dict) -> dict:
+    """从 [setting] 中读取配额配置，返回统一结构；未配置任何限额时返回空 dict
+
+    支持的字段：sender_per_hour / sender_per_day / domain_per_hour / domain_per_day，
+    以及 [setting.domain_limits] 表为单个域名覆盖，值可为整数（每小时）或 {per_hour, per_day}
+    """
+    out = {
+        "sender_per_hour": _as_int(setting.get("sender_per_hour")),
+        "sender_per_day": _as_int(setting.get("sender_per_day")),
+        "domain_per_hour": _as_int(setting.get("domain_per_hour")),
+        "domain_per_day": _as_int(setting.get("domain_per_day")),
+    }
+    overrides = {}
+    raw = setting.get("domain_limits") or {}
+    if isinstance(raw, dict):
+        for domain, v in raw.items():
+            d = str(domain).strip().lower()
+            if not d:
+                continue
+            if isinstance(v, dict):
+                overrides[d] = (_as_int(v.get("per_hour")), _as_int(v.get("per_day")))
+            else:
+                overrides[d] = (_as_int(v), 0)
+    out["domain_limits"] = overrides
+    if not any(v for k, v in out.items() if k != "domain_limits") and not overrides:
+        return {}
+    return out
+
+
+def _domain_of(addr: str) -> str:
+    return addr.rsplit("@", 1)[-1].strip().lower() if "@" in addr else ""
+
+
+class QuotaScheduler:
+    """把 (i, addr) 序列重排为 (i, addr, from_email)，同时遵守发件人与收件域名配额
+
+    usage 为配额计数（默认每次 schedule() 新建一个读写 mailer.db 的 QuotaUsage）
+    """
+
+    def __init__(self, senders, quotas=None, clock=time.time, usage=None):
+        quotas = quotas or {}
+        self.senders = list(senders or [])
+        self.clock = clock
+        self.usage = usage
+        self._sender_q = {
+            s: Quota(f"sender:{s.strip().lower()}", quotas.get("sender_per_hour"), quotas.get("sender_per_day"))
+            for s in self.senders
+        }
+        self._domain_default = (quotas.get("domain_per_hour", 0), quotas.get("domain_per_day", 0))
+        self._domain_limits = dict(quotas.get("domain_limits") or {})
+        self._domain_q = {}
+
+    def _domain_quota(self, domain: str) -> Quota:
+        q = self._domain_q.get(domain)
+        if q is None:
+            per_hour, per_day = self._domain_limits.get(domain, self._domain_default)
+            q = self._domain_q[domain] = Quota(f"domain:{domain}", per_hour, per_day)
+        return q
+
+    def _pick_sender(self, usage, i: int, now):
+        """从 pick_from 的首选邮箱开始顺延，返回 (邮箱, 0) 或 (None, 最短等待秒数)"""
+        if not self.senders:
+            return None, 0.0
+        n = len(self.senders)
+        min_wait = None
+        for k in range(n):
+            s = self.senders[(i - 1 + k) % n]
+            w = usage.wait_time(self._sender_q[s], now)
+            if w <= 0:
+                return s, 0.0
+            min_wait = w if min_wait is None else min(min_wait, w)
+        return None, min_wait
+
+    def schedule(self, items, is_cancelled=None):
+        """生成器：按域名轮询输出 (i, addr, from_email)；全部受限时等待最早恢复的窗口"""
+        usage = self.usage or QuotaUsage()
+        try:
+            yield from self._schedule(usage, items, is_cancelled)
+        finally:
+            if usage is not self.usage:
+                usage.close()
+
+    def _schedule(self, usage, items, is_cancelled):
+        source = iter(items)
+        exhausted = False
+        buckets = OrderedDict()  # domain -> deque[(i, addr)]
+        buffered = 0
+        window = LOOKAHEAD
+
+        while True:
+            while not exhausted and buffered < window:
+                try:
+                    i, addr = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+                buckets.setdefault(_domain_of(addr), deque()).append((i, addr))
+                buffered += 1
+            if not buckets:
+                return
+
+            now = self.clock()
+            picked = None
+            lost = False
+            min_wait = None
+            # 轮询各域名：每轮从队首域名取一封，然后把该域名移到队尾
+            for domain in list(buckets.keys()):
+                dq = self._domain_quota(domain)
+                w = usage.wait_time(dq, now)
+                if w > 0:
+                    min_wait = w if min_wait is None else min(min_wait, w)
+                    buckets.move_to_end(domain)
+                    continue
+                i, addr = buckets[domain][0]
+                sender, sw = self._pick_sender(usage, i, now)
+                if sender is None and self.senders:
+                    min_wait = sw if min_wait is None else min(min_wait, sw)
+                    break  # 发件人额度与域名无关，全部用尽时换域名也没有意义
+                if not usage.try_consume([dq, self._sender_q.get(sender)], now):
+                    lost = True  # 额度刚被其它任务用掉，重新选择
+                    break
+                buckets[domain].popleft()
+                if not buckets[domain]:
+                    del buckets[domain]
+                else:
+                    buckets.move_to_end(domain)
+                picked = (i, addr, sender)
+                break
+
+            if picked is not None:
+                buffered -= 1
+                yield picked
+                continue
+            if lost:
+                continue
+            # 所有已缓存的域名都受限：先扩大预读窗口，仍然没有可发的再等待最早恢复的窗口
+            if not exhausted and window < MAX_LOOKAHEAD:
+                window = min(window * 2, MAX_LOOKAHEAD)
+                continue
+            if wait_or_cancel((min_wait or 1.0) + 0.01, is_cancelled):
+                return
@@ -0,0 +1,299 @@
+"""config.toml 的缓存与校验
+
+- 解析结果为不可变的 Settings（frozen dataclass），类型在加载时校验，错误汇总为 SettingsError，
+  不再因为一个写错的 per_hour_limit 被静默当作“不限速”
+- 进程内按文件路径缓存，文件 mtime / 大小变化或通过 save() 保存时失效；读取只需一次 os.stat
+- 原始 dict 仍可取出（供 /api/config 回显），返回的是副本
+"""
+import copy
+import os
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import toml
+
+from webapp.engine import DEFAULT_CONCURRENCY, MAX_CONCURRENCY
+
+MAX_BATCH_SIZE = 50
+
+
+class SettingsError(ValueError):
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("；".join(self.errors))
+
+
+@dataclass(frozen=True, slots=True)
+class ServerConfig:
+    """[[postal.servers]] 中的一项（只配置了 server / key 时由它们生成唯一的一项）"""
+    server: str
+    key: str
+    name: str = ""
+    # 加权轮询的权重
+    weight: int = 1
+    # 该服务器 / 凭据的每小时上限与最大在途请求数，0 表示不限
+    per_hour: int = 0
+    max_inflight: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    # 首个 Postal 服务器（兼容旧配置）与全部服务器
+    server: str = ""
+    key: str = ""
+    servers: tuple = ()
+    from_name: str = ""
+    # 首个发件邮箱（兼容旧的 from_email）与全部发件邮箱
+    from_email: str = ""
+    from_emails: tuple = ()
+    subject: str = ""
+    subjects: tuple = ()
+    # 全局每小时上限，0 表示不限速
+    per_hour_limit: int = 0
+    # Excel 发送的每小时上限：旧的 setting.limit 为每分钟上限（×60）；显式配置 per_hour_limit 时与其相同
+    excel_per_hour: int = 0
+    concurrency: int = DEFAULT_CONCURRENCY
+    # 模板不含每收件人变量时每次 API 调用的收件人数，0/1 表示关闭
+    batch_size: int = 0
+    # 发件邮箱 / 收件域名配额（未配置为空），见 webapp.scheduler.quota_settings
+    quotas: MappingProxyType = field(default_factory=lambda: MappingProxyType({}))
+    # 拒绝 info@ / sales@ 等角色账号（默认关闭，已有列表的行为不变）
+    reject_role_accounts: bool = False
+    validate_mx: bool = False
+    proxy: str = ""
+    # 打开 / 点击追踪，tracking_url 为收件人可访问的本服务地址（如 https://mailer.example.com）
+    track_opens: bool = False
+    track_clicks: bool = False
+    tracking_url: str = ""
+    # 去重规范化规则，见 webapp.dedupe.RULES
+    dedupe_rules: tuple = ("lower",)
+
+
+def _int(errors, name, value, default=0, minimum=0, maximum=None) -> int:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        errors.append(f"{name} 应为整数，实际为 {value!r}")
+        return default
+    try:
+        f = float(value)
+        n = int(f)
+        if f != n:
+            raise ValueError
+    except (TypeError, ValueError):
+        errors.append(f"{name} 应为整数，实际为 {value!r}")
+        return default
+    if n < minimum:
+        errors.append(f"{name} 不能小于 {minimum}")
+        return default
+    if maximum is not None and n > maximum:
+        return maximum
+    return n
+
+
+def _bool(errors, name, value, default) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    s = str(value).strip().lower()
+    if s in ("true", "1", "yes", "on"):
+        return True
+    if s in ("false", "0", "no", "off"):
+        return False
+    errors.append(f"{name} 应为布尔值，实际为 {value!r}")
+    return default
+
+
+def _str_list(errors, name, value) -> tuple:
+    if value is None or value == "":
+        return ()
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        errors.append(f"{name} 应为字符串数组")
+        return ()
+    return tuple(str(v).strip() for v in value if str(v).strip())
+
+
+def _servers(errors, postal) -> tuple:
+    items = postal.get("servers")
+    if items in (None, "", []):
+        server = str(postal.get("server") or "").strip().rstrip("/")
+        key = str(postal.get("key") or "").strip()
+        return (ServerConfig(server=server, key=key, name=server),) if server else ()
+    if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+        errors.append("postal.servers 应为表数组（[[postal.servers]]）")
+        return ()
+    out = []
+    urls = [str(i.get("server") or "").strip().rstrip("/") for i in items]
+    for n, item in enumerate(items, 1):
+        name = f"postal.servers[{n}]"
+        server = str(item.get("server") or "").strip().rstrip("/")
+        key = str(item.get("key") or "").strip()
+        if not server or not key:
+            errors.append(f"{name} 需要 server 与 key")
+            continue
+        out.append(ServerConfig(
+            server=server,
+            key=key,
+            # 未命名时以地址为名；同一地址配置了多个 key 时加序号区分（各自独立退避）
+            name=str(item.get("name") or "").strip() or (server if urls.count(server) == 1 else f"{server}#{n}"),
+            weight=_int(errors, f"{name}.weight", item.get("weight"), 1, 1),
+            per_hour=_int(errors, f"{name}.per_hour", item.get("per_hour")),
+            max_inflight=_int(errors, f"{name}.max_inflight", item.get("max_inflight")),
+        ))
+    return tuple(out)
+
+
+def parse(cfg: dict) -> Settings:
+    """校验并构建 Settings；有任何字段不合法时抛出 SettingsError（列出全部错误）"""
+    from webapp.scheduler import quota_settings
+
+    errors = []
+    if not isinstance(cfg, dict):
+        raise SettingsError(["配置应为表（dict）"])
+    postal = cfg.get("postal") or {}
+    setting = cfg.get("setting") or {}
+    if not isinstance(postal, dict) or not isinstance(setting, dict):
+        raise SettingsError(["[postal] 与 [setting] 应为表"])
+
+    single_subject = str(setting.get("subject") or "").strip()
+    subjects = _str_list(errors, "setting.subjects", setting.get("subjects"))
+    if not subjects and single_subject:
+        subjects = (single_subject,)
+
+    # 发件邮箱：支持 from_emails 数组，兼容旧的 from_email
+    from_emails = _str_list(errors, "postal.from_emails", postal.get("from_emails"))
+    if not from_emails:
+        from_emails = _str_list(errors, "postal.from_email", postal.get("from_email"))
+
+    # 每小时限制，兼容旧的 limit
+    per_hour = setting.get("per_hour_limit")
+    legacy_limit = per_hour in (None, "", 0)
+    if legacy_limit:
+        per_hour = setting.get("limit")
+    per_hour_limit = _int(errors, "setting.per_hour_limit", per_hour)
+
+    concurrency = _int(errors, "setting.concurrency", setting.get("concurrency"), DEFAULT_CONCURRENCY, 1, MAX_CONCURRENCY)
+    batch_size = _int(errors, "setting.batch_size", setting.get("batch_size"), 0, 0, MAX_BATCH_SIZE)
+
+    track_opens = _bool(errors, "setting.track_opens", setting.get("track_opens"), False)
+    track_clicks = _bool(errors, "setting.track_clicks", setting.get("track_clicks"), False)
+    tracking_url = str(setting.get("tracking_url") or "").strip().rstrip("/")
+    if (track_opens or track_clicks) and not tracking_url.lower().startswith(("http://", "https://")):
+        errors.append("开启追踪时 setting.tracking_url 应为 http(s) 地址")
+
+    from webapp.dedupe import DEFAULT_RULES, RULES
+    dedupe_rules = _str_list(errors, "setting.dedupe_rules", setting.get("dedupe_rules")) or DEFAULT_RULES
+    unknown = [r for r in dedupe_rules if r not in RULES]
+    if unknown:
+        errors.append(f"setting.dedupe_rules 含未知规则：{', '.join(unknown)}（可选 {', '.join(RULES)}）")
+
+    for name in ("sender_per_hour", "sender_per_day", "domain_per_hour", "domain_per_day"):
+        _int(errors, f"setting.{name}", setting.get(name))
+    limits = setting.get("domain_limits")
+    if limits is not None and not isinstance(limits, dict):
+        errors.append("setting.domain_limits 应为表")
+        limits = None
+    quotas = quota_settings({**setting, "domain_limits": limits or {}})
+
+    servers = _servers(errors, postal)
+
+    out = Settings(
+        server=servers[0].server if servers else str(postal.get("server") or "").strip(),
+        key=servers[0].key if servers else str(postal.get("key") or "").strip(),
+        servers=servers,
+        from_name=str(postal.get("from_name") or ""),
+        from_email=from_emails[0] if from_emails else "",
+        from_emails=from_emails,
+        subject=single_subject,
+        subjects=subjects,
+        per_hour_limit=per_hour_limit,
+        excel_per_hour=per_hour_limit * 60 if legacy_limit else per_hour_limit,
+        concurrency=concurrency,
+        batch_size=batch_size,
+        quotas=MappingProxyType(quotas),
+        reject_role_accounts=_bool(errors, "setting.reject_role_accounts", setting.get("reject_role_accounts"), False),
+        validate_mx=_bool(errors, "setting.validate_mx", setting.get("validate_mx"), False),
+        proxy=str(setting.get("proxy") or "").strip(),
+        track_opens=track_opens,
+        track_clicks=track_clicks,
+        tracking_url=tracking_url,
+        dedupe_rules=dedupe_rules,
+    )
+    if errors:
+        raise SettingsError(errors)
+    return out
+
+
+class SettingsStore:
+    """单个配置文件的缓存：current() 在文件未变化时直接返回缓存对象"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = False  # False 表示尚未加载；None 表示文件不存在
+        self._raw = {}
+        self._settings = None
+        self._error = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refresh(self):
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            raw = toml.load(self.path) if stamp is not None else {}
+            self._set_locked(raw, stamp)
+
+    def _set_locked(self, raw, stamp):
+        self._raw = raw
+        self._stamp = stamp
+        try:
+            self._settings, self._error = parse(raw), None
+        except SettingsError as e:
+            self._settings, self._error = None, e
+
+    def raw(self) -> dict:
+        self._refresh()
+        return copy.deepcopy(self._raw)
+
+    def current(self) -> Settings:
+        """当前生效的配置；文件内容不合法时抛出 SettingsError"""
+        self._refresh()
+        if self._error is not None:
+            raise self._error
+        return self._settings
+
+    def save(self, cfg: dict) -> Settings:
+        """校验后原子写入并更新缓存；不合法时抛出 SettingsError，文件保持不变"""
+        settings = parse(cfg)
+        tmp = f"{self.path}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                toml.dump(cfg, f)
+            os.replace(tmp, self.path)
+            self._set_locked(copy.deepcopy(cfg), self._stat())
+        return settings
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def store_for(path: str) -> SettingsStore:
+    with _stores_lock:
+        s = _stores.get(path)
+        if s is None:
+            s = _stores[path] = SettingsStore(path)
+        return s
@@ -26,6 +26,9 @@ async function fetchConfig() {
   // 兼容旧字段 limit：优先 per_hour_limit
   setVal('setting.per_hour_limit', j?.setting?.per_hour_limit ?? j?.setting?.limit);
   setVal('setting.proxy', j?.setting?.proxy);
+  setVal('setting.concurrency', j?.setting?.concurrency);
+  const roles = get('setting.reject_role_accounts');
+  if (roles) roles.checked = !!j?.setting?.reject_role_accounts;
   // 原始 JSON 视图
   const pre = get('config');
   if (pre) pre.textContent = JSON.stringify(j, null, 2);
@@ -51,8 +54,13 @@ get('save').onclick = async () => {
     .map(s => s.trim())
     .filter(Boolean);
   const perHour = Number(getVal('setting.per_hour_limit') || 0);
+  const concurrency = Number(getVal('setting.concurrency') || 0);
+  // 以当前配置为底，保留表单未覆盖的字段（如配额、Excel 等高级设置）
+  const base = CURRENT_CONFIG || {};
   const payload = {
+    ...base,
     postal: {
+      ...(base.postal || {}),
       server,
       key,
       from_name: getVal('postal.from_name'),
@@ -61,12 +69,17 @@ get('save').onclick = async () => {
       from_email: from_emails_lines[0] || ''
     },
     setting: {
+      ...(base.setting || {}),
       subjects,
       subject: subjects[0] || '',
       // 新字段：每小时限制
       per_hour_limit: perHour,
       // 为兼容旧版本，冗余写回旧字段 limit（值相同）
       limit: perHour,
+      // 并发发送数（0 或留空使用默认值）
+      concurrency,
+      // 发送前校验是否拒绝角色账号
+      reject_role_accounts: !!get('setting.reject_role_accounts')?.checked,
       proxy: getVal('setting.proxy')
     }
   };
@@ -163,39 +176,92 @@ get('expRec').onclick = () => {
 };
 
 get('clearRec').onclick = async () => {
-  if (!confirm('确定清空 recipients.txt 吗？此操作不可恢复')) return;
+  if (!confirm('确定清空已累积的收件人列表吗？此操作不可恢复')) return;
   const r = await fetch('/api/recipients_clear', { method: 'POST' });
   const j = await r.json();
   if (!j.ok) return alert('清空失败');
   refreshRecipientsInfo();
 };
 
-// 进度条轮询
+// 上传文件导入（TXT/CSV，后台分块解析，轮询导入进度）
+const importBtn = get('importRec');
+if (importBtn) {
+  importBtn.onclick = async () => {
+    const input = get('importFile');
+    const file = input && input.files && input.files[0];
+    if (!file) return alert('请选择要导入的文件');
+    const msg = get('importMsg');
+    const fd = new FormData();
+    fd.append('file', file);
+    if (msg) msg.textContent = '上传中...';
+    const r = await fetch('/api/recipients_import', { method: 'POST', body: fd });
+    const j = await r.json();
+    if (!j.ok) { if (msg) msg.textContent = ''; return alert('导入失败: ' + (j.error || '未知错误')); }
+    const timer = setInterval(async () => {
+      const rr = await fetch('/api/recipients_import/' + j.import_id);
+      const s = await rr.json();
+      const pct = s.bytes_total > 0 ? Math.round((s.bytes_read / s.bytes_total) * 100) : 0;
+      if (msg) msg.textContent = `导入 ${pct}%：解析 ${s.parsed}，新增 ${s.appended}，重复 ${s.duplicates}`;
+      if (s.status !== 'running') {
+        clearInterval(timer);
+        if (s.status === 'failed') alert('导入失败: ' + (s.error || '未知错误'));
+        refreshRecipientsInfo();
+      }
+    }, 1000);
+  };
+}
+
+// 进度：优先使用 SSE 推送（/api/progress/stream），不支持或断开时回退为每秒轮询
 let progressTimer = null;
+let progressSource = null;
+function stopProgressUpdates(){
+  if (progressTimer) { clearInterval(progressTimer); progressTimer = null; }
+  if (progressSource) { progressSource.close(); progressSource = null; }
+}
+
 function startPollProgress(){
-  if (progressTimer) clearInterval(progressTimer);
-  progressTimer = setInterval(updateProgress, 1000);
+  stopProgressUpdates();
+  if (window.EventSource) {
+    progressSource = new EventSource('/api/progress/stream');
+    progressSource.onmessage = (ev) => {
+      try { renderProgress(JSON.parse(ev.data)); } catch(e) {}
+    };
+    progressSource.onerror = () => {
+      // 连接失败则回退轮询
+      if (progressSource) { progressSource.close(); progressSource = null; }
+      if (!progressTimer) progressTimer = setInterval(updateProgress, 1000);
+    };
+  } else {
+    progressTimer = setInterval(updateProgress, 1000);
+  }
   updateProgress();
 }
 
-async function updateProgress(){
-  const r = await fetch('/api/progress');
-  const j = await r.json();
+let CURRENT_JOB_ID = null;
+function renderProgress(j){
+  if (j.job_id) CURRENT_JOB_ID = j.job_id;
   const total = j.total || 0;
   const sent = j.sent || 0;
   const status = j.status || 'idle';
   const success = j.success || 0;
   const pct = total > 0 ? Math.round((sent/total)*100) : 0;
   get('progBar').style.width = pct + '%';
-  get('progText').textContent = `状态：${status}，进度：${sent}/${total}（成功 ${success}）` + (j.current_email? `，当前：${j.current_email}` : '');
-  if (status === 'completed' || status === 'idle'){
-    if (progressTimer) clearInterval(progressTimer);
+  const jobLabel = j.job_id ? `任务 #${j.job_id} ` : '';
+  get('progText').textContent = `${jobLabel}状态：${status}，进度：${sent}/${total}（成功 ${success}）` + (j.current_email? `，当前：${j.current_email}` : '');
+  if (status === 'completed' || status === 'idle' || status === 'stopped'){
+    stopProgressUpdates();
   }
 }
 
+async function updateProgress(){
+  const r = await fetch('/api/progress');
+  const j = await r.json();
+  renderProgress(j);
+}
+
 refreshRecipientsInfo();
 
-// 页面加载后自动检测进度，若仍在运行则继续轮询
+// 页面加载后自动检测进度，若仍在运行则继续接收进度
 autoInitProgress();
 
 async function autoInitProgress(){
@@ -204,14 +270,8 @@ async function autoInitProgress(){
     if (!r.ok) return;
     const j = await r.json();
     // 立即渲染一次
-    const total = j.total || 0;
-    const sent = j.sent || 0;
-    const status = j.status || 'idle';
-    const success = j.success || 0;
-    const pct = total > 0 ? Math.round((sent/total)*100) : 0;
-    get('progBar').style.width = pct + '%';
-    get('progText').textContent = `状态：${status}，进度：${sent}/${total}（成功 ${success}）` + (j.current_email? `，当前：${j.current_email}` : '');
-    if (status === 'running') {
+    renderProgress(j);
+    if (j.status === 'running' || j.status === 'stopping' || j.status === 'paused') {
       startPollProgress();
     }
   } catch(e){ /* 忽略 */ }
@@ -232,6 +292,33 @@ if (stopBtn) {
   };
 }
 
+// 暂停 / 继续当前任务
+async function jobAction(action){
+  if (!CURRENT_JOB_ID) return alert('当前没有任务');
+  const r = await fetch('/api/jobs/' + CURRENT_JOB_ID + '/' + action, { method: 'POST' });
+  const j = await r.json();
+  if (!j.ok) return alert('操作失败: ' + (j.error || '未知错误'));
+  startPollProgress();
+}
+const pauseBtn = get('pauseJob');
+if (pauseBtn) pauseBtn.onclick = () => jobAction('pause');
+const resumeJobBtn = get('resumeJob');
+if (resumeJobBtn) resumeJobBtn.onclick = () => jobAction('resume');
+
+// 续发未完成任务（服务重启或强制停止后，从未发送的收件人继续）
+const resumeBtn = get('resumeSend');
+if (resumeBtn) {
+  resumeBtn.onclick = async () => {
+    try {
+      const r = await fetch('/api/resume', { method: 'POST', headers: {'Content-Type': 'application/json'}, body: '{}' });
+      const j = await r.json();
+      if (!j.ok) return alert('续发失败: ' + (j.error || '未知错误'));
+      alert('已续发任务 #' + j.campaign_id + '，剩余 ' + j.pending + '/' + j.total + ' 个');
+      startPollProgress();
+    } catch(e) { alert('续发请求异常'); }
+  };
+}
+
 // ——— 邮件内容(HTML) 自动缓存与恢复 ———
 initBodyAutosave();
 restoreBodyTemplate();
@@ -0,0 +1,159 @@
+"""退订 / 硬退信 / 投诉地址的抑制列表
+
+- SQLite 表按规范化地址唯一索引；整域抑制以 "@domain" 形式写入 address 列并带域名索引
+- 发送前的检查走内存快照（两个 set），每封 O(1)；列表变更时在同一事务里递增库中的版本号，
+  各进程（gunicorn 的每个 worker）读取快照时比对版本，任何进程写入后都会重新加载
+"""
+import threading
+import time
+
+from webapp.db import ensure_schema, get_conn
+from webapp.recipients import domain_of, normalize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS suppression (
+    address TEXT PRIMARY KEY,
+    domain TEXT NOT NULL,
+    reason TEXT NOT NULL DEFAULT '',
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_suppression_domain ON suppression (domain);
+CREATE TABLE IF NOT EXISTS suppression_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO suppression_version (id, version) VALUES (1, 0);
+"""
+
+WRITE_BATCH = 5000
+REASONS = ("manual", "hard_bounce", "complaint", "unsubscribe")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("suppression", SCHEMA, conn)
+    return conn
+
+
+def _key(entry: str):
+    """规范化一条抑制记录：返回 (address, domain)；"@example.com" 或 "example.com" 表示整域"""
+    e = (entry or "").strip().lower()
+    if not e:
+        return None
+    if "@" not in e:
+        return "@" + e, e
+    if e.startswith("@"):
+        return e, e[1:]
+    return normalize(e), domain_of(e)
+
+
+def _bump(conn):
+    # 在写入的同一事务内调用
+    conn.execute("UPDATE suppression_version SET version = version + 1 WHERE id = 1")
+
+
+def version() -> int:
+    row = _conn().execute("SELECT version FROM suppression_version WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def add_many(entries, reason: str = "manual") -> dict:
+    """批量加入抑制列表（已存在的保留原因），返回 {"added", "total"}"""
+    conn = _conn()
+    now = int(time.time())
+    before = conn.total_changes
+    batch = []
+    with conn:
+        for entry in entries:
+            k = _key(entry)
+            if k is None:
+                continue
+            batch.append((k[0], k[1], reason, now))
+            if len(batch) >= WRITE_BATCH:
+                conn.executemany("INSERT OR IGNORE INTO suppression (address, domain, reason, created_at) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT OR IGNORE INTO suppression (address, domain, reason, created_at) VALUES (?, ?, ?, ?)", batch)
+        added = conn.total_changes - before
+        if added:
+            _bump(conn)
+    return {"added": added, "total": count()}
+
+
+def remove_many(entries) -> int:
+    conn = _conn()
+    before = conn.total_changes
+    with conn:
+        conn.executemany("DELETE FROM suppression WHERE address = ?", [(k[0],) for k in map(_key, entries) if k])
+        removed = conn.total_changes - before
+        if removed:
+            _bump(conn)
+    return removed
+
+
+def count() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM suppression").fetchone()[0]
+
+
+def counts_by_reason() -> dict:
+    return dict(_conn().execute("SELECT reason, COUNT(*) FROM suppression GROUP BY reason").fetchall())
+
+
+def page(after: str = "", limit: int = 50):
+    """按地址排序分页，返回 [(address, reason, created_at), ...]"""
+    return _conn().execute(
+        "SELECT address, reason, created_at FROM suppression WHERE address > ? ORDER BY address LIMIT ?",
+        (after or "", int(limit)),
+    ).fetchall()
+
+
+def iter_rows(batch: int = WRITE_BATCH):
+    last = ""
+    while True:
+        rows = page(last, batch)
+        if not rows:
+            return
+        for row in rows:
+            yield row
+        last = rows[-1][0]
+
+
+class SuppressionSet:
+    """内存快照：is_suppressed() 为两个 set 查找"""
+
+    __slots__ = ("addresses", "domains", "version")
+
+    def __init__(self, addresses, domains, version):
+        self.addresses = addresses
+        self.domains = domains
+        self.version = version
+
+    def is_suppressed(self, email: str) -> bool:
+        if not self.addresses and not self.domains:
+            return False
+        if normalize(email) in self.addresses:
+            return True
+        return domain_of(email) in self.domains
+
+
+def snapshot() -> SuppressionSet:
+    """当前抑制列表的内存快照（库中版本号未变时复用，只需一次主键查询）"""
+    global _cache
+    current = version()
+    with _cache_lock:
+        if _cache is not None and _cache.version == current:
+            return _cache
+    addresses = set()
+    domains = set()
+    for address, domain in _conn().execute("SELECT address, domain FROM suppression"):
+        if address.startswith("@"):
+            domains.add(domain)
+        else:
+            addresses.add(address)
+    snap = SuppressionSet(addresses, domains, current)
+    with _cache_lock:
+        _cache = snap
+    return snap
@@ -0,0 +1,76 @@
+"""邮件模板预编译：一次解析为“字面量片段 + 占位符槽位”，每个收件人只做一次 join
+
+- 占位符写法 {{name}}（允许两侧空格），变量名为字母、数字、下划线
+- 除 email / index / domain 外，可传入任意每收件人字段（如 name、coupon）
+- 未提供值的占位符原样保留，与旧版 str.replace 行为一致
+- 编译结果按模板内容的 sha1 缓存，同一模板在多个任务 / 续发之间复用
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+CACHE_SIZE = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """已编译模板：literals 比 slots 多一个元素，渲染时交替拼接"""
+
+    __slots__ = ("literals", "slots", "fields", "digest")
+
+    def __init__(self, source: str, digest: str = ""):
+        literals = []
+        slots = []
+        pos = 0
+        for m in _PLACEHOLDER.finditer(source):
+            literals.append(source[pos:m.start()])
+            slots.append((m.group(1), m.group(0)))
+            pos = m.end()
+        literals.append(source[pos:])
+        self.literals = tuple(literals)
+        self.slots = tuple(slots)
+        self.fields = frozenset(name for name, _ in slots)
+        self.digest = digest
+
+    @property
+    def is_static(self) -> bool:
+        """模板不含任何占位符（所有收件人内容相同）"""
+        return not self.slots
+
+    def render(self, values: dict, suffix: str = "") -> str:
+        lits = self.literals
+        if not self.slots:
+            return lits[0] + suffix if suffix else lits[0]
+        out = [lits[0]]
+        append = out.append
+        get = values.get
+        k = 1
+        for name, raw in self.slots:
+            v = get(name)
+            append(raw if v is None else str(v))
+            append(lits[k])
+            k += 1
+        if suffix:
+            append(suffix)
+        return "".join(out)
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """编译模板（按内容哈希缓存，LRU 淘汰）"""
+    source = source or ""
+    digest = hashlib.sha1(source.encode("utf-8", errors="surrogatepass")).hexdigest()
+    with _cache_lock:
+        tpl = _cache.get(digest)
+        if tpl is not None:
+            _cache.move_to_end(digest)
+            return tpl
+    tpl = CompiledTemplate(source, digest)
+    with _cache_lock:
+        _cache[digest] = tpl
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return tpl
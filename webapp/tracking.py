@@ -0,0 +1,287 @@
+"""打开 / 点击追踪：以每封邮件的 trace 为键，写入先在内存中聚合，后台线程批量落库
+
+- 打开：正文末尾附加 1x1 像素 <img src="{base}/t/o/{campaign}/{trace}.gif">
+- 点击：任务启动时把模板中的 http(s) 链接改写为 {base}/t/c/{campaign}/{n}/{trace}，原地址存入 tracking_links；
+  含占位符的链接（每个收件人不同）保持原样
+- 追踪请求只在内存字典里累加计数就返回（群发后的访问高峰不会逐条写库），每 FLUSH_INTERVAL 秒合并写入
+- 追踪地址无需登录：只有本服务发出过、且属于该任务的 trace 才计数（不会因伪造请求新增记录）；
+  同一 trace 在 REPEAT_WINDOW 秒内的重复打开 / 点击只计一次（邮件客户端预取、反复刷新）
+- 发送时登记 trace 对应的任务、主题与发件邮箱，用于按主题 / 发件邮箱统计打开率与点击率
+"""
+import html
+import re
+import threading
+import time
+
+from collections import OrderedDict
+
+from webapp.db import connect, ensure_schema, get_conn
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracking_messages (
+    trace TEXT PRIMARY KEY,
+    campaign_id INTEGER,
+    subject TEXT,
+    from_email TEXT,
+    recipients INTEGER NOT NULL DEFAULT 0,
+    opens INTEGER NOT NULL DEFAULT 0,
+    clicks INTEGER NOT NULL DEFAULT 0,
+    first_open INTEGER,
+    first_click INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tracking_messages_campaign ON tracking_messages (campaign_id);
+CREATE TABLE IF NOT EXISTS tracking_links (
+    campaign_id INTEGER NOT NULL,
+    link_no INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (campaign_id, link_no)
+) WITHOUT ROWID;
+"""
+
+FLUSH_INTERVAL = 2.0
+# 内存中待写入的条目超过该数量时提前刷盘
+MAX_PENDING = 50000
+# 同一 trace 的重复打开 / 点击在该时间窗内只计一次
+REPEAT_WINDOW = 300
+# 内存中缓存的已验证 trace 数量上限（超过后按最近使用淘汰，之后再查库）
+MAX_KNOWN = 100000
+
+# 透明 1x1 GIF
+PIXEL = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\x00\x00\x00!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+)
+
+TRACE_PLACEHOLDER = "{{_trace}}"
+
+_HREF = re.compile(r"""(\bhref\s*=\s*)(["'])(https?://[^"']+)\2""", re.IGNORECASE)
+
+_UPSERT_SENT = (
+    "INSERT INTO tracking_messages (trace, campaign_id, subject, from_email, recipients) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(trace) DO UPDATE SET campaign_id = excluded.campaign_id, subject = excluded.subject, "
+    "from_email = excluded.from_email, recipients = excluded.recipients"
+)
+# 只更新已登记的 trace（hit() 已验证归属；发送登记在同一事务中先写入）
+_UPDATE_HIT = (
+    "UPDATE tracking_messages SET opens = opens + ?, clicks = clicks + ?, "
+    "first_open = COALESCE(first_open, ?), first_click = COALESCE(first_click, ?) WHERE trace = ? AND campaign_id = ?"
+)
+
+
+def _conn():
+    conn = get_conn()
+    ensure_schema("tracking", SCHEMA, conn)
+    return conn
+
+
+def rewrite_links(source: str, base_url: str, campaign_id: int):
+    """改写模板中的链接，返回 (新模板, [(n, 原地址)])；新模板中的 {{_trace}} 在渲染时替换为每封邮件的 trace"""
+    base = base_url.rstrip("/")
+    links = []
+
+    def sub(m):
+        url = m.group(3)
+        if "{{" in url:
+            return m.group(0)
+        links.append((len(links) + 1, html.unescape(url)))
+        return f"{m.group(1)}{m.group(2)}{base}/t/c/{campaign_id}/{len(links)}/{TRACE_PLACEHOLDER}{m.group(2)}"
+
+    return _HREF.sub(sub, source or ""), links
+
+
+def save_links(campaign_id: int, links):
+    conn = _conn()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO tracking_links (campaign_id, link_no, url) VALUES (?, ?, ?)",
+            [(campaign_id, n, url) for n, url in links],
+        )
+
+
+class CampaignTracking:
+    """单个任务的追踪选项，渲染时生成像素标签"""
+
+    __slots__ = ("campaign_id", "base_url", "opens", "clicks")
+
+    def __init__(self, campaign_id: int, base_url: str, opens: bool, clicks: bool):
+        self.campaign_id = campaign_id
+        self.base_url = base_url.rstrip("/")
+        self.opens = opens
+        self.clicks = clicks
+
+    def pixel(self, trace: str) -> str:
+        if not self.opens:
+            return ""
+        return f'<img src="{self.base_url}/t/o/{self.campaign_id}/{trace}.gif" width="1" height="1" alt="" style="display:none">'
+
+
+class Tracker:
+    """内存聚合 + 后台批量写入（发送登记与打开 / 点击共用）"""
+
+    def __init__(self, interval: float = FLUSH_INTERVAL, max_pending: int = MAX_PENDING,
+                 repeat_window: float = REPEAT_WINDOW, max_known: int = MAX_KNOWN):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.repeat_window = repeat_window
+        self.max_known = max_known
+        self._lock = threading.Lock()
+        self._sent = []
+        self._hits = {}  # trace -> [campaign_id, opens, clicks, first_open, first_click]
+        self._known = OrderedDict()  # trace -> [campaign_id, 上次计入的打开时间, 上次计入的点击时间]
+        self._wake = threading.Event()
+        self._thread = None
+        self._links = {}
+        self.stats = {"opens": 0, "clicks": 0, "written": 0, "ignored": 0}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._run, daemon=True, name="mailer-tracking")
+                t.start()
+                self._thread = t
+
+    def record_sent(self, campaign_id: int, trace: str, subject: str, from_email: str, recipients: int = 1):
+        self._ensure_started()
+        with self._lock:
+            self._sent.append((trace, campaign_id, subject, from_email, recipients))
+            self._remember(trace, campaign_id)
+            full = len(self._sent) + len(self._hits) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def _remember(self, trace: str, campaign_id: int):
+        # 调用方持有 self._lock
+        entry = self._known.get(trace)
+        if entry is None or entry[0] != campaign_id:
+            entry = self._known[trace] = [campaign_id, None, None]
+        self._known.move_to_end(trace)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+        return entry
+
+    def _lookup(self, trace: str):
+        """trace 对应的任务 id：先查内存，再查库；未登记返回 None"""
+        with self._lock:
+            entry = self._known.get(trace)
+            if entry is not None:
+                return entry[0]
+        row = _conn().execute("SELECT campaign_id FROM tracking_messages WHERE trace = ?", (trace,)).fetchone()
+        return row[0] if row else None
+
+    def hit(self, campaign_id: int, trace: str, kind: str) -> bool:
+        """记录一次打开（kind="open"）或点击（kind="click"），只更新内存；未计数（trace 不属于该任务或重复）返回 False"""
+        if self._lookup(trace) != campaign_id:
+            self.stats["ignored"] += 1
+            return False
+        self._ensure_started()
+        now = int(time.time())
+        slot = 2 if kind == "click" else 1
+        with self._lock:
+            entry = self._remember(trace, campaign_id)
+            if entry[slot] is not None and now - entry[slot] < self.repeat_window:
+                self.stats["ignored"] += 1
+                return False
+            entry[slot] = now
+            h = self._hits.get(trace)
+            if h is None:
+                h = self._hits[trace] = [campaign_id, 0, 0, None, None]
+            if kind == "click":
+                h[2] += 1
+                h[4] = h[4] or now
+                # 点击必然已打开（图片被屏蔽时像素不会加载）
+                h[3] = h[3] or now
+            else:
+                h[1] += 1
+                h[3] = h[3] or now
+            full = len(self._sent) + len(self._hits) >= self.max_pending
+        self.stats["clicks" if kind == "click" else "opens"] += 1
+        if full:
+            self._wake.set()
+        return True
+
+    def link(self, campaign_id: int, link_no: int):
+        """点击跳转的目标地址（按任务缓存，同一任务的链接只查一次库）"""
+        key = (campaign_id, link_no)
+        url = self._links.get(key)
+        if url is None:
+            row = _conn().execute(
+                "SELECT url FROM tracking_links WHERE campaign_id = ? AND link_no = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            url = self._links[key] = row[0]
+        return url
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._sent) + len(self._hits)
+
+    def _run(self):
+        conn = connect()
+        ensure_schema("tracking", SCHEMA, conn)
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self._flush(conn)
+            except Exception as e:
+                print(f"❌ 写入追踪数据失败：{e}")
+
+    def _flush(self, conn):
+        with self._lock:
+            sent, self._sent = self._sent, []
+            hits, self._hits = self._hits, {}
+        if not sent and not hits:
+            return
+        # 先写发送登记再写访问，同一批里的新 trace 不会缺少主题 / 发件邮箱
+        with conn:
+            if sent:
+                conn.executemany(_UPSERT_SENT, sent)
+            if hits:
+                conn.executemany(_UPDATE_HIT, [(o, c, fo, fc, t, cid) for t, (cid, o, c, fo, fc) in hits.items()])
+        self.stats["written"] += len(sent) + len(hits)
+
+    def flush(self):
+        """立即写入（统计接口调用前使用）"""
+        conn = _conn()
+        self._flush(conn)
+
+
+TRACKER = Tracker()
+
+
+def _rate(n, d):
+    return round(n / d, 4) if d else 0.0
+
+
+def campaign_stats(campaign_id: int) -> dict:
+    """按 (主题, 发件邮箱) 汇总打开率与点击率；批量发送时一次 API 调用共用一个 trace，按“封”计"""
+    rows = _conn().execute(
+        "SELECT COALESCE(subject, ''), COALESCE(from_email, ''), COUNT(*), SUM(recipients), "
+        "SUM(first_open IS NOT NULL), SUM(opens), SUM(clicks > 0), SUM(clicks) "
+        "FROM tracking_messages WHERE campaign_id = ? AND recipients > 0 GROUP BY 1, 2 ORDER BY 1, 2",
+        (campaign_id,),
+    ).fetchall()
+    groups = []
+    total = {"messages": 0, "recipients": 0, "opened": 0, "opens": 0, "clicked": 0, "clicks": 0}
+    for subject, from_email, messages, recipients, opened, opens, clicked, clicks in rows:
+        g = {
+            "subject": subject,
+            "from_email": from_email,
+            "messages": messages,
+            "recipients": recipients or 0,
+            "opened": opened or 0,
+            "opens": opens or 0,
+            "clicked": clicked or 0,
+            "clicks": clicks or 0,
+        }
+        for k in total:
+            total[k] += g[k]
+        g["open_rate"] = _rate(g["opened"], messages)
+        g["click_rate"] = _rate(g["clicked"], messages)
+        groups.append(g)
+    total["open_rate"] = _rate(total["opened"], total["messages"])
+    total["click_rate"] = _rate(total["clicked"], total["messages"])
+    return {"campaign_id": campaign_id, "total": total, "groups": groups}
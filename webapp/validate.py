@@ -0,0 +1,340 @@
+"""发送前的离线校验：语法、规范化、角色账号、拼写错误域名、可选 MX 检查
+
+- 地址按域名分组：域名相关的检查（格式、拼写、MX）每个域名只做一次，百万行列表通常只有几千个域名
+- 本地部分用预编译正则逐条 fullmatch，不做其它 Python 层循环
+- MX 查询走可替换的解析器（resolve(domain) -> True / False / None），结果按域名带 TTL 缓存，
+  未知结果（超时、未安装 dnspython）一律放行，避免误杀
+- 结果按拒绝原因计数，并给出少量样例与拼写建议
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 拒绝原因
+SYNTAX = "syntax"
+ROLE = "role_account"
+TYPO = "typo_domain"
+NO_MX = "no_mx"
+REASONS = (SYNTAX, ROLE, TYPO, NO_MX)
+
+MAX_LOCAL = 64
+MAX_ADDRESS = 254
+SAMPLES_PER_REASON = 5
+
+# RFC 5322 dot-atom（不支持带引号的本地部分，群发场景中几乎不存在）
+_LOCAL_RE = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*")
+_LABEL_RE = re.compile(r"[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?")
+_TLD_RE = re.compile(r"(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})")
+
+ROLE_ACCOUNTS = frozenset((
+    "abuse", "admin", "administrator", "billing", "compliance", "devnull", "dns", "ftp", "help", "hostmaster",
+    "info", "inoc", "ispfeedback", "ispsupport", "list", "list-request", "mailer-daemon", "marketing", "noc",
+    "no-reply", "noreply", "null", "phish", "phishing", "postmaster", "privacy", "registrar", "root", "sales",
+    "security", "spam", "support", "sysadmin", "tech", "undisclosed-recipients", "unsubscribe", "usenet",
+    "uucp", "webmaster", "www",
+))
+
+# 常见邮箱服务商；与其编辑距离为 1 的域名视为拼写错误
+POPULAR_DOMAINS = (
+    "gmail.com", "googlemail.com", "yahoo.com", "hotmail.com", "outlook.com", "live.com", "msn.com",
+    "icloud.com", "me.com", "aol.com", "protonmail.com", "gmx.com", "mail.ru", "yandex.ru",
+    "qq.com", "163.com", "126.com", "sina.com", "sohu.com", "foxmail.com", "aliyun.com",
+)
+# 名称过短的域名（qq.com、163.com 等）与大量正常域名只差一个字符，只按下面的已知误写判断
+_FUZZY_DOMAINS = tuple(d for d in POPULAR_DOMAINS if len(d.split(".", 1)[0]) >= 5)
+# 与常见服务商只差一个字符、但本身就是真实邮箱服务的域名：先于编辑距离检查放行
+KNOWN_VALID_DOMAINS = frozenset((
+    "mail.com", "email.com", "ymail.com", "zmail.com", "gmx.de", "gmx.net", "gmx.at", "gmx.ch",
+    "hotmail.de", "hotmail.fr", "hotmail.it", "hotmail.es", "outlook.de", "outlook.fr", "outlook.es",
+    "yahoo.de", "yahoo.fr", "yahoo.es", "yahoo.it", "yahoo.ca", "yahoo.in", "rocketmail.com",
+    "icloud.net", "aol.de", "aim.com", "mac.com", "live.de", "live.fr", "live.nl", "mail.de", "web.de", "inbox.ru", "bk.ru", "list.ru",
+))
+# 编辑距离检测不到或不做编辑距离检测的常见误写
+KNOWN_TYPOS = {
+    "gmail.co": "gmail.com",
+    "gmail.cm": "gmail.com",
+    "gmai.com": "gmail.com",
+    "gamil.com": "gmail.com",
+    "gnail.com": "gmail.com",
+    "hotmial.com": "hotmail.com",
+    "hotmail.co": "hotmail.com",
+    "yahoo.co": "yahoo.com",
+    "outlook.co": "outlook.com",
+    "qq.co": "qq.com",
+    "qq.cm": "qq.com",
+    "qq.con": "qq.com",
+    "163.cm": "163.com",
+    "163.con": "163.com",
+    "126.cm": "126.com",
+    "126.con": "126.com",
+}
+
+
+def normalize(raw: str) -> str:
+    """去掉 mailto: / 尖括号 / 空白并转小写；域名转为 IDNA（punycode）形式"""
+    e = (raw or "").strip().strip("<>").strip()
+    if e[:7].lower() == "mailto:":
+        e = e[7:]
+    e = e.lower()
+    local, sep, domain = e.rpartition("@")
+    if not sep or not domain:
+        return e
+    if not domain.isascii():
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            return e
+    return f"{local}@{domain.rstrip('.')}"
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """a 与 b 的编辑距离（含相邻交换）是否恰好为 1"""
+    if a == b or abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diff = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diff) == 1:
+            return True
+        return len(diff) == 2 and diff[1] == diff[0] + 1 and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]]
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def suggest_domain(domain: str):
+    """疑似拼写错误时返回建议的正确域名，否则 None"""
+    if domain in KNOWN_TYPOS:
+        return KNOWN_TYPOS[domain]
+    if domain in POPULAR_DOMAINS or domain in KNOWN_VALID_DOMAINS:
+        return None
+    for good in _FUZZY_DOMAINS:
+        if _within_one_edit(domain, good):
+            return good
+    return None
+
+
+def domain_syntax_ok(domain: str) -> bool:
+    if not domain or len(domain) > 253 or "." not in domain:
+        return False
+    labels = domain.split(".")
+    if not _TLD_RE.fullmatch(labels[-1]):
+        return False
+    return all(_LABEL_RE.fullmatch(label) for label in labels[:-1])
+
+
+# —— MX 解析 ——
+
+class DnsResolver:
+    """基于 dnspython 的解析器：有 MX，或无 MX 但有 A 记录（隐式 MX）即视为可投递
+
+    未安装 dnspython 时 resolve() 返回 None（未知，放行）
+    """
+
+    def __init__(self, timeout: float = 3.0):
+        self.timeout = timeout
+        try:
+            import dns.resolver
+            self._dns = dns.resolver
+        except ImportError:
+            self._dns = None
+
+    def resolve(self, domain: str):
+        if self._dns is None:
+            return None
+        r = self._dns
+        try:
+            answers = r.resolve(domain, "MX", lifetime=self.timeout)
+            # RFC 7505 null MX（"0 ."）表示该域名不收信
+            return any(str(a.exchange).rstrip(".") for a in answers)
+        except r.NXDOMAIN:
+            return False
+        except r.NoAnswer:
+            pass
+        except Exception:
+            return None
+        try:
+            r.resolve(domain, "A", lifetime=self.timeout)
+            return True
+        except (r.NXDOMAIN, r.NoAnswer):
+            return False
+        except Exception:
+            return None
+
+
+class StaticResolver:
+    """本地替身：按给定的 {域名: True/False} 应答，未列出的返回 default（用于测试与离线环境）"""
+
+    def __init__(self, mapping=None, default=None):
+        self.mapping = {k.lower(): v for k, v in (mapping or {}).items()}
+        self.default = default
+
+    def resolve(self, domain: str):
+        return self.mapping.get(domain, self.default)
+
+
+class MXCache:
+    """按域名缓存 MX 结果：肯定结果 ttl 秒，否定结果 negative_ttl 秒，未知结果不缓存"""
+
+    def __init__(self, resolver=None, ttl: float = 6 * 3600, negative_ttl: float = 600, workers: int = 16,
+                 clock=time.monotonic):
+        self.resolver = resolver if resolver is not None else DnsResolver()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def _get(self, domain: str, now: float):
+        entry = self._entries.get(domain)
+        if entry is not None and entry[1] > now:
+            return entry
+        return None
+
+    def lookup_many(self, domains) -> dict:
+        """批量查询，返回 {域名: True/False/None}；未命中缓存的域名并发解析"""
+        now = self.clock()
+        out = {}
+        missing = []
+        with self._lock:
+            for d in domains:
+                entry = self._get(d, now)
+                if entry is None:
+                    missing.append(d)
+                else:
+                    out[d] = entry[0]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(missing)))) as pool:
+                results = list(pool.map(self.resolver.resolve, missing))
+            now = self.clock()
+            with self._lock:
+                for d, ok in zip(missing, results):
+                    out[d] = ok
+                    if ok is not None:
+                        self._entries[d] = (ok, now + (self.ttl if ok else self.negative_ttl))
+        return out
+
+    def lookup(self, domain: str):
+        return self.lookup_many([domain])[domain]
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_mx_cache() -> MXCache:
+    """进程内共享的 MX 缓存（使用 DnsResolver）"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = MXCache()
+        return _default_cache
+
+
+# —— 校验 ——
+
+class Report:
+    def __init__(self):
+        self.total = 0
+        self.valid = 0
+        self.rejected = {r: 0 for r in REASONS}
+        self.samples = {r: [] for r in REASONS}
+        self.suggestions = {}
+        self.mx_unknown = 0
+
+    def reject(self, reason: str, email: str):
+        self.rejected[reason] += 1
+        if len(self.samples[reason]) < SAMPLES_PER_REASON:
+            self.samples[reason].append(email)
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "valid": self.valid,
+            "invalid": self.total - self.valid,
+            "rejected": dict(self.rejected),
+            "samples": {k: v for k, v in self.samples.items() if v},
+            "suggestions": dict(self.suggestions),
+            "mx_unknown_domains": self.mx_unknown,
+        }
+
+
+class Validator:
+    """validate(emails) -> (有效地址列表, Report)；iter_valid(emails, report) 惰性过滤（用于流式来源）"""
+
+    def __init__(self, reject_roles: bool = False, check_mx: bool = False, mx_cache=None, chunk_size: int = 50000):
+        self.reject_roles = reject_roles
+        self.check_mx = check_mx
+        self.mx_cache = mx_cache if mx_cache is not None else (default_mx_cache() if check_mx else None)
+        self.chunk_size = chunk_size
+        # 域名 -> None（通过）或拒绝原因；在同一个 Validator 内跨批次复用
+        self._domain_verdict = {}
+
+    def _judge_domains(self, domains, report: Report):
+        new = [d for d in domains if d not in self._domain_verdict]
+        if not new:
+            return
+        pending_mx = []
+        for d in new:
+            if not domain_syntax_ok(d):
+                self._domain_verdict[d] = SYNTAX
+                continue
+            good = suggest_domain(d)
+            if good is not None:
+                self._domain_verdict[d] = TYPO
+                report.suggestions[d] = good
+                continue
+            self._domain_verdict[d] = None
+            pending_mx.append(d)
+        if self.check_mx and self.mx_cache is not None and pending_mx:
+            for d, ok in self.mx_cache.lookup_many(pending_mx).items():
+                if ok is False:
+                    self._domain_verdict[d] = NO_MX
+                elif ok is None:
+                    report.mx_unknown += 1
+
+    def _check_chunk(self, chunk, report: Report):
+        parsed = []
+        domains = set()
+        for raw in chunk:
+            e = normalize(raw)
+            local, sep, domain = e.rpartition("@")
+            parsed.append((raw, e, local, domain if sep else ""))
+            if sep:
+                domains.add(domain)
+        self._judge_domains(domains, report)
+        verdict = self._domain_verdict
+        local_ok = _LOCAL_RE.fullmatch
+        roles = ROLE_ACCOUNTS if self.reject_roles else ()
+        for raw, e, local, domain in parsed:
+            report.total += 1
+            if not domain or not local or len(local) > MAX_LOCAL or len(e) > MAX_ADDRESS or not local_ok(local):
+                report.reject(SYNTAX, raw)
+                continue
+            reason = verdict.get(domain)
+            if reason is not None:
+                report.reject(reason, raw)
+                continue
+            if local in roles:
+                report.reject(ROLE, raw)
+                continue
+            report.valid += 1
+            yield e
+
+    def iter_valid(self, emails, report: Report):
+        chunk = []
+        for e in emails:
+            chunk.append(e)
+            if len(chunk) >= self.chunk_size:
+                yield from self._check_chunk(chunk, report)
+                chunk = []
+        if chunk:
+            yield from self._check_chunk(chunk, report)
+
+    def validate(self, emails):
+        report = Report()
+        return list(self.iter_valid(emails, report)), report